@@ -0,0 +1,202 @@
+"""Offline benchmark of edupage_bridge_v2.py on a recorded cassette.
+
+Record one run against edupage.org first, with an empty cache directory so
+the login is part of the cassette:
+
+    EDUPAGE_CACHE_DIR=$(mktemp -d) python edupage_bridge_v2.py USER PASS SUBDOMAIN 2026-10-14 --record week.json
+
+Then replay it as often as needed, without network or credentials:
+
+    python edupage_bench.py week.json --repeat 5 --latency-ms 80
+
+Every repetition runs the same fetch main() does and reports wall time, CPU
+time (of the thread running the stage) and peak traced memory per stage.
+Peak memory is per process: with --concurrent-sections,
+--parallel-children or --hedge the stages running side by side share it. Memory
+tracing slows Python code down, so compare benchmark runs with each other,
+not with timings from production.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+
+def make_profiling_metrics(bridge):
+    class ProfilingMetrics(bridge.BridgeMetrics):
+        """BridgeMetrics that also records CPU time and memory peaks per stage."""
+
+        def __init__(self):
+            super().__init__()
+            self.profile = {}
+            self._open = []
+            self._memory_lock = threading.Lock()
+
+        def _fold_peak(self):
+            # Called with _memory_lock held: credit the peak since the last
+            # reset to every open stage before it is reset or read
+            peak = tracemalloc.get_traced_memory()[1]
+            for frame in self._open:
+                frame["peak"] = max(frame["peak"], peak)
+
+        def span(self, name):
+            return self._profiled(name, super().span(name))
+
+        def _profiled(self, name, inner):
+            metrics = self
+
+            class Profiled:
+                def __enter__(self):
+                    with metrics._memory_lock:
+                        metrics._fold_peak()
+                        tracemalloc.reset_peak()
+                        current = tracemalloc.get_traced_memory()[0]
+                        self.frame = {"start": current, "peak": current}
+                        metrics._open.append(self.frame)
+                    self.cpu = time.thread_time()
+                    return inner.__enter__()
+
+                def __exit__(self, *exc):
+                    cpu = time.thread_time() - self.cpu
+                    with metrics._memory_lock:
+                        metrics._fold_peak()
+                        metrics._open.remove(self.frame)
+                        entry = metrics.profile.setdefault(name, {"cpu": 0.0, "peak": 0})
+                        entry["cpu"] += cpu
+                        entry["peak"] = max(entry["peak"], self.frame["peak"] - self.frame["start"])
+                    return inner.__exit__(*exc)
+
+            return Profiled()
+
+    return ProfilingMetrics
+
+
+def reset_bridge_state(bridge):
+    """Forget sessions and caches so the next run starts cold."""
+    bridge._sessions.clear()
+    bridge._timetable_indexes.clear()
+    for value in vars(bridge).values():
+        if isinstance(value, bridge.BridgeCache):
+            value.clear()
+
+
+def run_once(bridge, ProfilingMetrics, args, target_date):
+    bridge._replay = bridge.Cassette.load(args.cassette)
+    metrics = ProfilingMetrics()
+    tracemalloc.reset_peak()
+    start_mem = tracemalloc.get_traced_memory()[0]
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = bridge.fetch_for_account("bench", "bench", args.subdomain, target_date, metrics, args.sections)
+    run = {
+        "wall": time.perf_counter() - wall,
+        "cpu": time.process_time() - cpu,
+        "peak": tracemalloc.get_traced_memory()[1] - start_mem,
+        "requests": sum(e["count"] for e in metrics.requests.values()),
+        "bytes": sum(e["bytes"] for e in metrics.requests.values()),
+        "students": len(result.get("students", [])),
+    }
+    stages = {
+        name: {
+            "calls": entry["count"],
+            "wall": entry["seconds"],
+            "cpu": metrics.profile.get(name, {}).get("cpu", 0.0),
+            "peak": metrics.profile.get(name, {}).get("peak", 0),
+        }
+        for name, entry in metrics.spans.items()
+    }
+    return run, stages
+
+
+def summarize(runs):
+    """Mean wall/CPU time and calls, maximum peak memory over the repetitions."""
+    names = sorted({name for _, stages in runs for name in stages})
+    summary = {"run": {}, "stages": {}}
+    for key in ("wall", "cpu", "requests", "bytes", "students"):
+        summary["run"][key] = statistics.mean(run[key] for run, _ in runs)
+    summary["run"]["peak"] = max(run["peak"] for run, _ in runs)
+    for name in names:
+        rows = [stages[name] for _, stages in runs if name in stages]
+        summary["stages"][name] = {
+            "calls": statistics.mean(row["calls"] for row in rows),
+            "wall": statistics.mean(row["wall"] for row in rows),
+            "cpu": statistics.mean(row["cpu"] for row in rows),
+            "peak": max(row["peak"] for row in rows),
+        }
+    return summary
+
+
+def print_table(summary, repeat):
+    run = summary["run"]
+    print(f"{repeat} run(s), {run['students']:.0f} student(s), {run['requests']:.0f} requests, {run['bytes'] / 1024:.0f} KiB per run")
+    print(f"{'stage':<28}{'calls':>7}{'wall ms':>10}{'cpu ms':>10}{'peak KiB':>10}")
+    rows = [("run", {"calls": 1, **run})] + list(summary["stages"].items())
+    for name, row in rows:
+        print(f"{name:<28}{row['calls']:>7.1f}{row['wall'] * 1000:>10.1f}{row['cpu'] * 1000:>10.1f}{row['peak'] / 1024:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a cassette through the Edupage bridge and time each stage")
+    parser.add_argument("cassette", help="Cassette written with edupage_bridge_v2.py --record")
+    parser.add_argument("--date", help="Day of the week to fetch (default: the recorded one)")
+    parser.add_argument("--subdomain", help="Login subdomain (default: the recorded one)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every replayed response")
+    parser.add_argument("--warm", action="store_true", help="Keep sessions and caches between repetitions")
+    parser.add_argument("--parallel-children", action="store_true")
+    parser.add_argument("--concurrent-sections", action="store_true")
+    parser.add_argument("--hedge", action="store_true", help="Race the timetable strategies while probing")
+    parser.add_argument("--sections", help="Comma separated sections to fetch (default: all)")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    # The bridge reads these at import time
+    cache_dir = tempfile.mkdtemp(prefix="edupage-bench-")
+    os.environ["EDUPAGE_CACHE_DIR"] = cache_dir
+    os.environ["EDUPAGE_REPLAY"] = args.cassette
+    os.environ["EDUPAGE_REPLAY_LATENCY_MS"] = str(args.latency_ms)
+    os.environ.setdefault("EDUPAGE_LOG_LEVEL", "ERROR")
+    os.environ.pop("EDUPAGE_RECORD", None)
+    os.environ.pop("EDUPAGE_CAPTURE_DIR", None)
+    os.environ.pop("EDUPAGE_METRICS_FILE", None)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import edupage_bridge_v2 as bridge
+
+    bridge.PARALLEL_CHILDREN = args.parallel_children
+    bridge.CONCURRENT_SECTIONS = args.concurrent_sections
+    bridge.HEDGE = args.hedge
+    meta = bridge.Cassette.load(args.cassette).meta
+    args.subdomain = args.subdomain or meta.get("subdomain") or "login1"
+    target_date = bridge.parse_target_date(args.date or meta.get("date"))
+    args.sections = bridge.parse_sections(args.sections)
+    ProfilingMetrics = make_profiling_metrics(bridge)
+
+    tracemalloc.start()
+    runs = []
+    try:
+        for _ in range(args.repeat):
+            if not args.warm:
+                reset_bridge_state(bridge)
+            runs.append(run_once(bridge, ProfilingMetrics, args, target_date))
+    except bridge.BridgeError as e:
+        print(json.dumps(e.to_dict()))
+        sys.exit(1)
+    finally:
+        tracemalloc.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    summary = summarize(runs)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_table(summary, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,31 @@
 import sys
+import os
 import json
+import time
+import hashlib
+import hmac
 import datetime
+import threading
+import codecs
+import argparse
+import base64
+import bisect
+import collections
+import contextlib
+import gzip
+import html
+import itertools
+import logging
+import secrets
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 from edupage_api import Edupage
 from edupage_api.timetables import Timetables
 from edupage_api.utils import RequestUtil
@@ -9,16 +34,618 @@ from edupage_api.exceptions import BadCredentialsException, CaptchaException
 from edupage_api.login import Login, TwoFactorLogin
 import re
 
+# -----------------
+# LOGGING
+# -----------------
+# Silent in healthy runs: only warnings and errors are written unless
+# --log-level or EDUPAGE_LOG_LEVEL asks for more. Records go to stderr as
+# "time LEVEL event key=value ...", stdout stays reserved for the JSON result.
+LOG_LEVEL = os.environ.get("EDUPAGE_LOG_LEVEL", "WARNING")
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')} {record.levelname} {record.getMessage()}"
+        for key, value in getattr(record, "fields", {}).items():
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+            else:
+                value = str(value)
+            if not value or any(c.isspace() or c in '"=' for c in value):
+                value = json.dumps(value, ensure_ascii=False)
+            line += f" {key}={value}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class StructuredLogger:
+    """Logger taking an event name plus key=value fields.
+
+    Field values are passed through untouched and only rendered when the
+    record is emitted, so a disabled level costs one level check.
+    """
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def _log(self, level, event, exc_info, fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event, exc_info=False, **fields):
+        self._log(logging.DEBUG, event, exc_info, fields)
+
+    def info(self, event, exc_info=False, **fields):
+        self._log(logging.INFO, event, exc_info, fields)
+
+    def warning(self, event, exc_info=False, **fields):
+        self._log(logging.WARNING, event, exc_info, fields)
+
+    def error(self, event, exc_info=False, **fields):
+        self._log(logging.ERROR, event, exc_info, fields)
+
+
+def configure_logging(level):
+    logger = logging.getLogger("edupage_bridge")
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(KeyValueFormatter())
+        logger.addHandler(handler)
+        logger.propagate = False
+    try:
+        logger.setLevel(str(level).upper())
+    except ValueError:
+        logger.setLevel(logging.WARNING)
+
+
+log = StructuredLogger("edupage_bridge")
+configure_logging(LOG_LEVEL)
+
+# -----------------
+# METRICS
+# -----------------
+# Timing spans and upstream request counters of one run. fetch_for_account
+# attaches a fresh BridgeMetrics to the Edupage it works with (cloned
+# sessions share it). --metrics adds it to the JSON output as "_metrics",
+# --metrics-file or EDUPAGE_METRICS_FILE writes it as Prometheus text.
+METRICS_FILE = os.environ.get("EDUPAGE_METRICS_FILE")
+
+
+class BridgeMetrics:
+    """Per-stage wall time and per-endpoint request/byte counts, thread-safe."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            entry = self.spans.setdefault(name, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+
+    def count_request(self, endpoint, nbytes, requests=1):
+        with self._lock:
+            entry = self.requests.setdefault(endpoint, {"count": 0, "bytes": 0})
+            entry["count"] += requests
+            entry["bytes"] += nbytes
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "totalSeconds": round(time.perf_counter() - self.started, 3),
+                "spans": {
+                    name: {"count": e["count"], "seconds": round(e["seconds"], 3)}
+                    for name, e in sorted(self.spans.items())
+                },
+                "requests": {endpoint: dict(e) for endpoint, e in sorted(self.requests.items())},
+            }
+
+    def to_prometheus(self):
+        data = self.to_dict()
+
+        def label(value):
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        lines = [
+            "# HELP edupage_bridge_run_seconds Wall time of the last bridge run.",
+            "# TYPE edupage_bridge_run_seconds gauge",
+            f"edupage_bridge_run_seconds {data['totalSeconds']}",
+            "# HELP edupage_bridge_stage_seconds Time spent per stage in the last run.",
+            "# TYPE edupage_bridge_stage_seconds gauge",
+        ]
+        lines += [f'edupage_bridge_stage_seconds{{stage="{label(name)}"}} {e["seconds"]}' for name, e in data["spans"].items()]
+        lines += [
+            "# HELP edupage_bridge_stage_calls Times each stage ran in the last run.",
+            "# TYPE edupage_bridge_stage_calls gauge",
+        ]
+        lines += [f'edupage_bridge_stage_calls{{stage="{label(name)}"}} {e["count"]}' for name, e in data["spans"].items()]
+        lines += [
+            "# HELP edupage_bridge_upstream_requests Upstream HTTP requests per endpoint in the last run.",
+            "# TYPE edupage_bridge_upstream_requests gauge",
+        ]
+        lines += [f'edupage_bridge_upstream_requests{{endpoint="{label(ep)}"}} {e["count"]}' for ep, e in data["requests"].items()]
+        lines += [
+            "# HELP edupage_bridge_upstream_bytes Response body bytes per endpoint in the last run.",
+            "# TYPE edupage_bridge_upstream_bytes gauge",
+        ]
+        lines += [f'edupage_bridge_upstream_bytes{{endpoint="{label(ep)}"}} {e["bytes"]}' for ep, e in data["requests"].items()]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Replace the file at path atomically, as node_exporter's textfile collector expects."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf8") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("metrics file write failed", path=path, error=e)
+
+
+def span(edupage, name):
+    """Time a stage of the run edupage belongs to, no-op if it has no metrics."""
+    metrics = getattr(edupage, "metrics", None)
+    return metrics.span(name) if metrics is not None else contextlib.nullcontext()
+
+
+def endpoint_name(url):
+    """Group request URLs by path, plus the __func of the ttviewer/regulartt RPCs."""
+    parts = urlsplit(url)
+    func = parse_qs(parts.query).get("__func")
+    return f"{parts.path}?__func={func[0]}" if func else parts.path
+
+
+def attach_metrics(edupage, metrics):
+    """Make edupage report into metrics, counting every response of its session."""
+    edupage.metrics = metrics
+    if getattr(edupage, "requests_watched", False):
+        return
+    edupage.requests_watched = True
+
+    def hook(response, *args, **kwargs):
+        current = getattr(edupage, "metrics", None)
+        if current is not None:
+            # Streamed bodies are not read yet, their readers add the bytes
+            nbytes = 0 if kwargs.get("stream") else len(response.content)
+            current.count_request(endpoint_name(response.url), nbytes)
+        return response
+
+    edupage.session.hooks["response"].append(hook)
+
+
+# -----------------
+# CAPTURE STORE
+# -----------------
+# Off by default. With --capture-dir or EDUPAGE_CAPTURE_DIR every upstream
+# response (login, gcall, ttviewer, regulartt, znamky, ...) is kept as
+# <dir>/<endpoint>/<time>_<child>.gz for checking the parsers against real
+# pages. Bodies are cut at EDUPAGE_CAPTURE_MAX_BYTES and only the newest
+# EDUPAGE_CAPTURE_KEEP files per endpoint survive. Captures hold personal
+# data, so files and folders are private to the user.
+CAPTURE_DIR = os.environ.get("EDUPAGE_CAPTURE_DIR")
+CAPTURE_MAX_BYTES = int(os.environ.get("EDUPAGE_CAPTURE_MAX_BYTES", 4 * 1024 * 1024))
+CAPTURE_KEEP = int(os.environ.get("EDUPAGE_CAPTURE_KEEP", 20))
+
+
+class CaptureFile:
+    """Gzip writer for one capture, drops everything past the size cap."""
+
+    def __init__(self, store, folder, name):
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        self.store = store
+        self.folder = folder
+        self.path = os.path.join(folder, name)
+        self._tmp_path = f"{self.path}.part"
+        fd = os.open(self._tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        self._raw = os.fdopen(fd, "wb")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        self.received = 0
+
+    def write(self, chunk):
+        room = self.store.max_bytes - self.received
+        if room > 0:
+            self._gzip.write(chunk[:room])
+        self.received += len(chunk)
+
+    def close(self):
+        self._gzip.close()
+        self._raw.close()
+        os.replace(self._tmp_path, self.path)
+        if self.received > self.store.max_bytes:
+            log.debug("capture truncated", path=self.path, bytes=self.received)
+        self.store.rotate(self.folder)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CaptureStore:
+    def __init__(self, directory, max_bytes=CAPTURE_MAX_BYTES, keep=CAPTURE_KEEP):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep = max(1, keep)
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+    def open(self, endpoint, child_id=None):
+        """Start a capture of one response body, returns a CaptureFile."""
+        folder = os.path.join(self.directory, re.sub(r"[^A-Za-z0-9.]+", "_", endpoint).strip("_") or "root")
+        child = re.sub(r"[^A-Za-z0-9-]+", "_", str(child_id)) if child_id is not None else "account"
+        # The sequence number keeps names unique and ordered within one process
+        stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+        return CaptureFile(self, folder, f"{stamp}-{next(self._sequence):06d}_{child}.gz")
+
+    def save(self, endpoint, child_id, body):
+        with self.open(endpoint, child_id) as capture:
+            capture.write(body)
+
+    def rotate(self, folder):
+        with self._lock:
+            names = sorted(n for n in os.listdir(folder) if n.endswith(".gz"))
+            for name in names[:-self.keep]:
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError:
+                    pass
+
+
+_capture_store = CaptureStore(CAPTURE_DIR) if CAPTURE_DIR else None
+
+
+def open_capture(edupage, url):
+    """CaptureFile for a streamed response body, or None if capturing is off."""
+    if _capture_store is None:
+        return None
+    try:
+        return _capture_store.open(endpoint_name(url), getattr(edupage, "active_child_id", None))
+    except OSError as e:
+        log.warning("capture failed", url=url, error=e)
+        return None
+
+
+def watch_captures(edupage):
+    """Capture every response of edupage's session while capturing is on (idempotent)."""
+    if _capture_store is None or getattr(edupage, "captures_watched", False):
+        return
+    edupage.captures_watched = True
+
+    def hook(response, *args, **kwargs):
+        # Streamed bodies are not read yet, their readers capture them
+        if _capture_store is not None and not kwargs.get("stream"):
+            try:
+                _capture_store.save(endpoint_name(response.url), getattr(edupage, "active_child_id", None), response.content)
+            except OSError as e:
+                log.warning("capture failed", url=response.url, error=e)
+        return response
+
+    edupage.session.hooks["response"].append(hook)
+
+
+# -----------------
+# RECORD / REPLAY
+# -----------------
+# --record FILE (EDUPAGE_RECORD) saves every upstream exchange of a run into
+# a JSON cassette, --replay FILE (EDUPAGE_REPLAY) answers from a cassette
+# instead of edupage.org, optionally --replay-latency-ms later per response.
+# Runs can then be measured and compared offline, see edupage_bench.py.
+# Record with an empty EDUPAGE_CACHE_DIR so the login is part of the
+# cassette. Cassettes hold personal data; Set-Cookie headers are dropped and
+# request bodies are only kept as a hash, never for password forms.
+# --base-url URL (EDUPAGE_BASE_URL) sends all edupage.org requests to another
+# server instead, like edupage_mock_server.py; the original host goes along
+# in the Host header.
+REPLAY_LATENCY_MS = float(os.environ.get("EDUPAGE_REPLAY_LATENCY_MS", 0))
+BASE_URL = os.environ.get("EDUPAGE_BASE_URL", "").rstrip("/")
+# Headers describing the wire format of a body that is stored decoded
+_UNRECORDED_HEADERS = {"set-cookie", "content-encoding", "content-length", "transfer-encoding"}
+
+
+def _request_body_key(request):
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode("utf8")
+    if b"password=" in body:
+        return None
+    return hashlib.sha1(body).hexdigest()
+
+
+class Cassette:
+    """Recorded request/response exchanges, matched by method, URL and body.
+
+    Replay hands out the exchanges of a (method, URL, body) in recorded
+    order and falls back to (method, URL) when the body differs (login
+    tokens, other dates). Once a URL is used up its last answer repeats.
+    """
+
+    def __init__(self, path, exchanges=None, meta=None):
+        self.path = path
+        self.exchanges = exchanges or []
+        self.meta = meta or {}
+        self._lock = threading.Lock()
+        self._exact = collections.defaultdict(collections.deque)
+        self._loose = collections.defaultdict(collections.deque)
+        self._used = set()
+        self._last = {}
+        for i, exchange in enumerate(self.exchanges):
+            self._exact[(exchange["method"], exchange["url"], exchange["body_sha1"])].append(i)
+            self._loose[(exchange["method"], exchange["url"])].append(i)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf8") as f:
+            data = json.load(f)
+        return cls(path, data.get("exchanges"), data.get("meta"))
+
+    def save(self):
+        with self._lock:
+            data = {"version": 1, "meta": self.meta, "exchanges": list(self.exchanges)}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def record(self, request, response):
+        exchange = {
+            "method": request.method,
+            "url": request.url,
+            "body_sha1": _request_body_key(request),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in _UNRECORDED_HEADERS},
+            "body": base64.b64encode(response.content).decode("ascii"),
+        }
+        with self._lock:
+            self.exchanges.append(exchange)
+
+    def match(self, request):
+        """The exchange answering request, or None if its URL was never recorded."""
+        loose_key = (request.method, request.url)
+        exact_key = loose_key + (_request_body_key(request),)
+        with self._lock:
+            for queue in (self._exact.get(exact_key), self._loose.get(loose_key)):
+                while queue:
+                    i = queue.popleft()
+                    if i not in self._used:
+                        self._used.add(i)
+                        self._last[loose_key] = self.exchanges[i]
+                        return self.exchanges[i]
+            return self._last.get(loose_key)
+
+
+def rebased_url(url):
+    """Return (url on BASE_URL, original host), or (url, None) if it stays as is."""
+    parts = urlsplit(url)
+    host = parts.hostname or ""
+    if not BASE_URL or not (host == "edupage.org" or host.endswith(".edupage.org")):
+        return url, None
+    return BASE_URL + url[len(f"{parts.scheme}://{parts.netloc}"):], parts.netloc
+
+
+class UpstreamAdapter(HTTPAdapter):
+    """HTTPAdapter that sends edupage.org requests to BASE_URL when one is set."""
+
+    def send(self, request, **kwargs):
+        url, host = rebased_url(request.url)
+        if host is None:
+            return super().send(request, **kwargs)
+        rebased = request.copy()
+        rebased.url = url
+        rebased.headers["Host"] = host
+        response = super().send(rebased, **kwargs)
+        # Cookies, redirects and the URL checks of the login all see edupage.org
+        response.url = request.url
+        response.request = request
+        return response
+
+
+class RecordingAdapter(UpstreamAdapter):
+    """HTTPAdapter that copies every exchange into a cassette."""
+
+    def __init__(self, cassette, **kwargs):
+        self.cassette = cassette
+        super().__init__(**kwargs)
+
+    def send(self, request, stream=False, **kwargs):
+        response = super().send(request, stream=stream, **kwargs)
+        # Reads streamed bodies completely: the cassette needs the whole page
+        self.cassette.record(request, response)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answers requests from a cassette, without any network access."""
+
+    # Never worth replacing for a bigger pool, see size_connection_pool
+    _pool_maxsize = 1 << 16
+
+    def __init__(self, cassette, latency_ms=0):
+        super().__init__()
+        self.cassette = cassette
+        self.latency = latency_ms / 1000.0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        exchange = self.cassette.match(request)
+        if exchange is None:
+            raise requests.ConnectionError(f"No recorded response for {request.method} {request.url}", request=request)
+        if self.latency:
+            time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = exchange["status"]
+        response.reason = exchange.get("reason")
+        response.headers = CaseInsensitiveDict(exchange["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response._content = base64.b64decode(exchange["body"])
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
+
+
+_recording = Cassette(os.environ["EDUPAGE_RECORD"]) if os.environ.get("EDUPAGE_RECORD") else None
+_replay = Cassette.load(os.environ["EDUPAGE_REPLAY"]) if os.environ.get("EDUPAGE_REPLAY") else None
+
+
+def transport_adapter(**pool_args):
+    """The adapter upstream requests go through: replay, recording or plain HTTP."""
+    if _replay is not None:
+        return ReplayAdapter(_replay, REPLAY_LATENCY_MS)
+    if _recording is not None:
+        return RecordingAdapter(_recording, **pool_args)
+    return UpstreamAdapter(**pool_args)
+
+
+def new_edupage():
+    """Edupage whose session goes through the configured transport."""
+    edupage = Edupage()
+    if _replay is not None or _recording is not None or BASE_URL:
+        adapter = transport_adapter()
+        edupage.session.mount("https://", adapter)
+        edupage.session.mount("http://", adapter)
+    return edupage
+
+# -----------------
+# ON-DISK CACHE
+# -----------------
+# Shared by one-shot CLI runs and the --serve daemon. Lives next to the other
+# runtime state in server/data unless EDUPAGE_CACHE_DIR points elsewhere.
+CACHE_DIR = os.environ.get("EDUPAGE_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "edupage-cache"
+)
+
+
+class BridgeCache:
+    """Small JSON cache: in memory for this process, one file per key on disk."""
+
+    def __init__(self, namespace, ttl):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key_str):
+        digest = hashlib.sha1(key_str.encode("utf8")).hexdigest()
+        return os.path.join(CACHE_DIR, self.namespace, f"{digest}.json")
+
+    def get_with_age(self, key, ttl=None):
+        """Return (value, age_seconds), or (None, None) if missing or expired."""
+        key_str = json.dumps(key, default=str)
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._memory.get(key_str)
+        if entry is None:
+            try:
+                with open(self._path(key_str), encoding="utf8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None, None
+            with self._lock:
+                self._memory[key_str] = entry
+        age = time.time() - entry.get("saved_at", 0)
+        if ttl is not None and age > ttl:
+            return None, None
+        return entry.get("value"), age
+
+    def get(self, key, ttl=None):
+        return self.get_with_age(key, ttl)[0]
+
+    def set(self, key, value):
+        key_str = json.dumps(key, default=str)
+        entry = {"key": key_str, "saved_at": time.time(), "value": value}
+        with self._lock:
+            self._memory[key_str] = entry
+        path = self._path(key_str)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            # Entries can hold session cookies, keep them private
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf8") as f:
+                json.dump(entry, f, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("cache write failed", namespace=self.namespace, error=e)
+
+    def delete(self, key):
+        key_str = json.dumps(key, default=str)
+        with self._lock:
+            self._memory.pop(key_str, None)
+        try:
+            os.remove(self._path(key_str))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Drop every entry, in memory and on disk."""
+        with self._lock:
+            self._memory.clear()
+        shutil.rmtree(os.path.join(CACHE_DIR, self.namespace), ignore_errors=True)
+
+
+# -----------------
+# EMBEDDED JSON
+# -----------------
+# Edupage pages carry their data as JSON literals inside JavaScript
+# (`"vsetkyZnamky": [...]`, `.userhome({...})`, `getTTViewerData_res({...})`).
+# raw_decode parses such a value in place at an offset with the C scanner,
+# without slicing, brace counting or length caps.
+_json_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'\s*')
+
+
+def decode_js_value(text, offset):
+    """Decode the JSON value starting at `offset` (leading whitespace is skipped).
+
+    Returns (value, end offset), raises ValueError if no valid JSON starts there.
+    """
+    offset = _whitespace.match(text, offset).end()
+    return _json_decoder.raw_decode(text, offset)
+
+
+def extract_js_value(text, marker, start=0):
+    """Decode the JSON value that follows the first `marker` at or after `start`.
+
+    marker is the literal text right before the value, e.g. '"vsetkyZnamky":'
+    or '.userhome('. Returns (value, end offset), or (None, -1) if the marker
+    is missing. Raises ValueError if the value is not valid JSON.
+    """
+    pos = text.find(marker, start)
+    if pos == -1:
+        return None, -1
+    return decode_js_value(text, pos + len(marker))
+
+
 # Monkey Patch Login.login to fix parsing issues (GitHub Issue #101)
 # Monkey Patch Login.login to fix parsing issues (GitHub Issue #101)
 def fixed_login(self, username, password, subdomain="login1"):
-    print("DEBUG: Executing fixed_login monkey patch", file=sys.stderr)
+    log.debug("login", subdomain=subdomain)
     request_url = f"https://{subdomain}.edupage.org/login/?cmd=MainLogin"
     try:
         response = self.edupage.session.get(request_url)
         data = response.content.decode()
     except Exception as e:
-        print(f"DEBUG: Initial GET failed: {e}", file=sys.stderr)
+        log.warning("login page request failed", error=e)
         raise e
 
     # Robust extraction of csrftoken
@@ -37,10 +664,10 @@ def fixed_login(self, username, password, subdomain="login1"):
                 if m2:
                     csrf_token = m2.group(1)
                 else:
-                    print('DEBUG: HTML Content snippet (No CSRF):', data[:300], file=sys.stderr) 
+                    log.warning("csrf token not found on login page")
                     # raise ValueError("Could not find csrftoken") # Soft fail
     except Exception as e:
-         print(f"DEBUG: Error extracting csrftoken: {e}", file=sys.stderr)
+         log.warning("csrf token extraction failed", error=e)
          pass
 
     parameters = {
@@ -53,35 +680,29 @@ def fixed_login(self, username, password, subdomain="login1"):
     response = self.edupage.session.post(request_url, parameters)
 
     if "cap=1" in response.url or "lerr=b43b43" in response.url:
-        print(f"DEBUG: Captcha detected. URL: {response.url}", file=sys.stderr)
+        log.warning("captcha required", subdomain=subdomain)
         raise CaptchaException()
 
     if "bad=1" in response.url:
-        print(f"DEBUG: Bad Credentials detected. URL: {response.url}", file=sys.stderr)
+        log.warning("bad credentials", subdomain=subdomain)
         raise BadCredentialsException()
 
     data = response.content.decode()
     
-    # DEBUG: See what we actually got
-    print(f"DEBUG: Login Response Start: {data[:300]}...", file=sys.stderr)
-
     # Handle 'eqz:' prefix (New Edupage Format)
     if data.strip().startswith("eqz:"):
-        import base64
         try:
-            print("DEBUG: 'eqz:' prefix detected. Decoding...", file=sys.stderr)
             json_str = base64.b64decode(data.strip()[4:]).decode("utf8")
             data_json = json.loads(json_str)
             
-            # DEBUG: Print keys to understand structure
-            print(f"DEBUG: Login JSON Keys: {list(data_json.keys())}", file=sys.stderr)
+            log.debug("login data decoded", keys=list(data_json.keys()))
             
             if "gsh" in data_json:
                 self.edupage.gsh = data_json["gsh"]
-                print(f"DEBUG: Extracted GSH from JSON: {self.edupage.gsh}", file=sys.stderr)
+                log.debug("gsh from login data")
             
         except Exception as e:
-             print(f"DEBUG: Error decoding/parsing eqz data: {e}", file=sys.stderr)
+             log.warning("eqz login data not decodable", error=e)
 
     if subdomain == "login1":
         # Robust subdomain extraction
@@ -99,21 +720,14 @@ def fixed_login(self, username, password, subdomain="login1"):
     if "twofactor" not in response.url:
         # 1. Try Standard Library Parsing first
         try:
-            print("DEBUG: Attempting standard parse_login_data...", file=sys.stderr)
-            if "var pdata =" in data:
-                 print("DEBUG: 'var pdata =' found in response.", file=sys.stderr)
-            else:
-                 print("DEBUG: 'var pdata =' NOT found in response.", file=sys.stderr)
-
+            log.debug("parsing login data", has_pdata="var pdata =" in data)
             self._Login__parse_login_data(data)
-            print("DEBUG: Standard parsing completed.", file=sys.stderr)
         except Exception as e:
-            print(f"DEBUG: Standard parse_login_data failed: {e}", file=sys.stderr)
+            log.debug("standard login data parse failed", error=e)
             # Find children profile regardless of parse success/failure since we have HTML
             # Proceed to fallbacks
 
         # Parse Children
-        print("DEBUG: parsing children profiles...", file=sys.stderr)
         children = []
         try:
             # Method 1: Regex over the HTML (edubarProfileChildBtn)
@@ -126,19 +740,18 @@ def fixed_login(self, username, password, subdomain="login1"):
                     children.append({"id": cid, "name": cname.strip()})
                     seen_ids.add(cid)
                     
-            print(f"DEBUG: Found children: {children}", file=sys.stderr)
+            log.debug("children found", count=len(children))
         except Exception as e:
-            print(f"DEBUG: Error parsing children: {e}", file=sys.stderr)
+            log.warning("children parse failed", error=e)
 
         self.edupage.children = children
         # Force visit dashboard to ensure cookies/gsh are fresh if manual extraction happened
         self.edupage.session.get(f"https://{subdomain}.edupage.org/dashboard")
-        print(f"DEBUG: Session Cookies after login: {self.edupage.session.cookies.get_dict()}", file=sys.stderr)
 
         if hasattr(self.edupage, "gsh") and self.edupage.gsh:
-             print(f"DEBUG: GSH successfully set to: {self.edupage.gsh}", file=sys.stderr)
+             log.debug("gsh set by standard parser")
         else:
-             print("DEBUG: GSH not set by standard parser. Attempting manual extraction...", file=sys.stderr)
+             log.debug("gsh not set by standard parser, extracting manually")
              
              # Fallback extraction logic
              def find_gsh(content):
@@ -163,7 +776,7 @@ def fixed_login(self, username, password, subdomain="login1"):
              found = find_gsh(data)
              if found:
                  self.edupage.gsh = found
-                 print(f"DEBUG: Extracted GSH manually: {self.edupage.gsh}", file=sys.stderr)
+                 log.debug("gsh extracted from login page")
              else:
                  # Check other URLs
                  try:
@@ -173,13 +786,13 @@ def fixed_login(self, username, password, subdomain="login1"):
                          f"https://{self.edupage.subdomain}.edupage.org/"
                      ]
                      for url in urls_to_try:
-                         print(f"DEBUG: Fetching {url} for GSH...", file=sys.stderr)
+                         log.debug("fetching page for gsh", url=url)
                          resp = self.edupage.session.get(url)
                          dash_data = resp.content.decode()
                          found = find_gsh(dash_data)
                          if found:
                             self.edupage.gsh = found
-                            print(f"DEBUG: Extracted GSH from {url}: {self.edupage.gsh}", file=sys.stderr)
+                            log.debug("gsh extracted", url=url)
                             # Also parse children from dashboard if not found yet
                             if not self.edupage.children:
                                 child_pattern = re.compile(r'class="[^"]*edubarProfileChildBtn[^"]*"[^>]*data-sid="([^"]+)"[^>]*>.*?<span class="userName">([^<]+)</span>', re.DOTALL)
@@ -189,49 +802,23 @@ def fixed_login(self, username, password, subdomain="login1"):
                                          self.edupage.children.append({"id": cid, "name": cname.strip()})
                             break
                  except Exception as e:
-                     print(f"DEBUG: Error during fallback fetches: {e}", file=sys.stderr)
+                     log.warning("gsh fallback fetches failed", error=e)
         
         # Final Check
         if not hasattr(self.edupage, "gsh") or not self.edupage.gsh:
-            print("DEBUG: CRITICAL - GSH could not be found. Requests will likely fail.", file=sys.stderr)
+            log.error("gsh not found, requests will likely fail")
             # Defaulting to 00000000 is usually futile, but keeps 'hasattr' happy.
             self.edupage.gsh = "00000000"
 
         # ---------------------------
         # TIMELINE PARSING (UserHome)
         # ---------------------------
-        print("DEBUG: parsing timeline/userhome data...", file=sys.stderr)
-        try:
-            # Regex to find .userhome({ ... });
-            # We look for .userhome( followed by { and capturing until the end );
-            # This is tricky with nested braces, but usually the structure is simple enough.
-            # Let's try matching the start and finding the matching brace or using a greedy match if it's the last script
-            
-            # Pattern: $j('#id').userhome({ ... });
-            # We focus on capturing the JSON object inside userhome( ... )
-            
-            timeline_match = re.search(r'\.userhome\(\s*(\{.*?\})\s*\);', data, re.DOTALL)
-            if timeline_match:
-                json_str = timeline_match.group(1)
-                # Cleanup potential JS artifacts if any (unlikely in pure JSON arg)
-                try:
-                    timeline_data = json.loads(json_str)
-                    self.edupage.timeline_data = timeline_data.get("items", [])
-                    print(f"DEBUG: Extracted {len(self.edupage.timeline_data)} timeline items.", file=sys.stderr)
-                except json.JSONDecodeError as je:
-                    print(f"DEBUG: JSON parse error for userhome: {je}", file=sys.stderr)
-            else:
-                print("DEBUG: .userhome call not found in HTML.", file=sys.stderr)
-                self.edupage.timeline_data = []
-                
-        except Exception as e:
-            print(f"DEBUG: Error parsing timeline: {e}", file=sys.stderr)
-            self.edupage.timeline_data = []
-            
+        parse_timeline(self.edupage, data)
+
         return
 
     # 2FA Handling
-    print("DEBUG: 2FA Redirect detected...", file=sys.stderr)
+    log.debug("two-factor redirect")
     request_url = f"https://{self.edupage.subdomain}.edupage.org/login/twofactor?sn=1"
     two_factor_response = self.edupage.session.get(request_url)
     data = two_factor_response.content.decode()
@@ -261,478 +848,664 @@ def fixed_login(self, username, password, subdomain="login1"):
             authentication_endpoint = m.group(1) if m else ""
             
     except Exception as e:
-        print(f"DEBUG: Error extracting 2FA tokens: {e}", file=sys.stderr)
+        log.warning("two-factor token extraction failed", error=e)
 
     return TwoFactorLogin(
         authentication_endpoint, authentication_token, csrf_token, self.edupage
     )
 
+def parse_timeline(edupage, data):
+    """Extract the .userhome({...}) timeline items from a dashboard/login page."""
+    try:
+        # Pattern: $j('#id').userhome({ ... });
+        try:
+            timeline_data, _ = extract_js_value(data, '.userhome(')
+        except ValueError as je:
+            log.warning("userhome data not decodable", error=je)
+            timeline_data = None
+        if isinstance(timeline_data, dict):
+            edupage.timeline_data = timeline_data.get("items", [])
+            log.debug("timeline parsed", items=len(edupage.timeline_data))
+        else:
+            log.debug("userhome call not found")
+            edupage.timeline_data = []
+
+    except Exception as e:
+        log.warning("timeline parse failed", error=e)
+        edupage.timeline_data = []
+
+
 # Apply Patch
-print("DEBUG: Applying monkey patch to Login.login", file=sys.stderr)
 Login.login = fixed_login
 
 # -----------------
 # START TIMETABLE PATCH
 # -----------------
 from edupage_api.timetables import Timetables
-import requests
 
-def fixed_get_date_plan(self, date):
-    request_url = f"https://{self.edupage.subdomain}.edupage.org/timetable/server/ttviewer.js?__func=ttviewer_getDatePlan"
-    today_date = datetime.date.today()
-    
-# Clean up old implementation completely
-def fixed_get_date_plan(self, date):
-    print(f"DEBUG: fixed_get_date_plan called for {date}", file=sys.stderr)
-    
-    # 1. Prepare shared data
-    gsh = getattr(self.edupage, "gsh", "00000000")
-    active_child = getattr(self.edupage, 'active_child_id', None)
-    
-    # Refresh logic omitted for brevity (eb.php check)
+def fetch_gpid(edupage, gsh):
+    """Read gpid (and a fresher gsh) from the eb.php timetable page."""
     gpid = None
     try:
-        csrf_url = f"https://{self.edupage.subdomain}.edupage.org/dashboard/eb.php?mode=ttday"
-        csrf_resp = self.edupage.session.get(csrf_url)
+        csrf_url = f"https://{edupage.subdomain}.edupage.org/dashboard/eb.php?mode=ttday"
+        csrf_resp = edupage.session.get(csrf_url)
         if "gpid=" in csrf_resp.text:
             gpid = csrf_resp.text.split("gpid=")[1].split("&")[0]
             if "gsh=" in csrf_resp.text:
                 gsh = csrf_resp.text.split("gsh=")[1].split('"')[0]
     except:
         pass
-    
-    # Strategy 1: GCall
+    return gpid, gsh
+
+
+def gcall_load_data(edupage, gpid, gsh, date_from, date_to):
+    """POST a gcall loadData for the active child and return its data dict (with "dates")."""
+    active_child = getattr(edupage, 'active_child_id', None)
     try:
-        if gpid:
-            # Try plain active_child first? No, Ziak format for gcall.
-            child_num = str(active_child).lstrip('-') if active_child else "0"
-            user_id_param = f"Ziak-{child_num}" if active_child else self.edupage.get_user_id()
-            
-            gcall_data = {
-                "gpid": str(int(gpid) + 1),
-                "gsh": gsh,
-                "action": "loadData",
-                "user": user_id_param,
-                "changes": "{}",
-                "date": date.strftime("%Y-%m-%d"),
-                "dateto": date.strftime("%Y-%m-%d"),
-                "_LJSL": "4096",
-            }
-            url = f"https://{self.edupage.subdomain}.edupage.org/gcall"
-            resp = self.edupage.session.post(url, data=RequestUtil.encode_form_data(gcall_data), headers={"Content-Type": "application/x-www-form-urlencoded"})
-            
-            if "Insuficient privileg" not in resp.text and ('"r":' in resp.text or '",[' in resp.text):
-                # Try parsing
-                if '",[' in resp.text:
-                     json_str = resp.text.split('",[', 1)[1].rsplit(']', 1)[0]
-                     json_str = '[' + json_str + ']'
-                     data = json.loads(json_str) 
-                     if data.get("dates") and data.get("dates").get(date.strftime("%Y-%m-%d")):
-                         print("DEBUG: GCall success!", file=sys.stderr)
-                         return data.get("dates").get(date.strftime("%Y-%m-%d")).get("plan")
-            else:
-                print(f"DEBUG: GCall rejected. Resp: {resp.text[:150]}", file=sys.stderr)
-                
+        # Try plain active_child first? No, Ziak format for gcall.
+        child_num = str(active_child).lstrip('-') if active_child else "0"
+        user_id_param = f"Ziak-{child_num}" if active_child else edupage.get_user_id()
+
+        gcall_data = {
+            "gpid": str(int(gpid) + 1),
+            "gsh": gsh,
+            "action": "loadData",
+            "user": user_id_param,
+            "changes": "{}",
+            "date": date_from.strftime("%Y-%m-%d"),
+            "dateto": date_to.strftime("%Y-%m-%d"),
+            "_LJSL": "4096",
+        }
+        url = f"https://{edupage.subdomain}.edupage.org/gcall"
+        resp = edupage.session.post(url, data=RequestUtil.encode_form_data(gcall_data), headers={"Content-Type": "application/x-www-form-urlencoded"})
+
+        # The reply calls loadData_res("<user id>",{"dates": {...}},[...])
+        if "Insuficient privileg" not in resp.text:
+            data, _ = extract_js_value(resp.text, f'"{user_id_param}",')
+            if data is None and active_child:
+                # Answered for the account instead of the child
+                data, _ = extract_js_value(resp.text, f'"{edupage.get_user_id()}",')
+            if isinstance(data, dict) and "dates" in data:
+                return data
+        log.debug("gcall rejected", status=resp.status_code)
+
     except Exception as e:
-        print(f"DEBUG: GCall attempt failed: {e}", file=sys.stderr)
+        log.warning("gcall failed", error=e)
+    return None
+
+
+def hedged_date_plan(self, date, gsh):
+    """Race gcall against ttviewer/regulartt for one date, see HEDGE."""
+    probe_key = strategy_probe_key(self.edupage)
+    pool = ThreadPoolExecutor(max_workers=2)
+    futures = [
+        pool.submit(lambda: gcall_date_plan(self, date, gsh)[:2]),
+        pool.submit(ttviewer_date_plan, self, date, gsh),
+    ]
+    # Don't wait for the losers
+    pool.shutdown(wait=False)
+
+    def outcome(future):
+        try:
+            return future.result()
+        except Exception:
+            log.warning("hedged timetable strategy failed", exc_info=True, date=date)
+            return None, None
+
+    fallback = (None, None)
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            plan, winner = outcome(future)
+            if plan is None or winner is None:
+                continue
+            if isinstance(plan, dict) and "_raw_ttviewer" in plan:
+                # Only what the strategies found when nothing better arrives
+                fallback = (plan, winner)
+                continue
+            log.debug("hedged timetable winner", date=date, **winner)
+            if winner["strategy"] == "ttviewer" and futures[0] in pending:
+                # gcall is still running: remember ttviewer here, before
+                # gcall can finish, so a gcall that works replaces it and
+                # never the other way round. None keeps fixed_get_date_plan
+                # from writing the record again.
+                log.debug("remembering timetable strategy", **winner)
+                _probe_cache.set(probe_key, winner)
+
+                def settle(gcall_future):
+                    _, gcall_winner = outcome(gcall_future)
+                    if gcall_winner:
+                        log.debug("remembering timetable strategy", **gcall_winner)
+                        _probe_cache.set(probe_key, gcall_winner)
+                futures[0].add_done_callback(settle)
+                return plan, None
+            return plan, winner
+    return fallback
+
+
+def fixed_get_week_plan(self, date_from, date_to):
+    """Fetch the date plans of a whole range with a single gcall loadData.
+
+    Returns {date: plan} for the days present in the response; callers fall
+    back to get_my_timetable for the days that are missing.
+    """
+    probe_key = strategy_probe_key(self.edupage)
+    probe = _probe_cache.get(probe_key) or {}
+    if probe.get("strategy") == "ttviewer":
+        # gcall is known not to work here, don't waste the round trips
+        return {}
+    with span(self.edupage, "timetable.gcall_week"):
+        gpid, gsh = fetch_gpid(self.edupage, getattr(self.edupage, "gsh", "00000000"))
+        data = gcall_load_data(self.edupage, gpid, gsh, date_from, date_to) if gpid else None
+    if not gpid:
+        return {}
+    plans = {}
+    for day_str, day_data in ((data or {}).get("dates") or {}).items():
+        if not isinstance(day_data, dict) or not day_data.get("plan"):
+            continue
+        try:
+            plans[datetime.datetime.strptime(day_str, "%Y-%m-%d").date()] = day_data["plan"]
+        except ValueError:
+            continue
+    log.debug("gcall week plan", date_from=date_from, date_to=date_to, days=len(plans))
+    if plans and not probe:
+        _probe_cache.set(probe_key, {"strategy": "gcall"})
+    return plans
 
+
+def fixed_get_date_plan(self, date):
+    request_url = f"https://{self.edupage.subdomain}.edupage.org/timetable/server/ttviewer.js?__func=ttviewer_getDatePlan"
+    today_date = datetime.date.today()
     
-    # Strategy 2 & 3: TTViewer
+# Clean up old implementation completely
+def fixed_get_date_plan(self, date):
+    log.debug("date plan", date=date)
+
+    # Go straight to the strategy that worked last time for this school and
+    # child, probe everything again only after it failed
+    probe_key = strategy_probe_key(self.edupage)
+    probe = _probe_cache.get(probe_key)
+    if probe:
+        plan, _ = run_date_plan_strategies(self, date, probe)
+        if plan is not None:
+            return plan
+        log.debug("memoized strategy failed, probing all", **probe)
+        _probe_cache.delete(probe_key)
+
+    plan, winner = run_date_plan_strategies(self, date)
+    if winner:
+        log.debug("remembering timetable strategy", **winner)
+        _probe_cache.set(probe_key, winner)
+    return plan
+
+
+PROBE_TTL = int(os.environ.get("EDUPAGE_PROBE_TTL", 30 * 24 * 3600))
+_probe_cache = BridgeCache("probe", PROBE_TTL)
+
+# Hedged probing (--hedge or EDUPAGE_HEDGE=1): while no strategy is
+# remembered, gcall and ttviewer/regulartt run side by side instead of one
+# after the other, and the first usable plan is returned. A probe then costs
+# the time of the fastest working strategy instead of the sum of the failed
+# ones. Losers are not interrupted, they finish in the background; a gcall
+# that still succeeds there replaces the remembered strategy, since its date
+# plans include the day's changes.
+HEDGE = os.environ.get("EDUPAGE_HEDGE") == "1"
+
+
+def strategy_probe_key(edupage):
+    return [edupage.subdomain, str(getattr(edupage, 'active_child_id', None))]
+
+
+def target_variants(active_child):
+    """The getTTViewerData target id formats, as (format name, value) pairs."""
     targets_to_try = []
     if active_child:
-        targets_to_try.append(active_child) # "-255"
-        targets_to_try.append(str(active_child).lstrip('-')) # "255"
-        targets_to_try.append(int(str(active_child).lstrip('-'))) # 255 (int)
-        targets_to_try.append(f"Ziak-{str(active_child).lstrip('-')}") # "Ziak-255"
-    targets_to_try.append(None)
-    
+        child_num = str(active_child).lstrip('-')
+        targets_to_try.append(("raw", active_child)) # "-255"
+        targets_to_try.append(("plain", child_num)) # "255"
+        targets_to_try.append(("int", int(child_num))) # 255 (int)
+        targets_to_try.append(("ziak", f"Ziak-{child_num}")) # "Ziak-255"
+    targets_to_try.append(("none", None))
+
     # Deduplicate (preserving order)
     seen = set()
     unique_targets = []
-    for t in targets_to_try:
+    for name, t in targets_to_try:
         t_str = str(t)
         if t_str not in seen:
-            unique_targets.append(t)
+            unique_targets.append((name, t))
             seen.add(t_str)
-    
-    # Function to try TTViewer
-    def try_ttviewer_func(func_name, targets):
-        for tid in targets:
-            try:
-                print(f"DEBUG: Trying {func_name} with target={tid} (type {type(tid)})", file=sys.stderr)
-                url = f"https://{self.edupage.subdomain}.edupage.org/timetable/server/ttviewer.js?__func={func_name}"
-                payload = {
-                    "__args": [tid, date.year, date.month, date.day],
-                    "__gsh": gsh
-                }
-                resp = self.edupage.session.post(url, json=payload)
-                
-                if resp.status_code != 200:
-                    print(f"DEBUG: {func_name} HTTP {resp.status_code}", file=sys.stderr)
-                    continue
-                    
-                if "TypeError" in resp.text:
-                    print(f"DEBUG: {func_name} TypeError in response", file=sys.stderr)
-                    continue
-                    
-                # Parsing logic
-                txt = resp.text
-                if txt.startswith("eqz:"):
-                     import base64
-                     txt = base64.b64decode(txt[4:]).decode("utf8")
-                 
-                marker = f"{func_name}_res("
-                if marker in txt:
-                     txt = txt.split(marker)[1].rsplit(")", 1)[0]
-                
-                try:
-                    data = json.loads(txt)
-                except:
-                    print(f"DEBUG: {func_name} JSON parse error", file=sys.stderr)
-                    continue
-                    
-                if "r" in data:
-                    res_data = data["r"]
-                    if func_name == "ttviewer_getTTViewerData":
-                         # This returns complex structure. 
-                         # Try regular > timetable > lessons?
-                         pass # Not implemented fully yet, just return success if not empty?
-                         # For now, if it didn't error, assume we might be able to use it?
-                         # But we need to return standardized format.
-                         # Let's skip parsing exacts for getTTViewerData unless we know format.
-                         continue 
-                    elif func_name == "ttviewer_getDatePlan":
-                         print(f"DEBUG: {func_name} success!", file=sys.stderr)
-                         return res_data
-                else:
-                    print(f"DEBUG: {func_name} 'r' missing. Keys: {list(data.keys())}", file=sys.stderr)
+    return unique_targets
 
-            except Exception as e:
-                print(f"DEBUG: {func_name} exception: {e}", file=sys.stderr)
-        return None
 
-    # Try getTTViewerData (the only function that exists on this server!)
-    for tid in unique_targets:
+def run_date_plan_strategies(self, date, probe=None):
+    """Try the timetable strategies for one date.
+
+    With a probe record ({"strategy": ..., "target": ...}) only that strategy
+    and target format are tried. Returns (plan, winning probe record).
+    """
+    # 1. Prepare shared data
+    gsh = getattr(self.edupage, "gsh", "00000000")
+    strategy = (probe or {}).get("strategy")
+    if strategy is None and HEDGE:
+        return hedged_date_plan(self, date, gsh)
+
+    # Strategy 1: GCall
+    if strategy in (None, "gcall"):
+        plan, winner, gsh = gcall_date_plan(self, date, gsh)
+        if winner or strategy == "gcall":
+            return plan, winner
+
+    return ttviewer_date_plan(self, date, gsh, probe)
+
+
+def gcall_date_plan(self, date, gsh):
+    """Strategy 1: the day's plan from a gcall loadData.
+
+    Returns (plan, winning probe record or None, the gsh to continue with).
+    """
+    # Refresh logic omitted for brevity (eb.php check)
+    with span(self.edupage, "timetable.gcall"):
+        gpid, gsh = fetch_gpid(self.edupage, gsh)
+        data = gcall_load_data(self.edupage, gpid, gsh, date, date) if gpid else None
+    if gpid:
+        day_data = ((data or {}).get("dates") or {}).get(date.strftime("%Y-%m-%d"))
+        if day_data:
+            log.debug("gcall date plan", date=date)
+            return day_data.get("plan"), {"strategy": "gcall"}, gsh
+    return None, None, gsh
+
+
+def ttviewer_date_plan(self, date, gsh, probe=None):
+    """Strategies 2 & 3: the day's lessons from the regular timetable. Returns (plan, winning probe record)."""
+    active_child = getattr(self.edupage, 'active_child_id', None)
+    strategy = (probe or {}).get("strategy")
+
+    # Strategy 2 & 3: TTViewer
+    unique_targets = target_variants(active_child)
+    if strategy == "ttviewer":
+        unique_targets = [t for t in unique_targets if t[0] == probe.get("target")]
+    
+    # Strategy 2: getTTViewerData -> regularttGetData (the only functions that exist on this server!)
+    # The school-wide regular timetable only changes a few times a year, so the
+    # resolved tt_num and the downloaded tables are cached per school.
+    raw_ttviewer = None
+    winner = {"strategy": "ttviewer", "target": (probe or {}).get("target", "none")}
+    tt_state = _ttviewer_cache.get([self.edupage.subdomain])
+    if tt_state:
+        tt_num = tt_state.get("tt_num")
+        log.debug("using cached current timetable", tt_num=tt_num)
+    else:
+        with span(self.edupage, "timetable.ttviewer"):
+            raw_ttviewer, target_format = fetch_ttviewer_data(self.edupage, gsh, date, unique_targets)
+        if raw_ttviewer is None:
+            log.warning("all timetable strategies failed", date=date)
+            return None, None
+        winner["target"] = target_format
+        tt_state = timetable_state(raw_ttviewer)
+        tt_num = tt_state and tt_state["tt_num"]
+        if tt_num:
+            _ttviewer_cache.set([self.edupage.subdomain], tt_state)
+
+    with span(self.edupage, "timetable.regulartt"):
+        tables = fetch_regulartt_tables(self.edupage, gsh, tt_num) if tt_num else None
+    if isinstance(tables, list):
+        with span(self.edupage, "timetable.expand"):
+            return lessons_from_tables(self.edupage, tables, tt_num, date), winner
+
+    if raw_ttviewer is not None:
+        # Fallback - return what we have
+        log.debug("returning raw ttviewer result")
+        return {"_raw_ttviewer": raw_ttviewer}, winner
+
+    log.warning("all timetable strategies failed", date=date)
+    return None, None
+
+
+REGULARTT_TTL = int(os.environ.get("EDUPAGE_REGULARTT_TTL", 24 * 3600))
+_ttviewer_cache = BridgeCache("ttviewer", REGULARTT_TTL)
+_regulartt_cache = BridgeCache("regulartt", REGULARTT_TTL)
+
+
+def fetch_ttviewer_data(edupage, gsh, date, targets):
+    """POST getTTViewerData with each (format, target id) variant until one answers.
+
+    Returns (result, winning format name) or (None, None).
+    """
+    for target_format, tid in targets:
         try:
-            print(f"DEBUG: Trying getTTViewerData with target={tid}", file=sys.stderr)
-            url = f"https://{self.edupage.subdomain}.edupage.org/timetable/server/ttviewer.js?__func=getTTViewerData"
+            log.debug("trying getTTViewerData", target_format=target_format)
+            url = f"https://{edupage.subdomain}.edupage.org/timetable/server/ttviewer.js?__func=getTTViewerData"
             payload = {
                 "__args": [tid, date.year, date.month, date.day],
                 "__gsh": gsh
             }
-            resp = self.edupage.session.post(url, json=payload)
-            
+            resp = edupage.session.post(url, json=payload)
+
             if resp.status_code != 200:
-                print(f"DEBUG: getTTViewerData HTTP {resp.status_code}", file=sys.stderr)
+                log.debug("getTTViewerData failed", status=resp.status_code)
                 continue
-                
+
             if "TypeError" in resp.text or "Error" in resp.text[:50]:
-                print(f"DEBUG: getTTViewerData error in response: {resp.text[:100]}", file=sys.stderr)
+                log.debug("getTTViewerData error response", response=resp.text[:100])
                 continue
-            
+
             # Parse response
             txt = resp.text
             if txt.startswith("eqz:"):
-                import base64
                 txt = base64.b64decode(txt[4:]).decode("utf8")
-            
+
             if "getTTViewerData_res(" in txt:
-                txt = txt.split("getTTViewerData_res(")[1].rsplit(")", 1)[0]
-            
-            data = json.loads(txt)
+                data, _ = extract_js_value(txt, "getTTViewerData_res(")
+            else:
+                data = json.loads(txt)
             if "r" in data:
                 result = data["r"]
-                print(f"DEBUG: getTTViewerData success! Keys: {list(result.keys())}", file=sys.stderr)
-                
-                if isinstance(result, dict):
-                    # Log defaults structure
-                    if 'defaults' in result:
-                        defaults = result['defaults']
-                        print(f"DEBUG: defaults: {str(defaults)[:300]}", file=sys.stderr)
-                    
-                    # Log ALL timetables to find current one
-                    if 'regular' in result and 'timetables' in result['regular']:
-                        timetables = result['regular']['timetables']
-                        print(f"DEBUG: ALL timetables ({len(timetables)} items):", file=sys.stderr)
-                        for tt in timetables:
-                            print(f"DEBUG:   tt_num={tt.get('tt_num')}, year={tt.get('year')}, hidden={tt.get('hidden')}, text={tt.get('text', '')[:40]}, datefrom={tt.get('datefrom')}", file=sys.stderr)
-                        
-                        # Find current/active timetable (not hidden, most recent)
-                        active_tts = [t for t in timetables if not t.get('hidden', False)]
-                        print(f"DEBUG: Active (non-hidden) timetables: {len(active_tts)}", file=sys.stderr)
-                        
-                        if active_tts:
-                            # Sort by year/datefrom to get most recent
-                            current_tt = max(active_tts, key=lambda t: (t.get('year', 0), t.get('datefrom', '')))
-                            print(f"DEBUG: Current timetable: tt_num={current_tt.get('tt_num')}, text={current_tt.get('text')}", file=sys.stderr)
-                            
-                            # Now try to fetch this specific timetable's data
-                            tt_num = current_tt.get('tt_num')
-                            if tt_num:
-                                # Try to get timetable data with this tt_num
-                                tt_url = f"https://{self.edupage.subdomain}.edupage.org/timetable/server/regulartt.js?__func=regularttGetData"
-                                tt_payload = {
-                                    "__args": [None, tt_num],
-                                    "__gsh": gsh
-                                }
-                                try:
-                                    tt_resp = self.edupage.session.post(tt_url, json=tt_payload)
-                                    if tt_resp.status_code == 200 and "Error" not in tt_resp.text[:50]:
-                                        tt_txt = tt_resp.text
-                                        if "regularttGetData_res(" in tt_txt:
-                                            tt_txt = tt_txt.split("regularttGetData_res(")[1].rsplit(")", 1)[0]
-                                        tt_data = json.loads(tt_txt)
-                                        if "r" in tt_data:
-                                            tt_result = tt_data["r"]
-                                            print(f"DEBUG: regularttGetData success! Keys: {list(tt_result.keys())}", file=sys.stderr)
-                                            
-                                            # Explore dbiAccessorRes structure
-                                            if 'dbiAccessorRes' in tt_result:
-                                                dbi = tt_result['dbiAccessorRes']
-                                                print(f"DEBUG: dbiAccessorRes keys: {list(dbi.keys())}", file=sys.stderr)
-                                                
-                                                if 'tables' in dbi:
-                                                    tables = dbi['tables']
-                                                    print(f"DEBUG: tables type: {type(tables)}", file=sys.stderr)
-                                                    
-                                                    if isinstance(tables, list):
-                                                        print(f"DEBUG: tables is list of {len(tables)} items", file=sys.stderr)
-                                                        # Each item in tables might be a table definition
-                                                        # Log ALL table IDs first
-                                                        all_table_ids = [t.get('id', '?') for t in tables if isinstance(t, dict)]
-                                                        print(f"DEBUG: All table IDs: {all_table_ids}", file=sys.stderr)
-                                                        
-                                                        # Check for terms/holidays table
-                                                        for t in tables:
-                                                            if isinstance(t, dict):
-                                                                tid = t.get('id', '')
-                                                                if tid == 'terms':
-                                                                    rows = t.get('data_rows', [])
-                                                                    print(f"DEBUG: TERMS table has {len(rows)} rows", file=sys.stderr)
-                                                                    for tr in rows[:5]:
-                                                                        print(f"DEBUG: Term: {str(tr)[:200]}", file=sys.stderr)
-                                                                elif tid == 'weeks':
-                                                                    rows = t.get('data_rows', [])
-                                                                    print(f"DEBUG: WEEKS table has {len(rows)} rows", file=sys.stderr)
-                                                                    for wr in rows[:3]:
-                                                                        print(f"DEBUG: Week: {str(wr)[:250]}", file=sys.stderr)
-                                                                elif tid == 'days':
-                                                                    rows = t.get('data_rows', [])
-                                                                    print(f"DEBUG: DAYS table has {len(rows)} rows", file=sys.stderr)
-                                                                    for dr in rows[:3]:
-                                                                        print(f"DEBUG: Day: {str(dr)[:250]}", file=sys.stderr)
-                                                        
-                                                        # Log first few items in detail
-                                                        for i, item in enumerate(tables[:5]):
-                                                            if isinstance(item, dict):
-                                                                print(f"DEBUG: tables[{i}] keys: {list(item.keys())[:10]}", file=sys.stderr)
-                                                                # Log id/name if present
-                                                                if 'id' in item:
-                                                                    print(f"DEBUG: tables[{i}]['id']: {item['id']}", file=sys.stderr)
-                                                                if 'data_rows' in item:
-                                                                    rows = item['data_rows']
-                                                                    print(f"DEBUG: tables[{i}]['data_rows'] has {len(rows)} rows", file=sys.stderr)
-                                                                    if rows:
-                                                                        print(f"DEBUG: First row: {str(rows[0])[:200]}", file=sys.stderr)
-                                                            else:
-                                                                print(f"DEBUG: tables[{i}]: {str(item)[:100]}", file=sys.stderr)
-                                                        
-                                                        # Look for cards/lessons table
-                                                        cards_table = None
-                                                        lessons_table = None
-                                                        for t in tables:
-                                                            if isinstance(t, dict):
-                                                                tid = t.get('id', '')
-                                                                if 'cards' in str(tid).lower():
-                                                                    cards_table = t
-                                                                elif 'lessons' in str(tid).lower():
-                                                                    lessons_table = t
-                                                        
-                                                        if cards_table:
-                                                            print(f"DEBUG: Found cards table! Keys: {list(cards_table.keys())}", file=sys.stderr)
-                                                            cards = cards_table.get('data_rows', [])
-                                                            print(f"DEBUG: Cards has {len(cards)} rows", file=sys.stderr)
-                                                            if cards:
-                                                                # Log first card structure
-                                                                print(f"DEBUG: Sample card: {str(cards[0])[:400]}", file=sys.stderr)
-                                                            
-                                                            # Find periods and subjects tables for lookups
-                                                            periods_lookup = {}
-                                                            subjects_lookup = {}
-                                                            classes_lookup = {}
-                                                            teachers_lookup = {}
-                                                            lessons_lookup = {}
-                                                            
-                                                            for t in tables:
-                                                                if isinstance(t, dict):
-                                                                    tid = t.get('id', '')
-                                                                    rows = t.get('data_rows', [])
-                                                                    if tid == 'periods':
-                                                                        for r in rows:
-                                                                            periods_lookup[r.get('id')] = r
-                                                                    elif tid == 'subjects':
-                                                                        for r in rows:
-                                                                            subjects_lookup[r.get('id')] = r
-                                                                    elif tid == 'classes':
-                                                                        for r in rows:
-                                                                            classes_lookup[r.get('id')] = r
-                                                                    elif tid == 'teachers':
-                                                                        for r in rows:
-                                                                            teachers_lookup[r.get('id')] = r
-                                                                    elif tid == 'lessons':
-                                                                        for r in rows:
-                                                                            lessons_lookup[r.get('id')] = r
-                                                            
-                                                            print(f"DEBUG: Lookups - periods:{len(periods_lookup)}, subjects:{len(subjects_lookup)}, classes:{len(classes_lookup)}, lessons:{len(lessons_lookup)}", file=sys.stderr)
-                                                            
-                                                            if lessons_lookup:
-                                                                sample_lesson = list(lessons_lookup.values())[0]
-                                                                print(f"DEBUG: Sample lesson: {str(sample_lesson)[:300]}", file=sys.stderr)
-                                                            
-                                                            # Determine which day index we need (0=Mon, 1=Tue, etc)
-                                                            day_index = date.weekday()  # 0=Monday
-                                                            print(f"DEBUG: Looking for day_index={day_index} (date={date})", file=sys.stderr)
-                                                            
-                                                            # Get the active child's student ID for filtering
-                                                            active_child = getattr(self.edupage, 'active_child_id', None)
-                                                            # Get child's name to extract class (e.g., "Johanna Jahn, 1b" -> "1b")
-                                                            child_name = getattr(self.edupage, 'active_child_name', None)
-                                                            child_class_name = None
-                                                            if child_name and ',' in child_name:
-                                                                child_class_name = child_name.split(',')[-1].strip().lower()
-                                                            
-                                                            # Student IDs in lessons are like '-53', child ID is like '-255'
-                                                            # Convert to string for comparison
-                                                            child_student_id = str(active_child).lstrip('-') if active_child else None
-                                                            print(f"DEBUG: Filtering lessons for student ID: {active_child}, class: {child_class_name}", file=sys.stderr)
-                                                            
-                                                            # Transform cards to lessons for this date
-                                                            result_lessons = []
-                                                            matched_count = 0
-                                                            for card in cards:
-                                                                days_str = card.get('days', '00000')
-                                                                # days_str is like '10000' for Monday, '01000' for Tuesday
-                                                                if len(days_str) > day_index and days_str[day_index] == '1':
-                                                                    # This card is for our day!
-                                                                    period_id = card.get('period')
-                                                                    lesson_id = card.get('lessonid')
-                                                                    
-                                                                    lesson = lessons_lookup.get(lesson_id, {})
-                                                                    
-                                                                    # Check if this lesson is for our child
-                                                                    student_ids = lesson.get('studentids', [])
-                                                                    class_ids = lesson.get('classids', [])
-                                                                    
-                                                                    # Filter: only include if child's ID is in studentids
-                                                                    is_child_lesson = False
-                                                                    
-                                                                    if student_ids:
-                                                                        # Check if child is in studentids
-                                                                        if str(active_child) in student_ids or f"-{child_student_id}" in student_ids:
-                                                                            is_child_lesson = True
-                                                                    elif class_ids and child_class_name:
-                                                                        # No studentids, check by class
-                                                                        for cid in class_ids:
-                                                                            cls = classes_lookup.get(cid, {})
-                                                                            cls_name = cls.get('name', '').lower()
-                                                                            if cls_name == child_class_name:
-                                                                                is_child_lesson = True
-                                                                                break
-                                                                    
-                                                                    if not is_child_lesson:
-                                                                        continue  # Skip this lesson
-                                                                    
-                                                                    matched_count += 1
-                                                                    period = periods_lookup.get(period_id, {})
-                                                                    
-                                                                    # Get subject from lesson (try both subjectid and subjectids)
-                                                                    subject_id = lesson.get('subjectid')
-                                                                    if not subject_id:
-                                                                        subject_ids_list = lesson.get('subjectids', [])
-                                                                        subject_id = subject_ids_list[0] if subject_ids_list else None
-                                                                    subject = subjects_lookup.get(subject_id, {})
-                                                                    
-                                                                    # Get class from lesson
-                                                                    class_ids = lesson.get('classids', [])
-                                                                    class_id = class_ids[0] if class_ids else None
-                                                                    cls = classes_lookup.get(class_id, {})
-                                                                    
-                                                                    # Get teacher from lesson
-                                                                    teacher_ids = lesson.get('teacherids', [])
-                                                                    teacher_id = teacher_ids[0] if teacher_ids else None
-                                                                    teacher = teachers_lookup.get(teacher_id, {})
-                                                                    
-                                                                    result_lessons.append({
-                                                                        'id': card.get('id'),
-                                                                        'period': period.get('name', period_id),
-                                                                        'starttime': period.get('starttime', ''),
-                                                                        'endtime': period.get('endtime', ''),
-                                                                        'subject': subject.get('name', lesson.get('name', 'Unknown')),
-                                                                        'subject_short': subject.get('short', ''),
-                                                                        'class': cls.get('name', ''),
-                                                                        'teacher': teacher.get('name', ''),
-                                                                        'classroom': ', '.join(card.get('classroomids', []))
-                                                                    })
-                                                            
-                                                            print(f"DEBUG: Found {len(result_lessons)} lessons for {date} (matched {matched_count} by student filter)", file=sys.stderr)
-                                                            if result_lessons:
-                                                                print(f"DEBUG: First lesson: {result_lessons[0]}", file=sys.stderr)
-                                                            
-                                                            # Return list of lessons (expected format)
-                                                            return result_lessons
-                                                        
-                                                        if lessons_table:
-                                                            print(f"DEBUG: Found lessons table! Keys: {list(lessons_table.keys())}", file=sys.stderr)
-                                                            if 'data_rows' in lessons_table:
-                                                                return {"_tables": tables, "_tt_num": tt_num, "_lessons": lessons_table.get('data_rows', [])}
-                                                        
-                                                        # Just return all tables
-                                                        print(f"DEBUG: Returning all tables data", file=sys.stderr)
-                                                        return {"_tables": tables, "_tt_num": tt_num}
-                                                    
-                                                    elif isinstance(tables, dict):
-                                                        print(f"DEBUG: tables keys: {list(tables.keys())}", file=sys.stderr)
-                                                        # ... previous dict handling
-                                    else:
-                                        print(f"DEBUG: regularttGetData failed: {tt_resp.text[:100]}", file=sys.stderr)
-                                except Exception as e:
-                                    print(f"DEBUG: regularttGetData exception: {e}", file=sys.stderr)
-                
-                # Fallback - return what we have
-                print(f"DEBUG: Returning raw TTViewer result", file=sys.stderr)
-                return {"_raw_ttviewer": result}
-                    
-        except Exception as e:
-            print(f"DEBUG: getTTViewerData exception: {e}", file=sys.stderr)
-            import traceback
-            traceback.print_exc()
+                log.debug("getTTViewerData ok", target_format=target_format)
+                return result, target_format
+
+        except Exception:
+            log.warning("getTTViewerData failed", exc_info=True, target_format=target_format)
+    return None, None
+
+
+def current_timetable(result):
+    """Pick the current (not hidden, most recent) timetable entry from a getTTViewerData result."""
+    if not isinstance(result, dict):
+        return None
+
+    if 'regular' not in result or 'timetables' not in result['regular']:
+        return None
+    timetables = result['regular']['timetables']
+    log.debug("ttviewer timetables", count=len(timetables))
+
+    # Find current/active timetable (not hidden, most recent)
+    active_tts = [t for t in timetables if not t.get('hidden', False)]
+    log.debug("active timetables", count=len(active_tts))
+    if not active_tts:
+        return None
+
+    # Sort by year/datefrom to get most recent
+    current_tt = max(active_tts, key=lambda t: (t.get('year', 0), t.get('datefrom', '')))
+    log.debug("current timetable", tt_num=current_tt.get('tt_num'), text=current_tt.get('text'))
+    return current_tt if current_tt.get('tt_num') else None
 
-    print("DEBUG: All strategies failed.", file=sys.stderr)
+
+def timetable_state(result):
+    """What _ttviewer_cache keeps of a getTTViewerData result: tt_num and the first day it is valid."""
+    current_tt = current_timetable(result)
+    if current_tt is None:
+        return None
+    return {"tt_num": current_tt['tt_num'], "datefrom": current_tt.get('datefrom')}
+
+
+def fetch_regulartt_tables(edupage, gsh, tt_num):
+    """Return the dbiAccessorRes tables of a regular timetable, downloading at most once per TTL."""
+    cache_key = [edupage.subdomain, tt_num]
+    tables = _regulartt_cache.get(cache_key)
+    if tables is not None:
+        log.debug("regulartt cache hit", tt_num=tt_num)
+        return tables
+
+    # Try to get timetable data with this tt_num
+    tt_url = f"https://{edupage.subdomain}.edupage.org/timetable/server/regulartt.js?__func=regularttGetData"
+    tt_payload = {
+        "__args": [None, tt_num],
+        "__gsh": gsh
+    }
+    try:
+        tt_resp = edupage.session.post(tt_url, json=tt_payload)
+        if tt_resp.status_code != 200 or "Error" in tt_resp.text[:50]:
+            log.warning("regularttGetData failed", response=tt_resp.text[:100])
+            return None
+        tt_txt = tt_resp.text
+        if "regularttGetData_res(" in tt_txt:
+            tt_data, _ = extract_js_value(tt_txt, "regularttGetData_res(")
+        else:
+            tt_data = json.loads(tt_txt)
+    except Exception as e:
+        log.warning("regularttGetData failed", error=e)
+        return None
+
+    if "r" not in tt_data:
+        return None
+    tt_result = tt_data["r"]
+    log.debug("regularttGetData ok", tt_num=tt_num)
+
+    dbi = tt_result.get('dbiAccessorRes') or {}
+    tables = dbi.get('tables')
+
+    if isinstance(tables, list):
+        log_tables_structure(tables)
+        _regulartt_cache.set(cache_key, tables)
+    elif isinstance(tables, dict):
+        log.warning("regularttGetData tables is not a list", keys=list(tables.keys()))
+    return tables
+
+
+def log_tables_structure(tables):
+    if log.isEnabledFor(logging.DEBUG):
+        rows = {t.get('id', '?'): len(t.get('data_rows') or []) for t in tables if isinstance(t, dict)}
+        log.debug("regulartt tables", rows=rows)
+
+
+class TimetableIndex:
+    """Lookups over the regularttGetData tables, built once per downloaded timetable.
+
+    Cards are bucketed by weekday bit and by lesson, lessons by student id and
+    by class id, so expanding a child's week only touches the child's cards.
+    """
+
+    def __init__(self, tables):
+        self.periods = {}
+        self.subjects = {}
+        self.classes = {}
+        self.teachers = {}
+        self.lessons = {}
+        self.daysdefs = {}
+        self.weeksdefs = {}
+        self.termsdefs = {}
+        cards = None
+        lessons_rows = None
+        for t in tables:
+            if not isinstance(t, dict):
+                continue
+            tid = t.get('id', '')
+            rows = t.get('data_rows', [])
+            lookup = {
+                'periods': self.periods,
+                'subjects': self.subjects,
+                'classes': self.classes,
+                'teachers': self.teachers,
+                'lessons': self.lessons,
+                'daysdefs': self.daysdefs,
+                'weeksdefs': self.weeksdefs,
+                'termsdefs': self.termsdefs,
+            }.get(tid)
+            if lookup is not None:
+                for r in rows:
+                    lookup[r.get('id')] = r
+            if 'cards' in str(tid).lower():
+                cards = rows
+            elif 'lessons' in str(tid).lower():
+                lessons_rows = rows
+        self.has_cards = cards is not None
+        self.lessons_rows = lessons_rows
+        self.cards = cards or []
+
+        # days is a weekday bit string like '10000' (Monday) or '01000' (Tuesday)
+        self.cards_by_day = {}
+        self.cards_by_lesson = {}
+        for card in self.cards:
+            self.cards_by_lesson.setdefault(card.get('lessonid'), []).append(card)
+            for day_index, bit in enumerate(card.get('days', '00000')):
+                if bit == '1':
+                    self.cards_by_day.setdefault(day_index, []).append(card)
+        self._card_order = {id(card): i for i, card in enumerate(self.cards)}
+
+        # Lessons with studentids belong to exactly those students, the others
+        # to every student of their classes
+        self.lessons_by_student = {}
+        self.lessons_by_class = {}
+        for lesson_id, lesson in self.lessons.items():
+            student_ids = lesson.get('studentids', [])
+            if student_ids:
+                for sid in student_ids:
+                    self.lessons_by_student.setdefault(sid, []).append(lesson_id)
+            else:
+                for cid in lesson.get('classids', []):
+                    self.lessons_by_class.setdefault(cid, []).append(lesson_id)
+
+        self.class_ids_by_name = {}
+        for cid, cls in self.classes.items():
+            self.class_ids_by_name.setdefault(cls.get('name', '').lower(), set()).add(cid)
+
+        self._child_weeks = {}
+
+    def child_week(self, child_id, child_class_name):
+        """Return {day_index: [cards]} for a child, resolved once per child."""
+        key = (child_id, child_class_name)
+        if key in self._child_weeks:
+            return self._child_weeks[key]
+
+        # Student IDs in lessons are like '-53', child ID is like '-255'
+        lesson_ids = set()
+        if child_id:
+            for sid in {str(child_id), f"-{str(child_id).lstrip('-')}"}:
+                lesson_ids.update(self.lessons_by_student.get(sid, []))
+        # No studentids, check by class
+        if child_class_name:
+            for cid in self.class_ids_by_name.get(child_class_name, ()):
+                lesson_ids.update(self.lessons_by_class.get(cid, []))
+
+        week = {}
+        for lesson_id in lesson_ids:
+            for card in self.cards_by_lesson.get(lesson_id, []):
+                for day_index, bit in enumerate(card.get('days', '00000')):
+                    if bit == '1':
+                        week.setdefault(day_index, []).append(card)
+        for day_cards in week.values():
+            day_cards.sort(key=lambda c: self._card_order[id(c)])
+
+        self._child_weeks[key] = week
+        return week
+
+    def lesson_row(self, card):
+        """Resolve a card into the flat lesson dict patched_get_my_timetable returns."""
+        period_id = card.get('period')
+        lesson = self.lessons.get(card.get('lessonid'), {})
+        period = self.periods.get(period_id, {})
+
+        # Get subject from lesson (try both subjectid and subjectids)
+        subject_id = lesson.get('subjectid')
+        if not subject_id:
+            subject_ids_list = lesson.get('subjectids', [])
+            subject_id = subject_ids_list[0] if subject_ids_list else None
+        subject = self.subjects.get(subject_id, {})
+
+        # Get class from lesson
+        class_ids = lesson.get('classids', [])
+        cls = self.classes.get(class_ids[0] if class_ids else None, {})
+
+        # Get teacher from lesson
+        teacher_ids = lesson.get('teacherids', [])
+        teacher = self.teachers.get(teacher_ids[0] if teacher_ids else None, {})
+
+        return {
+            'id': card.get('id'),
+            'period': period.get('name', period_id),
+            'starttime': period.get('starttime', ''),
+            'endtime': period.get('endtime', ''),
+            'subject': subject.get('name', lesson.get('name', 'Unknown')),
+            'subject_short': subject.get('short', ''),
+            'class': cls.get('name', ''),
+            'teacher': teacher.get('name', ''),
+            'classroom': ', '.join(card.get('classroomids', []))
+        }
+
+
+_timetable_indexes = {}
+_timetable_indexes_lock = threading.Lock()
+
+
+def timetable_index(subdomain, tt_num, tables):
+    """Return the TimetableIndex for these tables, building it only once."""
+    key = (subdomain, tt_num)
+    with _timetable_indexes_lock:
+        cached = _timetable_indexes.get(key)
+        if cached and cached[0] is tables:
+            return cached[1]
+        index = TimetableIndex(tables)
+        _timetable_indexes[key] = (tables, index)
+    log.debug("indexed timetable", periods=len(index.periods), subjects=len(index.subjects), classes=len(index.classes), lessons=len(index.lessons), cards=len(index.cards))
+    return index
+
+
+def timetable_indexed(subdomain):
+    """Whether the school's current regular timetable has been indexed in this process."""
+    tt_num = (_ttviewer_cache.get([subdomain]) or {}).get("tt_num")
+    with _timetable_indexes_lock:
+        return (subdomain, tt_num) in _timetable_indexes
+
+
+def child_class_name(edupage):
+    # Get child's name to extract class (e.g., "Johanna Jahn, 1b" -> "1b")
+    child_name = getattr(edupage, 'active_child_name', None)
+    if child_name and ',' in child_name:
+        return child_name.split(',')[-1].strip().lower()
     return None
 
 
+def lessons_from_tables(edupage, tables, tt_num, date):
+    """Expand the regular timetable tables into the active child's lessons for one date."""
+    index = timetable_index(edupage.subdomain, tt_num, tables)
+
+    if index.has_cards:
+        active_child = getattr(edupage, 'active_child_id', None)
+        class_name = child_class_name(edupage)
+        # Determine which day index we need (0=Mon, 1=Tue, etc)
+        day_cards = index.child_week(active_child, class_name).get(date.weekday(), [])
+        # A/B weeks and terms: only the cards running in date's week and term
+        calendar = school_calendar(edupage.subdomain, tt_num)
+        result_lessons = [index.lesson_row(card) for card in day_cards if calendar.card_runs(card, date)]
+        log.debug("lessons for date", date=date, lessons=len(result_lessons), class_name=class_name)
+        # Return list of lessons (expected format)
+        return result_lessons
+
+    if index.lessons_rows is not None:
+        log.debug("lessons table without cards")
+        return {"_tables": tables, "_tt_num": tt_num, "_lessons": index.lessons_rows}
+
+    # Just return all tables
+    log.debug("returning all tables data")
+    return {"_tables": tables, "_tt_num": tt_num}
+
+
 # Apply monkey patch to Login.login
-print("DEBUG: Applying monkey patch to Login.login", file=sys.stderr)
 Login.login = fixed_login
 
-print("DEBUG: Applying monkey patch to Timetables._Timetables__get_date_plan (Generic GCall)", file=sys.stderr)
 Timetables._Timetables__get_date_plan = fixed_get_date_plan
 
 # Also patch get_my_timetable to handle our list format
 original_get_my_timetable = Timetables.get_my_timetable
 
 def patched_get_my_timetable(self, date):
-    plan = self._Timetables__get_date_plan(date)
+    return plan_to_timetable(self, self._Timetables__get_date_plan(date))
+
+
+def plan_to_timetable(timetables, plan):
     if plan is None:
         return None
-    # If plan is already a list (from our custom parsing), return it directly
-    if isinstance(plan, list):
+    # Our ttviewer rows already carry names, return them directly. gcall plan
+    # items reference subjects, teachers and classrooms by id ("subjectid",
+    # "uniperiod", ...), the original parsing resolves them from the dbi
+    if isinstance(plan, list) and not any(isinstance(row, dict) and "uniperiod" in row for row in plan):
         return plan
-    # Otherwise use original parsing
-    return self._Timetables__parse_timetable(plan)
+    return timetables._Timetables__parse_timetable(plan)
 
 Timetables.get_my_timetable = patched_get_my_timetable
-print("DEBUG: Applying monkey patch to Timetables.get_my_timetable", file=sys.stderr)
+Timetables.get_week_plan = fixed_get_week_plan
 
 
 def serialize_lesson(lesson, date_obj):
@@ -743,11 +1516,14 @@ def serialize_lesson(lesson, date_obj):
     # Let's adapt output to be friendly:
     classroom_name = ", ".join([c.name for c in lesson.classrooms]) if hasattr(lesson, "classrooms") and lesson.classrooms else ""
     teacher_name = ", ".join([t.name for t in lesson.teachers]) if hasattr(lesson, "teachers") and lesson.teachers else ""
+    # edupage_api names them start_time/end_time, older releases start/end
+    start = getattr(lesson, "start_time", None) or getattr(lesson, "start", None)
+    end = getattr(lesson, "end_time", None) or getattr(lesson, "end", None)
 
     return {
-        "id": getattr(lesson, "id", None) or str(lesson), 
-        "startTime": lesson.start.strftime("%H:%M") if hasattr(lesson, "start") else "",
-        "endTime": lesson.end.strftime("%H:%M") if hasattr(lesson, "end") else "",
+        "id": getattr(lesson, "id", None) or f"{date_obj.isoformat()}-{lesson.period}-{lesson.subject.subject_id if lesson.subject else ''}",
+        "startTime": start.strftime("%H:%M") if start else "",
+        "endTime": end.strftime("%H:%M") if end else "",
         "date": date_obj.isoformat(),
         "subject": {"name": lesson.subject.name, "short": lesson.subject.short} if hasattr(lesson, "subject") and lesson.subject else {"name": "Unknown", "short": "?"},
         "classroom": {"name": classroom_name},
@@ -755,108 +1531,637 @@ def serialize_lesson(lesson, date_obj):
         "class": {"name": ""} # Class info not critical for "my view"
     }
 
-def fetch_child_data(edupage, child, days_to_fetch):
-    print(f"DEBUG: --- Fetching data for {child['name']} ({child['id']}) ---", file=sys.stderr)
-    
-    # Store active child ID for fixed_get_date_plan payload construction
-    edupage.active_child_id = child['id']
+# -----------------
+# SCHOOL CALENDAR
+# -----------------
+# Which days have school, built from the regular timetable: weekdays without
+# any card, days outside the dated terms of termsdefs and the holidays of an
+# optional iCalendar file (EDUPAGE_HOLIDAY_ICS, e.g. the state's school
+# holidays) have none and cost no timetable requests. The same calendar picks
+# the cards of A/B weeks: the week of a date is counted from the Monday the
+# current timetable is valid from (ttviewer "datefrom"), modulo the length of
+# the weeksdefs bit strings.
+HOLIDAY_ICS = os.environ.get("EDUPAGE_HOLIDAY_ICS")
+
+
+def _ics_date(value):
+    """(day, whether an end at this value excludes the day) of a DATE or DATE-TIME value."""
+    value = value.strip()
+    day = datetime.datetime.strptime(value[:8], "%Y%m%d").date()
+    # All-day ends are exclusive, timed ones only when they end at midnight
+    return day, "T" not in value or value[9:15] == "000000"
+
+
+def parse_ics_holidays(text):
+    """(first, last, summary) day ranges of the VEVENTs of an iCalendar text."""
+    # Long lines are folded onto continuation lines starting with a space
+    lines = re.sub(r"\r?\n[ \t]", "", text).splitlines()
+    holidays = []
+    event = None
+    for line in lines:
+        name, _, value = line.partition(":")
+        name = name.split(";")[0].upper()
+        if name == "BEGIN" and value.strip().upper() == "VEVENT":
+            event = {}
+        elif name == "END" and value.strip().upper() == "VEVENT" and event is not None:
+            if "DTSTART" in event:
+                first = event["DTSTART"][0]
+                last, exclusive = event.get("DTEND", (first, False))
+                if exclusive:
+                    last -= datetime.timedelta(days=1)
+                holidays.append((first, max(first, last), event.get("SUMMARY", "")))
+            event = None
+        elif event is not None and name in ("DTSTART", "DTEND"):
+            try:
+                event[name] = _ics_date(value)
+            except ValueError:
+                log.debug("unreadable ics date", line=line)
+        elif event is not None and name == "SUMMARY":
+            event[name] = value.strip()
+    return holidays
 
-    # Do NOT set selected_child manually if using switch_to_child, 
-    # to allow get_date_plan to see it as None and trigger "my timetable" logic on server?
-    # edupage.selected_child = child['id'] 
 
-    # Store active child info for filtering in fixed_get_date_plan
-    edupage.active_child_id = child['id']
-    edupage.active_child_name = child['name']
-    
-    # Try switching to child context on the server
-    if hasattr(edupage, 'switch_to_child'):
+_ics_holidays = {}
+
+
+def load_ics_holidays(path):
+    """Holidays of the ICS file at path, read again only when the file changes."""
+    if not path:
+        return ()
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError as e:
+        log.warning("holiday calendar unreadable", path=path, error=e)
+        return ()
+    cached = _ics_holidays.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, encoding="utf8") as f:
+            holidays = tuple(parse_ics_holidays(f.read()))
+    except (OSError, UnicodeDecodeError) as e:
+        log.warning("holiday calendar unreadable", path=path, error=e)
+        return ()
+    log.debug("holiday calendar loaded", path=path, holidays=len(holidays))
+    _ics_holidays[path] = (mtime, holidays)
+    return holidays
+
+
+def _def_date(row, *keys):
+    for key in keys:
+        try:
+            return datetime.date.fromisoformat(str(row.get(key))[:10])
+        except ValueError:
+            continue
+    return None
+
+
+class SchoolCalendar:
+    """Days without school as sorted, merged intervals, looked up by bisection."""
+
+    def __init__(self, index=None, datefrom=None, holidays=()):
+        self.weekdays = {0, 1, 2, 3, 4}
+        self.anchor = None
+        self.week_count = 1
+        self.terms = []
+        free = [(first, last, summary or "holiday") for first, last, summary in holidays]
+
+        if index is not None and index.has_cards:
+            self.weekdays = set(index.cards_by_day)
+            week_bits = [len(v) for row in index.weeksdefs.values() for v in row.get('vals') or () if v]
+            self.week_count = max(week_bits, default=1)
+            # Terms with dates: every day between and around them is free
+            for row in index.termsdefs.values():
+                first = _def_date(row, 'datefrom', 'start')
+                last = _def_date(row, 'dateto', 'end')
+                bits = next(iter(row.get('vals') or ()), '')
+                if first and last and '1' in bits:
+                    self.terms.append((first, last, bits.index('1')))
+            self.terms.sort()
+            for (_, last, _), (first, _, _) in zip(self.terms, self.terms[1:]):
+                if (first - last).days > 1:
+                    free.append((last + datetime.timedelta(days=1), first - datetime.timedelta(days=1), "term break"))
+        if datefrom:
+            try:
+                start = datetime.date.fromisoformat(str(datefrom)[:10])
+                self.anchor = start - datetime.timedelta(days=start.weekday())
+            except ValueError:
+                log.debug("unreadable timetable datefrom", datefrom=datefrom)
+
+        free.sort()
+        merged = []
+        for first, last, summary in free:
+            if merged and first <= merged[-1][1] + datetime.timedelta(days=1):
+                if last > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], last, merged[-1][2])
+            else:
+                merged.append((first, last, summary))
+        self._starts = [first for first, _, _ in merged]
+        self._intervals = merged
+
+    def holiday(self, day):
+        """Name of the free interval containing day, or None."""
+        if self.terms and not self.terms[0][0] <= day <= self.terms[-1][1]:
+            return "outside terms"
+        i = bisect.bisect_right(self._starts, day) - 1
+        if i >= 0 and day <= self._intervals[i][1]:
+            return self._intervals[i][2]
+        return None
+
+    def is_school_day(self, day):
+        return day.weekday() in self.weekdays and self.holiday(day) is None
+
+    def week_index(self, day):
+        if self.week_count <= 1 or self.anchor is None:
+            return None
+        return ((day - self.anchor).days // 7) % self.week_count
+
+    def term_index(self, day):
+        i = bisect.bisect_right(self.terms, (day, datetime.date.max, 0)) - 1
+        if i >= 0 and day <= self.terms[i][1]:
+            return self.terms[i][2]
+        return None
+
+    def card_runs(self, card, day):
+        """Whether a card takes place on day, given its weeks and terms bits."""
+        for bits, position in ((card.get('weeks'), self.week_index(day)), (card.get('terms'), self.term_index(day))):
+            if bits and position is not None and position < len(bits) and bits[position] != '1':
+                return False
+        return True
+
+
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+
+def school_calendar(subdomain, tt_num=None):
+    """SchoolCalendar of a school from its indexed timetable (if any) and the holiday ICS, no requests."""
+    tt_state = (_ttviewer_cache.get([subdomain]) or {}) if subdomain else {}
+    tt_num = tt_num or tt_state.get("tt_num")
+    holidays = load_ics_holidays(HOLIDAY_ICS)
+    with _timetable_indexes_lock:
+        index = (_timetable_indexes.get((subdomain, tt_num)) or (None, None))[1]
+    key = (subdomain, tt_num, tt_state.get("datefrom"))
+    with _calendars_lock:
+        cached = _calendars.get(key)
+        if cached and cached[0] is index and cached[1] is holidays:
+            return cached[2]
+    calendar = SchoolCalendar(index, tt_state.get("datefrom"), holidays)
+    with _calendars_lock:
+        _calendars[key] = (index, holidays, calendar)
+    return calendar
+
+
+def is_school_holiday(check_date, subdomain=None):
+    """True when there is no school on check_date (weekend, holiday, outside the terms)."""
+    d = check_date.date() if isinstance(check_date, datetime.datetime) else check_date
+    return not school_calendar(subdomain).is_school_day(d)
+
+
+# The parts of a child's data callers can ask for (--sections, "sections")
+SECTIONS = ("timetable", "homework", "grades", "messages")
+
+# Each section of a child is cached on its own with its own TTL, so a
+# refresh only goes upstream for the sections that expired. The timetable
+# section holds the week with the day's changes applied; the regular
+# timetable underneath is cached for REGULARTT_TTL. --refresh ("refresh" in
+# the daemon) skips the lookup, a TTL of 0 disables caching of a section.
+SECTION_TTLS = {
+    "timetable": int(os.environ.get("EDUPAGE_TIMETABLE_TTL", 10 * 60)),
+    "homework": int(os.environ.get("EDUPAGE_HOMEWORK_TTL", 10 * 60)),
+    "grades": int(os.environ.get("EDUPAGE_GRADES_TTL", 30 * 60)),
+    "messages": int(os.environ.get("EDUPAGE_MESSAGES_TTL", 2 * 60)),
+}
+_section_cache = BridgeCache("sections", None)
+
+
+def section_cache_key(edupage, child, name, days_to_fetch):
+    key = [edupage.subdomain, getattr(edupage, "username", None), child["id"], name]
+    if name == "timetable":
+        key.append(days_to_fetch[0].isoformat())
+    return key
+
+
+def cached_section(edupage, child, name, days_to_fetch):
+    """The cached value of a section if it is younger than its TTL, else None."""
+    return _section_cache.get(section_cache_key(edupage, child, name, days_to_fetch), SECTION_TTLS[name])
+
+# Concurrent sections (--concurrent-sections or EDUPAGE_CONCURRENT_SECTIONS=1):
+# timetable, homework, grades and messages of one child overlap on a bounded
+# pool. They all run between switch_to_child and switch_to_parent, so they see
+# the same server-side child context.
+CONCURRENT_SECTIONS = os.environ.get("EDUPAGE_CONCURRENT_SECTIONS") == "1"
+SECTION_WORKERS = int(os.environ.get("EDUPAGE_SECTION_WORKERS", 4))
+
+
+def size_connection_pool(edupage, workers):
+    """Give the session enough pooled connections for `workers` parallel requests."""
+    adapter = edupage.session.get_adapter("https://edupage.org")
+    if getattr(adapter, "_pool_maxsize", 0) >= workers:
+        return
+    edupage.session.mount("https://", transport_adapter(pool_connections=4, pool_maxsize=workers))
+
+
+def run_sections(tasks, concurrent):
+    """Run {name: callable} and return {name: result}, optionally on a thread pool."""
+    if not concurrent:
+        return {name: task() for name, task in tasks.items()}
+    with ThreadPoolExecutor(max_workers=min(SECTION_WORKERS, len(tasks))) as pool:
+        futures = {name: pool.submit(task) for name, task in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def timed(edupage, name, func):
+    """Wrap func so that each call is recorded as stage `name`."""
+    def run():
+        with span(edupage, name):
+            return func()
+    return run
+
+
+def fetch_child_data(edupage, child, days_to_fetch, sections=SECTIONS, refresh=False):
+    log.debug("fetching child", child_id=child['id'], sections=sections)
+    
+    # Store active child ID for fixed_get_date_plan payload construction
+    edupage.active_child_id = child['id']
+
+    # Do NOT set selected_child manually if using switch_to_child, 
+    # to allow get_date_plan to see it as None and trigger "my timetable" logic on server?
+    # edupage.selected_child = child['id'] 
+
+    # Store active child info for filtering in fixed_get_date_plan
+    edupage.active_child_id = child['id']
+    edupage.active_child_name = child['name']
+    
+    results = {}
+    if not refresh:
+        for name in sections:
+            value = cached_section(edupage, child, name, days_to_fetch)
+            if value is not None:
+                results[name] = value
+        if results:
+            log.debug("sections from cache", child_id=child['id'], sections=list(results))
+    stale = [name for name in sections if name not in results]
+
+    # The message feed belongs to the parent, only the other sections need
+    # the server-side child context
+    switch_child = any(name != "messages" for name in stale)
+
+    # Try switching to child context on the server
+    if switch_child and hasattr(edupage, 'switch_to_child'):
         try:
             # ID must be int for edupage-api
             cid_int = int(child['id'])
-            print(f"DEBUG: Switching context to child {cid_int}...", file=sys.stderr)
-            edupage.switch_to_child(cid_int)
-            # Update GSH if it changed? The library might update text_attributes or gsh.
-            if hasattr(edupage, "gsh"):
-                 print(f"DEBUG: GSH after switch: {edupage.gsh}", file=sys.stderr)
+            log.debug("switching to child", child_id=cid_int)
+            with span(edupage, "switch_to_child"):
+                edupage.switch_to_child(cid_int)
         except Exception as e:
-            print(f"DEBUG: switch_to_child failed: {e}", file=sys.stderr)
+            log.warning("switch_to_child failed", error=e)
 
+    if CONCURRENT_SECTIONS and len(stale) > 1:
+        # Sections plus the per-day timetable fallbacks they may start
+        size_connection_pool(edupage, SECTION_WORKERS + len(days_to_fetch))
 
-    # TIMETABLE
-    print("DEBUG: Fetching Timetable...", file=sys.stderr)
-    lessons = []
+    fetchers = {
+        "timetable": lambda: fetch_timetable(edupage, child, days_to_fetch),
+        "homework": lambda: fetch_homework(edupage),
+        "grades": lambda: fetch_grades(edupage),
+        "messages": lambda: fetch_messages(edupage),
+    }
+    # Sections that were not asked for or are still cached do no upstream work
+    fetched = run_sections(
+        {name: timed(edupage, name, fetchers[name]) for name in stale},
+        CONCURRENT_SECTIONS,
+    ) if stale else {}
+    # Failed sections come back as None and are not cached, empty ones
+    # (no homework, no messages) are. Nothing fetched after the session was
+    # thrown out can be trusted
+    if not getattr(edupage, "auth_lost", False):
+        for name, value in fetched.items():
+            if value is not None and SECTION_TTLS[name] > 0:
+                _section_cache.set(section_cache_key(edupage, child, name, days_to_fetch), value)
+    failed = [name for name in sections if name in fetched and fetched[name] is None]
+    results.update((name, [] if value is None else value) for name, value in fetched.items())
+
+    # cleanup: switch back to parent for next iteration
+    if switch_child and hasattr(edupage, 'switch_to_parent'):
+        try:
+             with span(edupage, "switch_to_parent"):
+                 edupage.switch_to_parent()
+        except Exception as e:
+             # Just log, don't fail
+             log.warning("switch_to_parent failed", error=e)
+
+    # Determine className from child name (e.g. "Johanna Jahn, 1b" -> "1b")
+    class_name = ''
+    if ',' in child['name']:
+        class_name = child['name'].split(',')[-1].strip()
     
-    # Thuringia (Thüringen) School Holidays - hardcoded since API doesn't provide them
-    # Christmas 2025/26: 22.12.2025 - 03.01.2026
-    # Winter 2026: 10.02.2026 - 14.02.2026
-    # Easter 2026: 06.04.2026 - 18.04.2026
-    # TODO: Fetch from external calendar or configure in admin
-    def is_school_holiday(check_date):
-        from datetime import date
-        holidays = [
-            (date(2025, 12, 22), date(2026, 1, 3)),   # Weihnachtsferien 2025/26
-            (date(2026, 2, 10), date(2026, 2, 14)),    # Winterferien 2026
-            (date(2026, 4, 6), date(2026, 4, 18)),     # Osterferien 2026
+    student = {
+        'studentId': child['id'],
+        'name': child['name'],  # Full name for frontend header
+        'firstName': child['name'].split()[0], # Simple parse
+        'lastName': " ".join(child['name'].split()[1:]),
+        'className': class_name or child.get('class', 'Unknown'),
+    }
+    # Only the requested sections, in SECTIONS order
+    student.update((name, results[name]) for name in sections)
+    if failed:
+        # Shown empty; the daemon keeps the last snapshot's data for these
+        student['failedSections'] = failed
+    return student
+
+
+def timetable_to_lessons(timetable, day):
+    """Convert one day's timetable (our list format or a library Timetable) to output lessons."""
+    lessons = []
+    # Handle new format (list of dicts from our fixed_get_date_plan)
+    if isinstance(timetable, list):
+        for l in timetable:
+            # Already in dict format, just add date
+            lesson_dict = {
+                "id": l.get('id', ''),
+                "startTime": l.get('starttime', ''),
+                "endTime": l.get('endtime', ''),
+                "date": day.isoformat(),
+                "subject": {"name": l.get('subject', 'Unknown'), "short": l.get('subject_short', '')},
+                "classroom": {"name": l.get('classroom', '')},
+                "teacher": {"name": l.get('teacher', '')},
+                "class": {"name": l.get('class', '')}
+            }
+            # Substitution overlay flags, see apply_substitutions
+            if 'changed' in l:
+                lesson_dict.update(changed=l['changed'], cancelled=l.get('cancelled', False), note=l.get('note', ''))
+            lessons.append(lesson_dict)
+    # Handle old format (Timetable object with .lessons)
+    elif hasattr(timetable, 'lessons'):
+        for l in timetable.lessons:
+            lessons.append(serialize_lesson(l, day))
+    # Handle dict format (raw TTViewer result)
+    elif isinstance(timetable, dict):
+        log.debug("timetable is a dict", keys=list(timetable.keys()))
+        # Try to extract lessons from various possible structures
+        pass
+    return lessons
+
+
+# -----------------
+# SUBSTITUTION OVERLAY (--timetable-overlay)
+# -----------------
+# Builds the week from the cached regular timetable and lays each day's
+# substitutions over it (getSubstViewerDayDataHtml, one small HTML delta per
+# day) instead of asking gcall/ttviewer for a full date plan per day.
+# Lessons then carry "changed", "cancelled" and the substitution text as
+# "note". Days whose substitutions can't be loaded are fetched as date plans
+# like without the overlay. The page lists every class, so it is fetched
+# once per school and day and cached for SUBSTITUTIONS_TTL.
+TIMETABLE_OVERLAY = os.environ.get("EDUPAGE_TIMETABLE_OVERLAY") == "1"
+SUBSTITUTIONS_TTL = int(os.environ.get("EDUPAGE_SUBSTITUTIONS_TTL", 5 * 60))
+_substitutions_cache = BridgeCache("substitutions", SUBSTITUTIONS_TTL)
+
+SUBST_HEADER_PATTERN = re.compile(r'<div class="header">\s*<span[^>]*>(.*?)</span>', re.DOTALL)
+SUBST_ROW_PATTERN = re.compile(
+    r'<div class="row ([a-z]+)[^"]*">\s*<div class="period">\s*<span[^>]*>(.*?)</span>\s*</div>'
+    r'\s*<div class="info">\s*<span[^>]*>(.*?)</span>',
+    re.DOTALL,
+)
+
+
+def _html_text(fragment):
+    return html.unescape(re.sub(r"<[^>]+>", "", fragment)).strip()
+
+
+def parse_substitutions(page):
+    """Changes from a substitution viewer page as [{"classes", "periods", "action", "text"}].
+
+    action is "change", "add" or "remove"; periods is the set of period
+    numbers, e.g. {3, 4} for "3 - 4"; classes are lower-case class names.
+    """
+    changes = []
+    for section in page.split('<div class="section print-nobreak">')[1:]:
+        header = SUBST_HEADER_PATTERN.search(section)
+        if not header:
+            continue
+        classes = {c.strip().lower() for c in re.split(r"[,+]", _html_text(header.group(1))) if c.strip()}
+        for action, period_text, info in SUBST_ROW_PATTERN.findall(section):
+            numbers = [int(n) for n in re.findall(r"\d+", _html_text(period_text))]
+            if not numbers:
+                continue
+            changes.append({
+                "classes": classes,
+                "periods": set(range(min(numbers), max(numbers) + 1)),
+                "action": action,
+                "text": _html_text(info),
+            })
+    return changes
+
+
+def fetch_substitutions(edupage, day):
+    """The day's substitutions for all classes, or None if they could not be loaded."""
+    cache_key = [edupage.subdomain, day.isoformat()]
+    page = _substitutions_cache.get(cache_key)
+    if page is not None:
+        log.debug("substitutions cache hit", date=day)
+        return parse_substitutions(page)
+    url = f"https://{edupage.subdomain}.edupage.org/substitution/server/viewer.js?__func=getSubstViewerDayDataHtml"
+    payload = {
+        "__args": [None, {"date": day.strftime("%Y-%m-%d"), "mode": "classes"}],
+        "__gsh": getattr(edupage, "gsh", "00000000"),
+    }
+    try:
+        resp = edupage.session.post(url, json=payload)
+        txt = resp.text
+        if txt.startswith("eqz:"):
+            txt = base64.b64decode(txt[4:]).decode("utf8")
+        data = json.loads(txt)
+        if resp.status_code != 200 or data.get("reload") or not isinstance(data.get("r"), str):
+            log.debug("substitutions not available", date=day, status=resp.status_code)
+            return None
+        changes = parse_substitutions(data["r"])
+        _substitutions_cache.set(cache_key, data["r"])
+    except Exception as e:
+        log.warning("substitutions fetch failed", date=day, error=e)
+        return None
+    log.debug("substitutions", date=day, changes=len(changes))
+    return changes
+
+
+def load_regular_tables(edupage, date):
+    """(tables, tt_num) of the school's current regular timetable, cached like in run_date_plan_strategies."""
+    gsh = getattr(edupage, "gsh", "00000000")
+    tt_num = (_ttviewer_cache.get([edupage.subdomain]) or {}).get("tt_num")
+    if not tt_num:
+        with span(edupage, "timetable.ttviewer"):
+            targets = target_variants(getattr(edupage, 'active_child_id', None))
+            raw_ttviewer, _ = fetch_ttviewer_data(edupage, gsh, date, targets)
+        tt_state = timetable_state(raw_ttviewer)
+        if not tt_state:
+            return None, None
+        tt_num = tt_state["tt_num"]
+        _ttviewer_cache.set([edupage.subdomain], tt_state)
+    with span(edupage, "timetable.regulartt"):
+        tables = fetch_regulartt_tables(edupage, gsh, tt_num)
+    return (tables, tt_num) if isinstance(tables, list) else (None, None)
+
+
+def _period_number(row):
+    match = re.search(r"\d+", str(row.get('period', '')))
+    return int(match.group()) if match else None
+
+
+def _names(subject, short, teacher):
+    """What a substitution text may call a lesson: subject, subject short, teacher surname."""
+    teacher = (teacher or '').split()
+    return [name for name in (subject, short, teacher[-1] if teacher else None) if name and len(name) >= 2]
+
+
+def _mentions(text, names):
+    text = text.lower()
+    return any(re.search(rf"(?<!\w){re.escape(name.lower())}(?!\w)", text) for name in names)
+
+
+def apply_substitutions(rows, changes, class_name, index):
+    """Copy of a day's lesson rows with the class's substitutions applied and flagged.
+
+    A change applies to the lessons of its periods whose subject or teacher
+    it names. Only when a single lesson occupies the period and the text
+    names no other subject or teacher is it applied without that. Changes
+    in periods without any lesson become extra rows; the others belong to
+    lessons of other groups or weeks and are left out.
+    """
+    rows = [dict(row, changed=False, cancelled=False) for row in rows]
+    school_names = [
+        name for row in index.subjects.values() for name in _names(row.get('name'), row.get('short'), None)
+    ] + [name for row in index.teachers.values() for name in _names(None, None, row.get('name'))]
+    for change in changes or ():
+        if class_name not in change["classes"]:
+            continue
+        in_periods = [
+            row for row in rows
+            if _period_number(row) in change["periods"] and not str(row.get('id')).startswith("subst-")
         ]
-        d = check_date if isinstance(check_date, date) else check_date.date() if hasattr(check_date, 'date') else check_date
-        for start, end in holidays:
-            if start <= d <= end:
-                return True
-        return False
-    
+        matched = [
+            row for row in in_periods
+            if _mentions(change["text"], _names(row.get('subject'), row.get('subject_short'), row.get('teacher')))
+        ]
+        if not matched and len(in_periods) == 1 and not _mentions(change["text"], school_names):
+            matched = in_periods
+        if in_periods and not matched and change["action"] != "add":
+            log.debug("substitution for another lesson", text=change["text"], periods=sorted(change["periods"]))
+            continue
+        if change["action"] == "add" or not matched:
+            # Extra lesson, or a change of a lesson the regular plan lacks
+            for number in sorted(change["periods"]):
+                period = next((p for p in index.periods.values() if _period_number(p) == number), {})
+                rows.append({
+                    'id': f"subst-{number}", 'period': period.get('name', str(number)),
+                    'starttime': period.get('starttime', ''), 'endtime': period.get('endtime', ''),
+                    'subject': change["text"], 'subject_short': '', 'class': class_name,
+                    'teacher': '', 'classroom': '', 'changed': True,
+                    'cancelled': change["action"] == "remove", 'note': change["text"],
+                })
+        elif change["action"] == "remove":
+            for row in matched:
+                row.update(changed=True, cancelled=True, note=change["text"])
+        else:
+            for row in matched:
+                row.update(changed=True, note=change["text"])
+    rows.sort(key=lambda row: (row.get('starttime') or '', row.get('cancelled')))
+    return rows
+
+
+def overlay_week(edupage, days):
+    """(lessons, days without substitutions) for `days`, or None without a regular timetable.
+
+    Only days whose substitutions could be loaded have lessons, the others
+    are left to the date plans.
+    """
+    tables, tt_num = load_regular_tables(edupage, days[0])
+    if tables is None:
+        return None
+    index = timetable_index(edupage.subdomain, tt_num, tables)
+    if not index.has_cards:
+        return None
+    with span(edupage, "timetable.substitutions"):
+        changes = run_sections(
+            {day: (lambda d=day: fetch_substitutions(edupage, d)) for day in days},
+            CONCURRENT_SECTIONS,
+        )
+    class_name = child_class_name(edupage)
+    lessons = []
+    with span(edupage, "timetable.expand"):
+        for day in days:
+            if changes[day] is None:
+                continue
+            rows = lessons_from_tables(edupage, tables, tt_num, day)
+            lessons.extend(timetable_to_lessons(apply_substitutions(rows, changes[day], class_name, index), day))
+    return lessons, [day for day in days if changes[day] is None]
+
+
+def fetch_timetable(edupage, child, days_to_fetch):
+    # TIMETABLE, None if no school day could be fetched
+    lessons = []
+
     try:
+        school_days = [day for day in days_to_fetch if not is_school_holiday(day, edupage.subdomain)]
+        if school_days and not timetable_indexed(edupage.subdomain):
+            # Index the regular timetable (cached for REGULARTT_TTL) so its
+            # terms, free weekdays and A/B weeks are known before any day is fetched
+            tables, tt_num = load_regular_tables(edupage, school_days[0])
+            if tables is not None:
+                timetable_index(edupage.subdomain, tt_num, tables)
+                school_days = [day for day in school_days if not is_school_holiday(day, edupage.subdomain)]
         for day in days_to_fetch:
-            print(f"DEBUG: Fetching Timetable for {day}...", file=sys.stderr)
-            
-            # Check if it's a school holiday
-            if is_school_holiday(day):
-                print(f"DEBUG: {day} is a school holiday - skipping timetable fetch", file=sys.stderr)
-                continue
-                
-            timetable = edupage.get_my_timetable(day)
-            
-            if timetable is None:
-                continue
+            if day not in school_days:
+                log.debug("no school, skipping timetable", date=day, holiday=school_calendar(edupage.subdomain).holiday(day))
+
+        if TIMETABLE_OVERLAY and school_days:
+            overlaid = overlay_week(edupage, school_days)
+            if overlaid is not None:
+                lessons, school_days = overlaid
+                if school_days:
+                    log.debug("no substitutions, fetching date plans", dates=school_days)
+            else:
+                log.debug("no regular timetable to overlay, fetching date plans")
+
+        # One gcall for the whole range, per-day strategies only for missing days
+        timetables = Timetables(edupage)
+        week_plans = timetables.get_week_plan(school_days[0], school_days[-1]) if school_days else {}
+        by_day = {day: plan_to_timetable(timetables, plan) for day, plan in week_plans.items()}
+
+        missing = [day for day in school_days if day not in week_plans]
+        if missing:
+            # The first day probes strategies and fills the timetable caches,
+            # the remaining days can then run side by side
+            log.debug("fetching timetable", date=missing[0])
+            by_day[missing[0]] = edupage.get_my_timetable(missing[0])
+            by_day.update(run_sections(
+                {day: (lambda d=day: edupage.get_my_timetable(d)) for day in missing[1:]},
+                CONCURRENT_SECTIONS,
+            ))
+
+        for day in school_days:
+            if by_day.get(day) is not None:
+                lessons.extend(timetable_to_lessons(by_day[day], day))
+        if school_days and not lessons and all(by_day.get(day) is None for day in school_days):
+            log.warning("timetable fetch failed for every day", child_id=child['id'])
+            return None
+        lessons.sort(key=lambda lesson: lesson["date"])
+
+    except Exception:
+        log.warning("timetable fetch failed", exc_info=True, child_id=child['id'])
+        return None
+
+    return lessons
 
-                
-            # Handle new format (list of dicts from our fixed_get_date_plan)
-            if isinstance(timetable, list):
-                for l in timetable:
-                    # Already in dict format, just add date
-                    lesson_dict = {
-                        "id": l.get('id', ''),
-                        "startTime": l.get('starttime', ''),
-                        "endTime": l.get('endtime', ''),
-                        "date": day.isoformat(),
-                        "subject": {"name": l.get('subject', 'Unknown'), "short": l.get('subject_short', '')},
-                        "classroom": {"name": l.get('classroom', '')},
-                        "teacher": {"name": l.get('teacher', '')},
-                        "class": {"name": l.get('class', '')}
-                    }
-                    lessons.append(lesson_dict)
-            # Handle old format (Timetable object with .lessons)
-            elif hasattr(timetable, 'lessons'):
-                for l in timetable.lessons:
-                    lessons.append(serialize_lesson(l, day))
-            # Handle dict format (raw TTViewer result)
-            elif isinstance(timetable, dict):
-                print(f"DEBUG: Timetable is dict with keys: {list(timetable.keys())}", file=sys.stderr)
-                # Try to extract lessons from various possible structures
-                pass
-                
-    except Exception as e:
-        print(f"DEBUG: Error fetching timetable for {child['name']}: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc()
 
-    # HOMEWORK (assignments)
-    print("DEBUG: Fetching Homework...", file=sys.stderr)
+def fetch_homework(edupage):
+    # HOMEWORK (assignments), None if they could not be fetched
     homeworks = []
     try:
         if hasattr(edupage, "get_homeworks"):
             hws = edupage.get_homeworks() 
-            print(f"DEBUG: Found {len(hws) if hws else 0} homework items", file=sys.stderr)
+            log.debug("homework", items=len(hws) if hws else 0)
             for hw in (hws or []):
                 try:
                     subject_name = ""
@@ -871,349 +2176,418 @@ def fetch_child_data(edupage, child, days_to_fetch):
                         "done": bool(getattr(hw, "is_done", False))
                     })
                 except Exception as hw_err:
-                    print(f"DEBUG: Error parsing homework item: {hw_err}", file=sys.stderr)
-    except Exception as e:
-        print(f"DEBUG: Error fetching homework: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+                    log.warning("homework item not parsable", error=hw_err)
+    except Exception:
+        log.warning("homework fetch failed", exc_info=True)
+        return None
+    return homeworks
+
 
+def fetch_grades(edupage):
     # GRADES - Custom implementation (library has bug with max_points)
-    print("DEBUG: Fetching Grades (custom)...", file=sys.stderr)
+    # None if the grades page could not be fetched or read
     grades_data = []
     try:
-        # Fetch the grades page directly
-        znamky_url = f"https://{edupage.subdomain}.edupage.org/znamky/"
-        response = edupage.session.get(znamky_url)
-        
-        if response.status_code == 200:
-            html = response.text
-            
-            # Extract vsetkyZnamky array from JavaScript
-            import re
-            import json
-            
-            # Debug: Save HTML to file for analysis
-            debug_file = "/tmp/edupage_znamky_debug.html"
+        with span(edupage, "grades.fetch"):
+            page = download_grades_page(edupage)
+
+        if page is None:
+            return None
+        if page.grades is not None:
+            # Filter for current child
+            child_id = str(edupage.active_child_id) if hasattr(edupage, 'active_child_id') else None
             try:
-                with open(debug_file, "w", encoding="utf-8") as f:
-                    f.write(html)
-                print(f"DEBUG: Saved HTML to {debug_file}", file=sys.stderr)
-            except:
-                pass
-            
-            # Find subjects data - look for vsetkyPredmety JSON object
-            subjects_map = {}
+                with span(edupage, "grades.aggregate"):
+                    grades_data = aggregate_grades(page, child_id)
+            except (TypeError, ValueError, AttributeError) as e:
+                log.warning("grades aggregation failed", error=e)
+                return None
+        else:
+            log.debug("vsetkyZnamky not found in grades page")
             
-            # Try to find the vsetkyPredmety object and parse it as JSON
-            # Format in HTML: "vsetkyPredmety": {"-1": {"p_meno": "Deutsch", ...}, "-2": {...}}
+    except Exception:
+        log.warning("grades fetch failed", exc_info=True)
+        return None
+    return grades_data
+
+
+def download_grades_page(edupage):
+    """Fetch and scan the /znamky/ page, returns a GradesPage or None."""
+    # Fetch the grades page directly
+    znamky_url = f"https://{edupage.subdomain}.edupage.org/znamky/"
+    # Streamed: only the embedded data blobs are needed, and the
+    # connection is closed as soon as they have been read
+    response = edupage.session.get(znamky_url, stream=True)
+    if response.status_code != 200:
+        response.close()
+        log.warning("grades page request failed", status=response.status_code)
+        return None
+
+    capture = open_capture(edupage, response.url)
+    try:
+        page, received = read_grades_page(response, capture, getattr(edupage, "metrics", None))
+    finally:
+        response.close()
+        if capture is not None:
             try:
-                # Find the complete vsetkyPredmety object
-                predmety_start = html.find('"vsetkyPredmety":')
-                if predmety_start != -1:
-                    # Find opening brace
-                    brace_start = html.find('{', predmety_start)
-                    if brace_start != -1:
-                        # Count braces to find the end
-                        depth = 0
-                        i = brace_start
-                        while i < len(html):
-                            if html[i] == '{':
-                                depth += 1
-                            elif html[i] == '}':
-                                depth -= 1
-                                if depth == 0:
-                                    predmety_json = html[brace_start:i+1]
-                                    try:
-                                        predmety_obj = json.loads(predmety_json)
-                                        for pid, pdata in predmety_obj.items():
-                                            if isinstance(pdata, dict) and 'p_meno' in pdata:
-                                                subjects_map[pid] = pdata['p_meno']
-                                        print(f"DEBUG: Parsed vsetkyPredmety, found {len(subjects_map)} subjects", file=sys.stderr)
-                                    except json.JSONDecodeError as e:
-                                        print(f"DEBUG: Failed to parse vsetkyPredmety JSON: {e}", file=sys.stderr)
-                                        # Print first 500 chars for debugging
-                                        print(f"DEBUG: JSON snippet: {predmety_json[:500]}", file=sys.stderr)
-                                    break
-                            i += 1
-                else:
-                    print("DEBUG: vsetkyPredmety not found in HTML", file=sys.stderr)
-            except Exception as e:
-                print(f"DEBUG: Error extracting vsetkyPredmety: {e}", file=sys.stderr)
-            
-            # Fallback 1: Try to find predmety in different format
-            if not subjects_map:
-                # Look for "predmety": {...} format
-                predmety_alt = html.find('"predmety":')
-                if predmety_alt != -1:
-                    print(f"DEBUG: Found 'predmety' at position {predmety_alt}", file=sys.stderr)
-                    brace_start = html.find('{', predmety_alt)
-                    if brace_start != -1:
-                        depth = 0
-                        i = brace_start
-                        while i < len(html) and i < brace_start + 50000:  # Limit search
-                            if html[i] == '{':
-                                depth += 1
-                            elif html[i] == '}':
-                                depth -= 1
-                                if depth == 0:
-                                    try:
-                                        predmety_obj = json.loads(html[brace_start:i+1])
-                                        for pid, pdata in predmety_obj.items():
-                                            if isinstance(pdata, dict):
-                                                name = pdata.get('p_meno') or pdata.get('nazov') or pdata.get('name')
-                                                if name:
-                                                    subjects_map[pid] = name
-                                        print(f"DEBUG: Alt predmety found {len(subjects_map)} subjects", file=sys.stderr)
-                                    except:
-                                        pass
-                                    break
-                            i += 1
-            
-            # Fallback 2: Regex for p_meno or nazov
-            if not subjects_map:
-                pattern = r'"(-?\d+)":\s*\{[^{}]*"(?:p_meno|nazov)":\s*"([^"]+)"'
-                for match in re.finditer(pattern, html):
-                    subjects_map[match.group(1)] = match.group(2)
-                print(f"DEBUG: Regex fallback found {len(subjects_map)} subjects", file=sys.stderr)
-            
-            print(f"DEBUG: Final subject map: {subjects_map}", file=sys.stderr)
-            
-            # Find events data (contains max points for each grade)
-            events_map = {}
+                capture.close()
+            except OSError as e:
+                log.warning("capture failed", url=response.url, error=e)
+    log.debug("grades page read", bytes=received)
+    return page
+
+
+# Read size for the streamed /znamky/ page
+GRADES_CHUNK_SIZE = 16 * 1024
+
+
+@dataclass
+class GradesPage:
+    """The data blobs of a /znamky/ page."""
+    grades: list = None  # vsetkyZnamky, None if the page had none
+    subjects: dict = field(default_factory=dict)  # predmetid -> subject name
+    events: dict = field(default_factory=dict)  # udalostid -> {'maxbody', 'typ', 'nazov'}
+
+
+class GradesPageScanner:
+    """Finds all known top-level data keys of a /znamky/ page in one pass.
+
+    The page can be fed in pieces as it arrives. Each key is decoded in place
+    and scanning resumes behind the decoded value, so large arrays are never
+    searched twice and already scanned text is dropped. Scanning stops as soon
+    as grades, subjects and events from their preferred keys are complete.
+    """
+
+    SUBJECT_KEYS = ("vsetkyPredmety", "predmety")
+    EVENT_KEYS = ("vsetkyUdalosti", "udalosti", "znamkyUdalosti")
+    KEY_PATTERN = re.compile(r'"(vsetkyZnamky|vsetkyPredmety|predmety|vsetkyUdalosti|udalosti|znamkyUdalosti)"\s*:')
+    # Fallback: Regex for p_meno or nazov
+    SUBJECT_FALLBACK = re.compile(r'"(-?\d+)":\s*\{[^{}]*"(?:p_meno|nazov)":\s*"([^"]+)"')
+    # Tail kept unscanned between pieces so keys and fallback entries
+    # cut in half by a chunk boundary are still found
+    KEY_OVERLAP = 64
+    FALLBACK_OVERLAP = 16 * 1024
+
+    def __init__(self):
+        self.values = {}
+        self.fallback_subjects = {}
+        self.complete = False
+        self._buffer = ""
+        self._pos = 0
+        self._fallback_pos = 0
+        self._retry_at = 0
+
+    def feed(self, text, final=False):
+        """Add the next piece of the page, pass final=True with the last one."""
+        self._buffer += text
+        if self.complete or (not final and len(self._buffer) < self._retry_at):
+            return
+        self._retry_at = 0
+        self._scan_keys(final)
+        if not self.complete:
+            self._scan_fallback(final)
+        keep = min(self._pos, self._fallback_pos)
+        if keep:
+            self._buffer = self._buffer[keep:]
+            self._pos -= keep
+            self._fallback_pos -= keep
+            if self._retry_at:
+                self._retry_at -= keep
+
+    def _scan_keys(self, final):
+        text = self._buffer
+        while not self.complete:
+            match = self.KEY_PATTERN.search(text, self._pos)
+            if not match:
+                self._pos = len(text) if final else max(self._pos, len(text) - self.KEY_OVERLAP)
+                return
+            key = match.group(1)
+            if key in self.values:
+                self._pos = match.end()
+                continue
             try:
-                # Try multiple possible keys
-                for key in ['"vsetkyUdalosti":', '"udalosti":', '"znamkyUdalosti":']:
-                    udalosti_start = html.find(key)
-                    if udalosti_start != -1:
-                        print(f"DEBUG: Found events under key {key}", file=sys.stderr)
-                        brace_start = html.find('[', udalosti_start)
-                        if brace_start != -1:
-                            depth = 0
-                            i = brace_start
-                            while i < len(html) and i < brace_start + 200000:
-                                if html[i] == '[':
-                                    depth += 1
-                                elif html[i] == ']':
-                                    depth -= 1
-                                    if depth == 0:
-                                        try:
-                                            udalosti_arr = json.loads(html[brace_start:i+1])
-                                            for ud in udalosti_arr:
-                                                if isinstance(ud, dict):
-                                                    ud_id = str(ud.get('udalostid', ''))
-                                                    max_points = ud.get('maxbody')
-                                                    grade_type = ud.get('typ_znamky')
-                                                    nazov = ud.get('nazov', '')
-                                                    if ud_id and max_points is not None:
-                                                        events_map[ud_id] = {
-                                                            'maxbody': max_points,
-                                                            'typ': grade_type,
-                                                            'nazov': nazov
-                                                        }
-                                            print(f"DEBUG: Found {len(events_map)} events with max points", file=sys.stderr)
-                                            if events_map:
-                                                sample_id = list(events_map.keys())[0]
-                                                print(f"DEBUG: Sample event {sample_id}: {events_map[sample_id]}", file=sys.stderr)
-                                        except json.JSONDecodeError as e:
-                                            print(f"DEBUG: Failed to parse events: {e}", file=sys.stderr)
-                                        break
-                                i += 1
-                        if events_map:
-                            break  # Stop looking for other keys
-                
-                if not events_map:
-                    print("DEBUG: No events with maxbody found in any key", file=sys.stderr)
-                    # Debug: print small snippet around 'udalost' if found
-                    test_pos = html.find('udalost')
-                    if test_pos != -1:
-                        print(f"DEBUG: Found 'udalost' at pos {test_pos}, snippet: {html[test_pos:test_pos+100]}", file=sys.stderr)
-            except Exception as e:
-                print(f"DEBUG: Error extracting events: {e}", file=sys.stderr)
-            
-            # Find grades data
-            znamky_match = re.search(r'"vsetkyZnamky":\s*\[(.*?)\](?=\s*,\s*"vsetky)', html, re.DOTALL)
-            if znamky_match:
-                znamky_str = "[" + znamky_match.group(1) + "]"
+                value, self._pos = decode_js_value(text, match.end())
+            except ValueError as e:
+                if not final:
+                    # Most likely cut off by the end of the piece: wait until
+                    # the pending part has doubled, so huge arrays are not
+                    # re-decoded for every chunk
+                    self._pos = match.start()
+                    self._retry_at = 2 * len(text) - match.start()
+                    return
+                log.debug("grades page key not decodable", key=key, error=e)
+                self._pos = match.end()
+                continue
+            self.values[key] = value
+            self.complete = (
+                isinstance(self.values.get("vsetkyZnamky"), list)
+                and bool(self._subjects_from("vsetkyPredmety"))
+                and bool(self._events_from("vsetkyUdalosti"))
+            )
+
+    def _scan_fallback(self, final):
+        text = self._buffer
+        limit = len(text) if final else len(text) - self.FALLBACK_OVERLAP
+        pos = self._fallback_pos
+        for match in self.SUBJECT_FALLBACK.finditer(text, pos):
+            if match.start() >= limit:
+                break
+            self.fallback_subjects[match.group(1)] = match.group(2)
+            pos = match.end()
+        self._fallback_pos = max(pos, limit, self._fallback_pos)
+
+    def _subjects_from(self, key):
+        subjects = {}
+        value = self.values.get(key)
+        if isinstance(value, dict):
+            for pid, pdata in value.items():
+                if not isinstance(pdata, dict):
+                    continue
+                # Format in HTML: "vsetkyPredmety": {"-1": {"p_meno": "Deutsch", ...}, "-2": {...}}
+                if key == "vsetkyPredmety":
+                    name = pdata.get('p_meno')
+                else:
+                    name = pdata.get('p_meno') or pdata.get('nazov') or pdata.get('name')
+                if name:
+                    subjects[pid] = name
+        return subjects
+
+    def _events_from(self, key):
+        events = {}
+        value = self.values.get(key)
+        if isinstance(value, list):
+            for ud in value:
+                if isinstance(ud, dict):
+                    ud_id = str(ud.get('udalostid', ''))
+                    max_points = ud.get('maxbody')
+                    if ud_id and max_points is not None:
+                        events[ud_id] = {
+                            'maxbody': max_points,
+                            'typ': ud.get('typ_znamky'),
+                            'nazov': ud.get('nazov', '')
+                        }
+        return events
+
+    def page(self):
+        result = GradesPage()
+        grades = self.values.get("vsetkyZnamky")
+        result.grades = grades if isinstance(grades, list) else None
+        for key in self.SUBJECT_KEYS:
+            result.subjects = self._subjects_from(key)
+            if result.subjects:
+                break
+        if not result.subjects:
+            result.subjects = dict(self.fallback_subjects)
+            log.debug("subject regex fallback", subjects=len(result.subjects))
+        # Find events data (contains max points for each grade)
+        for key in self.EVENT_KEYS:
+            result.events = self._events_from(key)
+            if result.events:
+                break
+        log.debug("grades page parsed", grades=len(result.grades or []), subjects=len(result.subjects), events=len(result.events))
+        return result
+
+
+def scan_grades_page(html):
+    """Parse a complete /znamky/ page into a GradesPage."""
+    scanner = GradesPageScanner()
+    scanner.feed(html, final=True)
+    return scanner.page()
+
+
+def read_grades_page(response, sink=None, metrics=None):
+    """Parse a streamed /znamky/ response into a GradesPage.
+
+    The body is decoded chunk by chunk and reading stops as soon as the
+    scanner has everything, so the rest of the page is never downloaded.
+    Raw chunks are also written to `sink` if given. The bytes read and the
+    time spent scanning are added to `metrics` ("grades.parse").
+    Returns (page, bytes read).
+    """
+    scanner = GradesPageScanner()
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    received = 0
+    parse_seconds = 0.0
+    for chunk in response.iter_content(GRADES_CHUNK_SIZE):
+        received += len(chunk)
+        if sink is not None:
+            sink.write(chunk)
+        start = time.perf_counter()
+        scanner.feed(decoder.decode(chunk))
+        parse_seconds += time.perf_counter() - start
+        if scanner.complete:
+            log.debug("grades page complete, closing early", bytes=received)
+            break
+    else:
+        start = time.perf_counter()
+        scanner.feed(decoder.decode(b"", final=True), final=True)
+        parse_seconds += time.perf_counter() - start
+    if metrics is not None:
+        # The response hook counted the request but could not see the body
+        metrics.count_request(endpoint_name(response.url), received, requests=0)
+        metrics.add_time("grades.parse", parse_seconds)
+    return scanner.page(), received
+
+
+def aggregate_grades(page, child_id):
+    """Group a child's grades by subject with averages, as the frontend expects them."""
+    all_grades = page.grades
+    subjects_map = page.subjects
+    events_map = page.events
+    grades_data = []
+    log.debug("aggregating grades", grades=len(all_grades))
+
+    # Group grades by subject
+    grades_by_subject = {}
+
+    for g in all_grades:
+        if child_id and str(g.get('studentid')) != child_id:
+            continue
+
+        predmet_id = str(g.get('predmetid', ''))
+        subject_name = subjects_map.get(predmet_id, f"Fach {predmet_id}")
+
+        # Get displayed value (points)
+        value_str = str(g.get('data', ''))
+        datum = g.get('datum', '')[:10] if g.get('datum') else ''
+        udalost_id = str(g.get('udalostid', ''))
+
+        # Try to get numeric value for averaging
+        grade_value = None  # Actual grade 1-6
+        points_value = None  # Points achieved
+        max_points = None  # Maximum points
+        percentage = None  # Percentage achieved
+
+        # Get max points from event
+        if udalost_id and udalost_id in events_map:
+            event_data = events_map[udalost_id]
+            if event_data.get('maxbody'):
                 try:
-                    # Clean up potential issues with the JSON
-                    znamky_str = znamky_str.replace("'", '"')
-                    all_grades = json.loads(znamky_str)
-                    
-                    # Filter for current child
-                    child_id = str(edupage.active_child_id) if hasattr(edupage, 'active_child_id') else None
-                    print(f"DEBUG: Filtering grades for child_id: {child_id}", file=sys.stderr)
-                    print(f"DEBUG: Total grades in array: {len(all_grades)}", file=sys.stderr)
-                    
-                    # Debug: Print first grade object to see available fields
-                    if all_grades and len(all_grades) > 0:
-                        first_grade = all_grades[0]
-                        print(f"DEBUG: ===== GRADE OBJECT STRUCTURE =====", file=sys.stderr)
-                        print(f"DEBUG: Keys: {list(first_grade.keys())}", file=sys.stderr)
-                        print(f"DEBUG: First grade: {first_grade}", file=sys.stderr)
-                        print(f"DEBUG: ===================================", file=sys.stderr)
-                    
-                    # Group grades by subject
-                    grades_by_subject = {}
-                    
-                    for g in all_grades:
-                        if child_id and str(g.get('studentid')) != child_id:
-                            continue
-                        
-                        predmet_id = str(g.get('predmetid', ''))
-                        subject_name = subjects_map.get(predmet_id, f"Fach {predmet_id}")
-                        
-                        # Get displayed value (points)
-                        value_str = str(g.get('data', ''))
-                        datum = g.get('datum', '')[:10] if g.get('datum') else ''
-                        udalost_id = str(g.get('udalostid', ''))
-                        
-                        # Try to get numeric value for averaging
-                        grade_value = None  # Actual grade 1-6
-                        points_value = None  # Points achieved
-                        max_points = None  # Maximum points
-                        percentage = None  # Percentage achieved
-                        
-                        # Get max points from event
-                        if udalost_id and udalost_id in events_map:
-                            event_data = events_map[udalost_id]
-                            if event_data.get('maxbody'):
-                                try:
-                                    max_points = float(str(event_data['maxbody']).replace(',', '.'))
-                                except:
-                                    pass
-                        
-                        # Parse points from data field
-                        try:
-                            points_value = float(value_str.replace(',', '.'))
-                        except:
-                            pass
-                        
-                        # Calculate percentage and grade if we have both points and max
-                        if points_value is not None and max_points is not None and max_points > 0:
-                            percentage = (points_value / max_points) * 100
-                            
-                            # German grading scale (Thüringen standard)
-                            # 100-85%: 1, 84-70%: 2, 69-55%: 3, 54-40%: 4, 39-20%: 5, <20%: 6
-                            if percentage >= 85:
-                                grade_value = 1
-                            elif percentage >= 70:
-                                grade_value = 2
-                            elif percentage >= 55:
-                                grade_value = 3
-                            elif percentage >= 40:
-                                grade_value = 4
-                            elif percentage >= 20:
-                                grade_value = 5
-                            else:
-                                grade_value = 6
-                        
-                        # If data is already a grade (1-6), use it directly
-                        if grade_value is None and points_value is not None:
-                            if 1 <= points_value <= 6:
-                                grade_value = points_value
-                                points_value = None  # It's not points, it's a grade
-                        
-                        # Debug: Show first few grade calculations
-                        if len(grades_by_subject) == 0:
-                            print(f"DEBUG: First grade calc - data:{value_str}, udalost:{udalost_id}, points:{points_value}, max:{max_points}, pct:{percentage}, grade:{grade_value}", file=sys.stderr)
-                        
-                        if subject_name not in grades_by_subject:
-                            grades_by_subject[subject_name] = {
-                                "subject": subject_name,
-                                "grades": [],
-                                "gradeValues": [],  # Only 1-6 grades
-                                "hasPoints": False
-                            }
-                        
-                        # Build display value
-                        display_value = value_str
-                        if points_value is not None and max_points is not None and grade_value is not None:
-                            # Format like Edupage: "28.5 / 30 → 2"
-                            display_value = f"{points_value} / {int(max_points)} → {int(grade_value)}"
-                        elif grade_value is not None and points_value is None:
-                            # Simple grade
-                            display_value = str(int(grade_value))
-                        
-                        grades_by_subject[subject_name]["grades"].append({
-                            "value": display_value,
-                            "date": datum,
-                            "grade": grade_value  # The actual 1-6 grade
-                        })
-                        
-                        if grade_value is not None:
-                            grades_by_subject[subject_name]["gradeValues"].append(grade_value)
-                        if points_value is not None and max_points is not None:
-                            grades_by_subject[subject_name]["hasPoints"] = True
-                    
-                    # Calculate averages and build final structure
-                    overall_sum = 0
-                    overall_count = 0
-                    
-                    for subj_name, subj_data in grades_by_subject.items():
-                        grade_vals = subj_data["gradeValues"]  # Only contains 1-6 grades
-                        
-                        if grade_vals:
-                            # Calculate average only from actual grades (1-6)
-                            avg = sum(grade_vals) / len(grade_vals)
-                            
-                            subj_data["average"] = round(avg, 2)
-                            subj_data["isGradeScale"] = True
-                            subj_data["gradeCount"] = len(grade_vals)
-                            
-                            # Include in overall average
-                            overall_sum += avg
-                            overall_count += 1
-                        else:
-                            # No grades, only points
-                            subj_data["average"] = None
-                            subj_data["isGradeScale"] = False
-                            subj_data["gradeCount"] = len(subj_data["grades"])
-                        
-                        # Remove helper arrays
-                        del subj_data["gradeValues"]
-                        
-                        grades_data.append(subj_data)
-                    
-                    # Sort by subject name
-                    grades_data.sort(key=lambda x: x["subject"])
-                    
-                    # Add overall average as metadata
-                    overall_average = round(overall_sum / overall_count, 2) if overall_count > 0 else None
-                    
-                    print(f"DEBUG: Found {len(grades_data)} subjects with grades, overall avg: {overall_average}", file=sys.stderr)
-                    
-                    # Store overall average in a special way - prepend to list
-                    if overall_average is not None:
-                        grades_data.insert(0, {
-                            "subject": "__OVERALL__",
-                            "average": overall_average,
-                            "gradeCount": overall_count,
-                            "isGradeScale": True,
-                            "grades": []
-                        })
-                    
-                except json.JSONDecodeError as je:
-                    print(f"DEBUG: JSON parse error for grades: {je}", file=sys.stderr)
+                    max_points = float(str(event_data['maxbody']).replace(',', '.'))
+                except:
+                    pass
+
+        # Parse points from data field
+        try:
+            points_value = float(value_str.replace(',', '.'))
+        except:
+            pass
+
+        # Calculate percentage and grade if we have both points and max
+        if points_value is not None and max_points is not None and max_points > 0:
+            percentage = (points_value / max_points) * 100
+
+            # German grading scale (Thüringen standard)
+            # 100-85%: 1, 84-70%: 2, 69-55%: 3, 54-40%: 4, 39-20%: 5, <20%: 6
+            if percentage >= 85:
+                grade_value = 1
+            elif percentage >= 70:
+                grade_value = 2
+            elif percentage >= 55:
+                grade_value = 3
+            elif percentage >= 40:
+                grade_value = 4
+            elif percentage >= 20:
+                grade_value = 5
             else:
-                print("DEBUG: vsetkyZnamky not found in page", file=sys.stderr)
+                grade_value = 6
+
+        # If data is already a grade (1-6), use it directly
+        if grade_value is None and points_value is not None:
+            if 1 <= points_value <= 6:
+                grade_value = points_value
+                points_value = None  # It's not points, it's a grade
+
+        if subject_name not in grades_by_subject:
+            grades_by_subject[subject_name] = {
+                "subject": subject_name,
+                "grades": [],
+                "gradeValues": [],  # Only 1-6 grades
+                "hasPoints": False
+            }
+
+        # Build display value
+        display_value = value_str
+        if points_value is not None and max_points is not None and grade_value is not None:
+            # Format like Edupage: "28.5 / 30 → 2"
+            display_value = f"{points_value} / {int(max_points)} → {int(grade_value)}"
+        elif grade_value is not None and points_value is None:
+            # Simple grade
+            display_value = str(int(grade_value))
+
+        grades_by_subject[subject_name]["grades"].append({
+            "value": display_value,
+            "date": datum,
+            "grade": grade_value  # The actual 1-6 grade
+        })
+
+        if grade_value is not None:
+            grades_by_subject[subject_name]["gradeValues"].append(grade_value)
+        if points_value is not None and max_points is not None:
+            grades_by_subject[subject_name]["hasPoints"] = True
+
+    # Calculate averages and build final structure
+    overall_sum = 0
+    overall_count = 0
+
+    for subj_name, subj_data in grades_by_subject.items():
+        grade_vals = subj_data["gradeValues"]  # Only contains 1-6 grades
+
+        if grade_vals:
+            # Calculate average only from actual grades (1-6)
+            avg = sum(grade_vals) / len(grade_vals)
+
+            subj_data["average"] = round(avg, 2)
+            subj_data["isGradeScale"] = True
+            subj_data["gradeCount"] = len(grade_vals)
+
+            # Include in overall average
+            overall_sum += avg
+            overall_count += 1
         else:
-            print(f"DEBUG: Failed to fetch znamky page: {response.status_code}", file=sys.stderr)
-            
-    except Exception as e:
-        print(f"DEBUG: Error in custom grades fetcher: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+            # No grades, only points
+            subj_data["average"] = None
+            subj_data["isGradeScale"] = False
+            subj_data["gradeCount"] = len(subj_data["grades"])
+
+        # Remove helper arrays
+        del subj_data["gradeValues"]
 
+        grades_data.append(subj_data)
 
+    # Sort by subject name
+    grades_data.sort(key=lambda x: x["subject"])
 
-    # MESSAGES
-    print("DEBUG: Fetching Messages...", file=sys.stderr)
+    # Add overall average as metadata
+    overall_average = round(overall_sum / overall_count, 2) if overall_count > 0 else None
+
+    log.debug("grades aggregated", subjects=len(grades_data), overall_average=overall_average)
+
+    # Store overall average in a special way - prepend to list
+    if overall_average is not None:
+        grades_data.insert(0, {
+            "subject": "__OVERALL__",
+            "average": overall_average,
+            "gradeCount": overall_count,
+            "isGradeScale": True,
+            "grades": []
+        })
+
+    return grades_data
+
+
+def fetch_messages(edupage):
+    # MESSAGES, None if the feed could not be read
     messages = []
     
     # German indicator words
     non_german_indicators = ['prosím', 'ďakujem', 'dobrý', 'žiak', 'škola', 'oznámenie', 'pozor', 'upozornenie']
     
     try:
+        # Reused sessions have no fresh login page to read the feed from
+        if getattr(edupage, "timeline_stale", False):
+            refresh_timeline(edupage)
+
         # Try notifications
         found_msgs = []
         if hasattr(edupage, "get_notifications"):
@@ -1242,10 +2616,6 @@ def fetch_child_data(edupage, child, days_to_fetch):
             
         # Process Timeline Items (Parsed from HTML)
         if hasattr(edupage, "timeline_data"):
-            print("DEBUG: Processing extracted timeline data...", file=sys.stderr)
-            if edupage.timeline_data:
-                print(f"DEBUG: First timeline item sample: {edupage.timeline_data[0]}", file=sys.stderr)
-                
             for item in edupage.timeline_data:
                 # Filter relevant items
                 # Typ: 'sprava' (message), 'nastenka' (noticeboard), 'text' (maybe)
@@ -1293,109 +2663,843 @@ def fetch_child_data(edupage, child, days_to_fetch):
                         messages.append(msg)
                         
     except Exception as e:
-         print(f"DEBUG: Error fetching messages: {e}", file=sys.stderr)
+         log.warning("messages fetch failed", error=e)
+         return None
+    return messages
 
-    # cleanup: switch back to parent for next iteration
-    if hasattr(edupage, 'switch_to_parent'):
-        try:
-             print("DEBUG: Switching back to parent...", file=sys.stderr)
-             edupage.switch_to_parent()
-        except Exception as e:
-             # Just log, don't fail
-             print(f"DEBUG: switch_to_parent failed: {repr(e)}", file=sys.stderr)
 
-    # Determine className from child name (e.g. "Johanna Jahn, 1b" -> "1b")
-    class_name = ''
-    if ',' in child['name']:
-        class_name = child['name'].split(',')[-1].strip()
-    
-    return {
-        'studentId': child['id'],
-        'name': child['name'],  # Full name for frontend header
-        'firstName': child['name'].split()[0], # Simple parse
-        'lastName': " ".join(child['name'].split()[1:]),
-        'className': class_name or child.get('class', 'Unknown'),
-        'timetable': lessons,
-        'homework': homeworks,
-        'grades': grades_data,
-        'messages': messages
-    }
+# -----------------
+# SESSION STORE
+# -----------------
+# Persists cookies, gsh, resolved subdomain and children per account so warm
+# runs skip fixed_login entirely. A stored session is only dropped when a
+# request comes back unauthenticated or with "Insuficient privileg".
+SESSION_STORE_TTL = int(os.environ.get("EDUPAGE_SESSION_TTL", 7 * 24 * 3600))
+_session_store = BridgeCache("sessions", SESSION_STORE_TTL)
+
+
+# Stored sessions and snapshots are bound to the password they were made
+# with through an HMAC keyed by a random per-install secret (0600, next to
+# the cache), so the cache holds nothing a password can be guessed from
+# offline.
+_install_secret = None
+_install_secret_lock = threading.Lock()
+
+
+def install_secret():
+    """The install's HMAC key, created on first use."""
+    global _install_secret
+    with _install_secret_lock:
+        if _install_secret is None:
+            path = os.path.join(CACHE_DIR, "secret")
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                try:
+                    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                except FileExistsError:
+                    with open(path, "rb") as f:
+                        _install_secret = f.read()
+                else:
+                    _install_secret = secrets.token_bytes(32)
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(_install_secret)
+            except OSError as e:
+                log.warning("install secret not stored, sessions last for this process only", error=e)
+            if not _install_secret:
+                _install_secret = secrets.token_bytes(32)
+        return _install_secret
 
 
-def main():
-    print("DEBUG: Edupage Bridge Script v1.6 (Multi-Child)", file=sys.stderr)
-    if len(sys.argv) < 3:
-        print(json.dumps({"error": "Missing credentials"}))
-        sys.exit(1)
+def _password_hash(password):
+    return hmac.new(install_secret(), password.encode("utf8"), hashlib.sha256).hexdigest()
 
-    username = sys.argv[1]
-    password = sys.argv[2]
-    subdomain = sys.argv[3] if len(sys.argv) > 3 else "login1"
 
-    # Parse target date
-    target_date_str = sys.argv[4] if len(sys.argv) > 4 else None
-    if target_date_str:
-        try:
-            target_date = datetime.datetime.strptime(target_date_str, "%Y-%m-%d").date()
-        except ValueError:
-             print(json.dumps({"error": "Invalid date format. Use YYYY-MM-DD"}))
-             sys.exit(1)
-    else:
-        target_date = datetime.date.today()
+def _same_password(stored, password_hash):
+    """Constant-time comparison of a stored password hash with _password_hash's."""
+    return isinstance(stored, str) and hmac.compare_digest(stored, password_hash)
+
+
+def watch_auth(edupage):
+    """Install a response hook that flags requests edupage rejected.
+
+    Sets edupage.auth_lost when a request is redirected to the login page and
+    edupage.privilege_rejected on "Insuficient privileg" answers.
+    """
+    edupage.auth_lost = False
+    edupage.privilege_rejected = False
+    if getattr(edupage, "auth_watched", False):
+        return
+    edupage.auth_watched = True
+
+    def hook(response, *args, **kwargs):
+        original_url = response.history[0].url if response.history else response.url
+        if "/login/" in response.url and "/login/" not in original_url:
+            log.info("session no longer authenticated", url=original_url)
+            edupage.auth_lost = True
+        elif not kwargs.get("stream") and b"Insuficient privileg" in response.content[:4096]:
+            log.debug("insufficient privileges", url=original_url)
+            edupage.privilege_rejected = True
+        return response
+
+    edupage.session.hooks["response"].append(hook)
+
+
+def save_session(edupage, account_key, password_hash, privilege_errors_expected=False):
+    cookies = [
+        {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path, "secure": c.secure, "expires": c.expires}
+        for c in edupage.session.cookies
+    ]
+    _session_store.set(account_key, {
+        "password": password_hash,
+        "cookies": cookies,
+        "gsh": getattr(edupage, "gsh", None),
+        "subdomain": edupage.subdomain,
+        "username": edupage.username,
+        "children": getattr(edupage, "children", []),
+        # Some schools answer gcall with "Insuficient privileg" even right
+        # after a fresh login, that must not count as an expired session then
+        "privilege_errors_expected": privilege_errors_expected,
+    })
+
+
+def restore_session(account_key, password_hash):
+    """Rebuild a logged-in Edupage from the session store, or return None."""
+    state = _session_store.get(account_key)
+    if not state or not _same_password(state.get("password"), password_hash):
+        return None
+
+    edupage = new_edupage()
+    for c in state.get("cookies", []):
+        edupage.session.cookies.set(
+            c["name"], c["value"], domain=c.get("domain"), path=c.get("path") or "/",
+            secure=c.get("secure", False), expires=c.get("expires"),
+        )
+    edupage.gsh = state.get("gsh")
+    edupage.subdomain = state.get("subdomain")
+    edupage.username = state.get("username")
+    edupage.children = state.get("children") or []
+    edupage.is_logged_in = True
+    edupage.privilege_errors_expected = state.get("privilege_errors_expected", False)
+    # The timeline came from the login page, reload it before showing messages
+    edupage.timeline_data = []
+    edupage.timeline_stale = True
+    log.debug("restored stored session", subdomain=edupage.subdomain)
+    return edupage
+
+
+def refresh_timeline(edupage):
+    """Reload the userhome page of a reused session (library data + timeline)."""
+    response = edupage.session.get(f"https://{edupage.subdomain}.edupage.org/user/")
+    data = response.content.decode()
+    try:
+        Login(edupage)._Login__parse_login_data(data)
+    except Exception as e:
+        log.debug("standard login data parse failed on refresh", error=e)
+    parse_timeline(edupage, data)
+    edupage.timeline_stale = False
 
+
+class BridgeError(Exception):
+    """Error reported to the caller as {"error": ...} instead of a result."""
+
+    def __init__(self, message, traceback=None):
+        super().__init__(message)
+        self.traceback = traceback
+
+    def to_dict(self):
+        payload = {"error": str(self)}
+        if self.traceback:
+            payload["traceback"] = self.traceback
+        return payload
+
+
+def parse_target_date(target_date_str):
+    if not target_date_str:
+        return datetime.date.today()
+    try:
+        return datetime.datetime.strptime(target_date_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise BridgeError("Invalid date format. Use YYYY-MM-DD")
+
+
+def parse_sections(value):
+    """Turn "timetable,grades" or ["timetable", "grades"] into a tuple in SECTIONS order.
+
+    Empty or missing means all sections.
+    """
+    if not value:
+        return SECTIONS
+    names = value.split(",") if isinstance(value, str) else value
+    if not isinstance(names, (list, tuple)):
+        raise BridgeError(f"Invalid sections: {value!r}")
+    wanted = {str(name).strip().lower() for name in names} - {""}
+    unknown = wanted - set(SECTIONS)
+    if unknown:
+        raise BridgeError(f"Unknown section(s): {', '.join(sorted(unknown))}. Use {', '.join(SECTIONS)}")
+    return tuple(name for name in SECTIONS if name in wanted) or SECTIONS
+
+
+def week_days(target_date):
     # Calculate Start/End of Week (Monday - Sunday)
     start_of_week = target_date - datetime.timedelta(days=target_date.weekday())
     # We will fetch Monday to Friday for the timetable
-    days_to_fetch = [start_of_week + datetime.timedelta(days=i) for i in range(5)]
+    return [start_of_week + datetime.timedelta(days=i) for i in range(5)]
 
-    edupage = Edupage()
 
+def login_edupage(username, password, subdomain, metrics=None):
+    edupage = new_edupage()
+    if metrics is not None:
+        attach_metrics(edupage, metrics)
+    watch_captures(edupage)
     try:
-        login_result = edupage.login(username, password, subdomain)
-        if isinstance(login_result, TwoFactorLogin):
-            print(json.dumps({"error": "2FA Required - Not supported in Kiosk mode. Please disable 2FA for this account."}))
-            sys.exit(1)
+        with span(edupage, "login"):
+            login_result = edupage.login(username, password, subdomain)
     except BadCredentialsException:
-        print(json.dumps({"error": "Wrong username or password"}))
-        sys.exit(1)
+        raise BridgeError("Wrong username or password")
     except CaptchaException:
-        print(json.dumps({"error": "Captcha required - login manually first"}))
-        sys.exit(1)
+        raise BridgeError("Captcha required - login manually first")
     except Exception as e:
-        print(json.dumps({"error": str(e)}))
-        sys.exit(1)
+        raise BridgeError(str(e))
+    if isinstance(login_result, TwoFactorLogin):
+        raise BridgeError("2FA Required - Not supported in Kiosk mode. Please disable 2FA for this account.")
+    return edupage
 
-    # Fetch Data
-    
+
+def fetch_all_children(edupage, target_date, sections=SECTIONS, refresh=False, credentials=None):
+    """Fetch every child of the account; credentials (username, password, subdomain) allow --parallel-children."""
+    days_to_fetch = week_days(target_date)
     result = {
         "students": [],
-        "weekStart": start_of_week.isoformat(),
-        "weekDates": [d.isoformat() for d in days_to_fetch]
+        "weekStart": days_to_fetch[0].isoformat(),
+        "weekDates": [d.isoformat() for d in days_to_fetch],
+        "sections": list(sections),
     }
 
     try:
         # Check if we found children during login
         children = getattr(edupage, "children", [])
-        
+
         if not children:
-            print("DEBUG: No children profiles found. Attempting fallback to main profile.", file=sys.stderr)
+            log.debug("no children profiles, using main profile")
             # Try fetching as "self" (might fail for parents, but works for students)
             children = [{"id": None, "name": "Myself"}]
-            
-        for child in children:
-            child_data = fetch_child_data(edupage, child, days_to_fetch)
-            result["students"].append(child_data)
-            
+
+        if PARALLEL_CHILDREN and credentials and len(children) > 1:
+            result["students"] = fetch_children_parallel(edupage, children, days_to_fetch, sections, refresh, credentials)
+        else:
+            for child in children:
+                child_data = fetch_child_data(edupage, child, days_to_fetch, sections, refresh)
+                result["students"].append(child_data)
+
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
-        print(f"DEBUG: Internal Error Traceback:\n{error_details}", file=sys.stderr)
-        print(json.dumps({"error": f"Internal Error: {str(e)}", "traceback": error_details}))
+        log.error("internal error", exc_info=True)
+        raise BridgeError(f"Internal Error: {str(e)}", error_details) from e
+
+    return result
+
+
+# -----------------
+# PARALLEL CHILDREN
+# -----------------
+# fetch_child_data switches the server-side child context, so children can
+# only run concurrently on separate server sessions. Opt-in
+# (--parallel-children or EDUPAGE_PARALLEL_CHILDREN=1): the first child runs
+# on the account's session, every other child on a session of its own, with
+# its own login, kept in the session store per child. Only the first run
+# pays for the extra logins.
+PARALLEL_CHILDREN = os.environ.get("EDUPAGE_PARALLEL_CHILDREN") == "1"
+
+
+def child_session_key(username, subdomain, child):
+    return [username, subdomain, "child", str(child["id"])]
+
+
+def fetch_child_on_own_session(credentials, child, days_to_fetch, sections, refresh, metrics, timeline=None):
+    """fetch_child_data on the child's stored session, logging it in (again) when needed.
+
+    timeline is the account's freshly loaded message feed, so the child
+    sessions don't each reload it.
+    """
+    username, password, subdomain = credentials
+    account_key = child_session_key(username, subdomain, child)
+    password_hash = _password_hash(password)
+
+    def prepare(child_edupage):
+        watch_auth(child_edupage)
+        watch_captures(child_edupage)
+        if timeline is not None:
+            child_edupage.timeline_data = timeline
+            child_edupage.timeline_stale = False
+
+    child_edupage = restore_session(account_key, password_hash)
+    if child_edupage is not None:
+        if metrics is not None:
+            attach_metrics(child_edupage, metrics)
+        prepare(child_edupage)
+        expected = getattr(child_edupage, "privilege_errors_expected", False)
+        student = fetch_child_data(child_edupage, child, days_to_fetch, sections, refresh)
+        if not child_edupage.auth_lost and (expected or not child_edupage.privilege_rejected):
+            save_session(child_edupage, account_key, password_hash, expected)
+            return student
+        log.info("stored child session expired, logging in again", child_id=child["id"])
+        _session_store.delete(account_key)
+
+    child_edupage = login_edupage(username, password, subdomain, metrics)
+    prepare(child_edupage)
+    try:
+        return fetch_child_data(child_edupage, child, days_to_fetch, sections, refresh)
+    finally:
+        child_edupage.privilege_errors_expected = child_edupage.privilege_rejected
+        save_session(child_edupage, account_key, password_hash, child_edupage.privilege_rejected)
+
+
+def fetch_children_parallel(edupage, children, days_to_fetch, sections, refresh, credentials):
+    """Fetch every child on a server session of its own, results in children order."""
+    # The message feed is the same for all children, load it once up front
+    if "messages" in sections and getattr(edupage, "timeline_stale", False) and (
+        refresh or any(cached_section(edupage, child, "messages", days_to_fetch) is None for child in children)
+    ):
+        refresh_timeline(edupage)
+    timeline = None if getattr(edupage, "timeline_stale", False) else getattr(edupage, "timeline_data", None)
+
+    log.debug("fetching children in parallel", children=len(children))
+    metrics = getattr(edupage, "metrics", None)
+    with ThreadPoolExecutor(max_workers=len(children)) as pool:
+        first = pool.submit(fetch_child_data, edupage, children[0], days_to_fetch, sections, refresh)
+        others = [
+            pool.submit(fetch_child_on_own_session, credentials, child, days_to_fetch, sections, refresh, metrics, timeline)
+            for child in children[1:]
+        ]
+        students = [first.result()]
+        for child, future in zip(children[1:], others):
+            try:
+                students.append(future.result())
+            except BridgeError as e:
+                # No session of its own (captcha, ...): take turns on the account's
+                log.warning("child session login failed, fetching on the account session", child_id=child["id"], error=e)
+                students.append(None)
+    return [
+        student if student is not None else fetch_child_data(edupage, child, days_to_fetch, sections, refresh)
+        for child, student in zip(children, students)
+    ]
+
+
+# -----------------
+# DAEMON MODE (--serve)
+# -----------------
+# Keeps the interpreter, the patched classes and logged-in Edupage sessions
+# warm between requests, so only the first request per account pays for
+# the imports and the login round trips.
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _account_entry(username, subdomain):
+    with _sessions_lock:
+        key = (username, subdomain)
+        if key not in _sessions:
+            _sessions[key] = {"lock": threading.Lock(), "edupage": None, "password": None}
+        return _sessions[key]
+
+
+def fetch_for_account(username, password, subdomain, target_date, metrics=None, sections=SECTIONS, refresh=False):
+    """Run the bridge for one account, reusing a warm or stored session when possible.
+
+    Only the given sections are fetched, from the section cache where they
+    are fresh unless `refresh` is set. Timings and request counts of the run
+    are collected into `metrics` if given.
+    """
+    entry = _account_entry(username, subdomain)
+    account_key = [username, subdomain]
+    password_hash = _password_hash(password)
+
+    # One run per account at a time: fetch_child_data switches the
+    # server-side child context of the shared session.
+    with entry["lock"]:
+        edupage = entry["edupage"] if _same_password(entry["password"], password_hash) else None
+        if edupage is not None:
+            log.debug("reusing warm session", subdomain=subdomain)
+            edupage.timeline_stale = True
+        else:
+            edupage = restore_session(account_key, password_hash)
+
+        if edupage is not None:
+            if metrics is not None:
+                attach_metrics(edupage, metrics)
+            watch_auth(edupage)
+            watch_captures(edupage)
+            expected = getattr(edupage, "privilege_errors_expected", False)
+            try:
+                result = fetch_all_children(edupage, target_date, sections, refresh, (username, password, subdomain))
+                if not edupage.auth_lost and (expected or not edupage.privilege_rejected):
+                    entry.update(edupage=edupage, password=password_hash)
+                    # Cookies may have been rotated during the run
+                    save_session(edupage, account_key, password_hash, expected)
+                    return result
+                log.info("stored session expired, logging in again", subdomain=subdomain)
+            except BridgeError as e:
+                log.info("reused session failed, logging in again", subdomain=subdomain, error=e)
+            _session_store.delete(account_key)
+
+        entry["edupage"] = None
+        edupage = login_edupage(username, password, subdomain, metrics)
+        watch_auth(edupage)
+        entry.update(edupage=edupage, password=password_hash)
+        try:
+            return fetch_all_children(edupage, target_date, sections, refresh, (username, password, subdomain))
+        finally:
+            edupage.privilege_errors_expected = edupage.privilege_rejected
+            save_session(edupage, account_key, password_hash, edupage.privilege_rejected)
+
+
+# Stale-while-revalidate ("allowStale" in /fetch): the daemon keeps the last
+# good result per account, week and sections on disk and answers with it
+# right away, flagged with "stale" and its "age" in seconds. Snapshots older
+# than SNAPSHOT_REFRESH_AFTER are updated by a background run meanwhile; if
+# that fails the snapshot stays and "refreshError" says why. Sections whose
+# fetch failed (failedSections) keep the snapshot's data; sections that were
+# fetched and really are empty replace it.
+SNAPSHOT_REFRESH_AFTER = int(os.environ.get("EDUPAGE_SNAPSHOT_REFRESH_AFTER", 60))
+SNAPSHOT_TTL = int(os.environ.get("EDUPAGE_SNAPSHOT_TTL", 7 * 24 * 3600))
+_snapshot_store = BridgeCache("snapshots", SNAPSHOT_TTL)
+_refresh_errors = {}
+_refresh_errors_lock = threading.Lock()
+
+
+def snapshot_key(username, subdomain, target_date, sections):
+    return [username, subdomain, week_days(target_date)[0].isoformat(), list(sections)]
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving meanwhile share its outcome."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def running(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, func):
+        """Return (result of func, whether it came from another caller's call)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], True
+        try:
+            call["result"] = func()
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+        return call["result"], False
+
+
+# Identical fetches in flight at the same time, from several screens, a
+# background refresh or the scheduler, run once: the first caller fetches
+# and the others wait for its result. The password hash is part of the key,
+# nobody shares a run they could not have started themselves. So is refresh:
+# a refresh after a cache clear must not get the cached sections of a
+# running background refresh.
+_fetch_flights = SingleFlight()
+
+
+def flight_key(username, password, subdomain, target_date, sections, refresh=False):
+    return json.dumps(snapshot_key(username, subdomain, target_date, sections) + [_password_hash(password), bool(refresh)])
+
+
+def coalesced_fetch(username, password, subdomain, target_date, metrics=None, sections=SECTIONS, refresh=False):
+    """fetch_and_snapshot, joining an identical fetch that is already running."""
+    key = flight_key(username, password, subdomain, target_date, sections, refresh)
+    result, shared = _fetch_flights.do(
+        key, lambda: fetch_and_snapshot(username, password, subdomain, target_date, metrics, sections, refresh),
+    )
+    if shared:
+        log.info("joined running fetch", subdomain=subdomain, week=week_days(target_date)[0])
+    return result
+
+
+def fetch_and_snapshot(username, password, subdomain, target_date, metrics=None, sections=SECTIONS, refresh=False):
+    """fetch_for_account, keeping the result as the snapshot of its week."""
+    result = fetch_for_account(username, password, subdomain, target_date, metrics, sections, refresh)
+    key = snapshot_key(username, subdomain, target_date, sections)
+    password_hash = _password_hash(password)
+    previous = _snapshot_store.get(key)
+    if previous and _same_password(previous.get("password"), password_hash):
+        result = keep_snapshot_sections(result, previous["result"], sections)
+    _snapshot_store.set(key, {"password": password_hash, "result": result})
+    with _refresh_errors_lock:
+        _refresh_errors.pop(json.dumps(key), None)
+    return result
+
+
+def keep_snapshot_sections(result, previous, sections):
+    """Copy of result with the sections whose fetch failed filled in from the previous snapshot.
+
+    Sections that were fetched and really are empty stay empty.
+    """
+    old_students = {s.get("studentId"): s for s in previous.get("students", [])}
+    students = []
+    for student in result.get("students", []):
+        old = old_students.get(student.get("studentId"), {})
+        failed = student.get("failedSections") or []
+        kept = [name for name in failed if name in sections and old.get(name)]
+        if kept:
+            log.info("kept snapshot sections", student_id=student.get("studentId"), sections=kept)
+            student = dict(student, **{name: old[name] for name in kept})
+            still_failed = [name for name in failed if name not in kept]
+            if still_failed:
+                student["failedSections"] = still_failed
+            else:
+                del student["failedSections"]
+        students.append(student)
+    return dict(result, students=students)
+
+
+def serve_snapshot(username, password, subdomain, target_date, sections):
+    """The stored snapshot with stale/age, or None; refreshes it in the background when old."""
+    key = snapshot_key(username, subdomain, target_date, sections)
+    entry, age = _snapshot_store.get_with_age(key)
+    if not entry or not _same_password(entry.get("password"), _password_hash(password)):
+        return None
+    stale = age > SNAPSHOT_REFRESH_AFTER
+    if stale and not _fetch_flights.running(flight_key(username, password, subdomain, target_date, sections)):
+        threading.Thread(
+            target=refresh_snapshot, args=(username, password, subdomain, target_date, sections),
+            name="edupage-refresh", daemon=True,
+        ).start()
+    result = dict(entry["result"], stale=stale, age=round(age))
+    with _refresh_errors_lock:
+        error = _refresh_errors.get(json.dumps(key))
+    if error:
+        result["refreshError"] = error
+    return result
+
+
+def refresh_snapshot(username, password, subdomain, target_date, sections):
+    """Update a snapshot, or wait for the fetch of it that is running already."""
+    key = snapshot_key(username, subdomain, target_date, sections)
+    metrics = BridgeMetrics()
+    try:
+        coalesced_fetch(username, password, subdomain, target_date, metrics, sections)
+        log.info("snapshot refreshed", subdomain=subdomain, week=key[2])
+    except Exception as e:
+        log.warning("snapshot refresh failed", subdomain=subdomain, week=key[2], error=e)
+        with _refresh_errors_lock:
+            _refresh_errors[json.dumps(key)] = str(e)
+    finally:
+        if METRICS_FILE:
+            metrics.write_prometheus(METRICS_FILE)
+
+
+# -----------------
+# REFRESH SCHEDULER (--schedule)
+# -----------------
+# Refreshes the snapshots of every account the daemon has answered, at a
+# rate that follows the school day: every SCHEDULE_PEAK seconds within
+# SCHEDULE_WINDOW of a lesson start (periods table), every SCHEDULE_DAY
+# during the rest of the school day, every SCHEDULE_NIGHT before and after
+# it and every SCHEDULE_IDLE on weekends and holidays. The section TTLs still
+# decide which sections actually go upstream. Passwords stay in memory only;
+# accounts nobody asked for in SCHEDULE_FORGET seconds are dropped.
+SCHEDULE = os.environ.get("EDUPAGE_SCHEDULE") == "1"
+SCHEDULE_PEAK = int(os.environ.get("EDUPAGE_SCHEDULE_PEAK", 2 * 60))
+SCHEDULE_DAY = int(os.environ.get("EDUPAGE_SCHEDULE_DAY", 15 * 60))
+SCHEDULE_NIGHT = int(os.environ.get("EDUPAGE_SCHEDULE_NIGHT", 3 * 3600))
+SCHEDULE_IDLE = int(os.environ.get("EDUPAGE_SCHEDULE_IDLE", 6 * 3600))
+SCHEDULE_WINDOW = int(os.environ.get("EDUPAGE_SCHEDULE_WINDOW", 10 * 60))
+SCHEDULE_FORGET = int(os.environ.get("EDUPAGE_SCHEDULE_FORGET", 24 * 3600))
+# School day assumed until a timetable of the school has been indexed
+DEFAULT_PERIODS = [(7 * 60 + 30, 15 * 60 + 30)]
+
+
+def _minutes(hhmm):
+    hours, _, minutes = str(hhmm or "").partition(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def school_periods(subdomain):
+    """Sorted (start, end) minutes of the day from the school's indexed periods table."""
+    with _timetable_indexes_lock:
+        indexes = [index for (sub, _), (_, index) in _timetable_indexes.items() if sub == subdomain]
+    periods = set()
+    for index in indexes:
+        for period in index.periods.values():
+            try:
+                periods.add((_minutes(period.get("starttime")), _minutes(period.get("endtime"))))
+            except ValueError:
+                continue
+    return sorted(periods) or DEFAULT_PERIODS
+
+
+def schedule_interval(now, periods, holiday):
+    """Seconds from `now` (a datetime) until the next scheduled refresh."""
+    minute = now.hour * 60 + now.minute + now.second / 60
+    day_start = periods[0][0] - 60
+    day_end = max(end for _, end in periods) + 60
+    window = SCHEDULE_WINDOW / 60
+    # Never sleep past the start of the next school day
+    until_tomorrow = (24 * 60 - minute + day_start) * 60
+    if holiday or now.weekday() >= 5:
+        return max(SCHEDULE_PEAK, min(SCHEDULE_IDLE, until_tomorrow))
+    if minute < day_start:
+        return max(SCHEDULE_PEAK, min(SCHEDULE_NIGHT, (day_start - minute) * 60))
+    if minute > day_end:
+        return max(SCHEDULE_PEAK, min(SCHEDULE_NIGHT, until_tomorrow))
+    if any(abs(minute - start) <= window for start, _ in periods):
+        return SCHEDULE_PEAK
+    interval = SCHEDULE_DAY
+    upcoming = [start - window for start, _ in periods if start - window > minute]
+    if upcoming:
+        interval = min(interval, (min(upcoming) - minute) * 60)
+    return max(SCHEDULE_PEAK, interval)
+
+
+class RefreshScheduler:
+    """Keeps the snapshots of the served accounts fresh, see REFRESH SCHEDULER."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def register(self, username, password, subdomain, date_str, sections):
+        """Schedule (or keep scheduling) an account after it was answered."""
+        # Every day of a week shares the week's snapshot, so one job per
+        # week, keyed by its Monday like snapshot_key. No date follows today.
+        week = week_days(parse_target_date(date_str))[0].isoformat() if date_str else None
+        key = json.dumps([username, subdomain, week, list(sections)])
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                job = self._jobs[key] = {
+                    "username": username, "subdomain": subdomain, "date": week, "sections": sections,
+                }
+                job["next_run"] = now + self.interval(job)
+                log.info("scheduled account", subdomain=subdomain, date=week, next_run=round(job["next_run"] - now))
+            job.update(password=password, last_seen=now)
+        self._wakeup.set()
+
+    def interval(self, job):
+        entry = _sessions.get((job["username"], job["subdomain"])) or {}
+        school = getattr(entry.get("edupage"), "subdomain", None) or job["subdomain"]
+        now = datetime.datetime.now()
+        return schedule_interval(now, school_periods(school), is_school_holiday(now.date(), school))
+
+    def due_jobs(self):
+        """Jobs to run now, and seconds until the next one is due."""
+        now = time.time()
+        today = datetime.date.today()
+        with self._lock:
+            for key, job in list(self._jobs.items()):
+                week_over = job["date"] and week_days(parse_target_date(job["date"]))[-1] < today
+                if now - job["last_seen"] > SCHEDULE_FORGET or week_over:
+                    log.info("unscheduled account", subdomain=job["subdomain"], date=job["date"])
+                    del self._jobs[key]
+            due = [job for job in self._jobs.values() if job["next_run"] <= now]
+            pending = [job["next_run"] - now for job in self._jobs.values() if job["next_run"] > now]
+        return due, min(pending, default=3600)
+
+    def run(self):
+        while True:
+            due, wait = self.due_jobs()
+            for job in due:
+                target_date = parse_target_date(job["date"])
+                refresh_snapshot(job["username"], job["password"], job["subdomain"], target_date, job["sections"])
+                job["next_run"] = time.time() + self.interval(job)
+                log.debug("next scheduled refresh", subdomain=job["subdomain"], seconds=round(job["next_run"] - time.time()))
+            if not due:
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+
+    def start(self):
+        threading.Thread(target=self.run, name="edupage-scheduler", daemon=True).start()
+
+
+_scheduler = None
+
+
+def serve(host, port):
+    global _scheduler
+
+    if SCHEDULE:
+        _scheduler = RefreshScheduler()
+        _scheduler.start()
+
+    class BridgeHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload, default=str).encode("utf8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"ok": True, "sessions": len(_sessions)})
+            else:
+                self._reply(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if self.path != "/fetch":
+                self._reply(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                req = json.loads(self.rfile.read(length) or b"{}")
+            except (ValueError, json.JSONDecodeError):
+                self._reply(400, {"error": "Invalid JSON body"})
+                return
+            if not isinstance(req, dict):
+                self._reply(400, {"error": "JSON body must be an object"})
+                return
+
+            username = req.get("username")
+            password = req.get("password")
+            if not username or not password:
+                self._reply(400, {"error": "Missing credentials"})
+                return
+
+            metrics = BridgeMetrics()
+            subdomain = req.get("subdomain") or "login1"
+            allow_stale = bool(req.get("allowStale"))
+            refresh = bool(req.get("refresh"))
+            try:
+                target_date = parse_target_date(req.get("date"))
+                sections = parse_sections(req.get("sections"))
+                result = None
+                if allow_stale and not refresh:
+                    result = serve_snapshot(username, password, subdomain, target_date, sections)
+                if result is None:
+                    result = coalesced_fetch(username, password, subdomain, target_date, metrics, sections, refresh)
+                    if allow_stale:
+                        result = dict(result, stale=False, age=0)
+            except BridgeError as e:
+                # Same shape main() prints, the caller checks data.error
+                self._reply(200, e.to_dict())
+                return
+            except Exception as e:
+                self._reply(500, {"error": f"Internal Error: {str(e)}"})
+                return
+            finally:
+                if METRICS_FILE:
+                    metrics.write_prometheus(METRICS_FILE)
+            if _scheduler is not None:
+                _scheduler.register(username, password, subdomain, req.get("date"), sections)
+            if req.get("metrics"):
+                result = dict(result, _metrics=metrics.to_dict())
+            self._reply(200, result)
+
+        def log_message(self, format, *args):
+            log.debug("request", line=format % args)
+
+    server = ThreadingHTTPServer((host, port), BridgeHandler)
+    server.daemon_threads = True
+    # index.js waits for this line before sending requests
+    print(f"READY {host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if _recording is not None:
+            _recording.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Edupage bridge for the FamilyHub dashboard")
+    parser.add_argument("username", nargs="?")
+    parser.add_argument("password", nargs="?")
+    parser.add_argument("subdomain", nargs="?", default="login1")
+    parser.add_argument("date", nargs="?", help="Any day of the wanted week (YYYY-MM-DD)")
+    parser.add_argument("--serve", action="store_true", help="Run as long-lived HTTP daemon")
+    parser.add_argument("--schedule", action="store_true", help="With --serve, refresh served accounts on a school-day schedule")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("EDUPAGE_BRIDGE_PORT", 3011)))
+    parser.add_argument("--parallel-children", action="store_true", help="Fetch children concurrently, each on its own session")
+    parser.add_argument("--concurrent-sections", action="store_true", help="Overlap the upstream calls of one child")
+    parser.add_argument("--timetable-overlay", action="store_true",
+                        help="Build timetables from the regular plan plus the day's substitutions")
+    parser.add_argument("--hedge", action="store_true", help="Race the timetable strategies while probing")
+    parser.add_argument("--sections", help="Comma separated subset of timetable,homework,grades,messages (default: all)")
+    parser.add_argument("--refresh", action="store_true", help="Fetch every section upstream, even if it is cached")
+    parser.add_argument("--metrics", action="store_true", help="Add stage timings and request counts as _metrics")
+    parser.add_argument("--metrics-file", help="Write the metrics of each run here in Prometheus text format")
+    parser.add_argument("--capture-dir", help="Keep gzipped snapshots of all upstream responses here")
+    parser.add_argument("--record", metavar="FILE", help="Save all upstream exchanges into this cassette")
+    parser.add_argument("--replay", metavar="FILE", help="Answer upstream requests from this cassette")
+    parser.add_argument("--replay-latency-ms", type=float, help="Delay added to every replayed response")
+    parser.add_argument("--base-url", help="Send edupage.org requests to this server instead, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], type=str.upper,
+                        help="stderr log level (default: EDUPAGE_LOG_LEVEL or WARNING)")
+    args = parser.parse_args()
+
+    if args.log_level:
+        configure_logging(args.log_level)
+    log.debug("starting", version="1.6", serve=args.serve)
+
+    global PARALLEL_CHILDREN, CONCURRENT_SECTIONS, METRICS_FILE, _capture_store
+    global _recording, _replay, REPLAY_LATENCY_MS, BASE_URL, SCHEDULE, TIMETABLE_OVERLAY, HEDGE
+    PARALLEL_CHILDREN = PARALLEL_CHILDREN or args.parallel_children
+    SCHEDULE = SCHEDULE or args.schedule
+    TIMETABLE_OVERLAY = TIMETABLE_OVERLAY or args.timetable_overlay
+    HEDGE = HEDGE or args.hedge
+    CONCURRENT_SECTIONS = CONCURRENT_SECTIONS or args.concurrent_sections
+    METRICS_FILE = args.metrics_file or METRICS_FILE
+    if args.capture_dir:
+        _capture_store = CaptureStore(args.capture_dir)
+    if args.record:
+        _recording = Cassette(args.record)
+    if args.replay:
+        _replay = Cassette.load(args.replay)
+    if args.replay_latency_ms is not None:
+        REPLAY_LATENCY_MS = args.replay_latency_ms
+    if args.base_url:
+        BASE_URL = args.base_url.rstrip("/")
+
+    if args.serve:
+        serve(args.host, args.port)
+        return
+
+    if not args.username or not args.password:
+        print(json.dumps({"error": "Missing credentials"}))
         sys.exit(1)
 
+    metrics = BridgeMetrics()
+    try:
+        target_date = parse_target_date(args.date)
+        sections = parse_sections(args.sections)
+        if _recording is not None:
+            _recording.meta.update(date=target_date.isoformat(), subdomain=args.subdomain)
+        result = fetch_for_account(args.username, args.password, args.subdomain, target_date, metrics, sections, args.refresh)
+    except BridgeError as e:
+        print(json.dumps(e.to_dict()))
+        sys.exit(1)
+    finally:
+        if METRICS_FILE:
+            metrics.write_prometheus(METRICS_FILE)
+        if _recording is not None:
+            _recording.save()
+
+    if args.metrics:
+        result["_metrics"] = metrics.to_dict()
     print(json.dumps(result, default=str))
 
 
 if __name__ == "__main__":
     main()
-
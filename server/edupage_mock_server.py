@@ -0,0 +1,472 @@
+"""Local stand-in for edupage.org, for end-to-end tests without internet access.
+
+Serves the endpoints edupage_bridge_v2.py calls (login, dashboard, eb.php,
+gcall, ttviewer.js, regulartt.js, substitution viewer.js, /znamky/,
+switchchild/edupageChange, /user/) for one synthetic school from edupage_synth.py, with optional
+latency, failures and captchas:
+
+    python edupage_mock_server.py --port 8765 --latency-ms 120 --fail-rate 0.02
+    python edupage_bridge_v2.py parent secret login1 2026-10-14 --base-url http://127.0.0.1:8765
+
+or EDUPAGE_BASE_URL=http://127.0.0.1:8765 for the --serve daemon. Any
+username logs in (with --password only that password); the account is the
+parent of --children students. gcall answers "Insuficient privileges" like
+it does for most parent accounts, so timetables come from ttviewer.js and
+regulartt.js; with --gcall-ok it returns the date plans of the synthetic
+timetable instead, shaped like edupage.org's: plan items with subject,
+teacher and classroom ids that the userhome "dbi" resolves. GET /__stats returns request counters per endpoint, POST
+/__stats resets them.
+"""
+import argparse
+import datetime
+import json
+import random
+import secrets
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from edupage_synth import synth_grades_page, synth_timetable
+
+MESSAGES = [
+    "Liebe Eltern, der Elternabend der Klasse findet am Donnerstag um 18 Uhr statt.",
+    "Am Freitag entfällt die 6. Stunde wegen einer Lehrerkonferenz.",
+    "Bitte denken Sie an die Unterschrift für den Wandertag.",
+    "Die Fotos vom Sportfest können ab Montag im Sekretariat bestellt werden.",
+    "Erinnerung: Die Bibliothek ist in dieser Woche nur vormittags geöffnet.",
+]
+
+
+# Monday of the week the synthetic timetable starts, A/B weeks count from it
+TT_DATEFROM = datetime.date(2026, 9, 1)
+
+
+class MockSchool:
+    """The synthetic data served, rendered once at startup."""
+
+    def __init__(self, args):
+        response, students = synth_timetable(args.students, args.cards, args.seed)
+        step = max(1, len(students) // max(1, args.children))
+        self.children = students[::step][:args.children]
+        self.regulartt = json.dumps(response).encode("utf8")
+        self.ttviewer = json.dumps({"r": {"regular": {"timetables": [
+            {"tt_num": "1", "year": 2026, "text": "Stundenplan 2026/27", "datefrom": TT_DATEFROM.isoformat(), "hidden": False},
+        ]}}}).encode("utf8")
+        self.tables = {t["id"]: {r["id"]: r for r in t["data_rows"]} for t in response["r"]["dbiAccessorRes"]["tables"]}
+        self.students = {s["id"]: s for s in students}
+        self.znamky = synth_grades_page([c["id"] for c in self.children], args.grades, args.seed).encode("utf8")
+        self.items = self.timeline(args.messages, random.Random(args.seed))
+        self.seed = args.seed
+
+    def timeline(self, count, rng):
+        start = datetime.datetime(2026, 10, 1, 7, 30)
+        items = []
+        for i in range(count):
+            stamp = (start + datetime.timedelta(hours=7 * i)).strftime("%Y-%m-%d %H:%M:%S")
+            text = rng.choice(MESSAGES)
+            items.append({
+                "timelineid": str(1000 + i), "typ": "sprava", "timestamp": stamp,
+                "cas_pridania": stamp, "cas_udalosti": stamp, "text": text,
+                "data": json.dumps({"messageContent": text}), "user_meno": "Eltern",
+                "vlastnik_meno": "Schulleitung", "pocet_reakcii": "0", "removed": "0",
+                "reakcia_na": "", "ineid": "",
+            })
+        return items
+
+    def date_plan(self, student_id, day):
+        """gcall plan of a student for one day: edupage's plan items, with ids instead of names."""
+        student = self.students.get(student_id)
+        if student is None or day.weekday() > 4:
+            return []
+        t = self.tables
+        lesson_ids = {
+            lid for lid, lesson in t["lessons"].items()
+            if student_id in lesson["studentids"] or (not lesson["studentids"] and student["classid"] in lesson["classids"])
+        }
+        anchor = TT_DATEFROM - datetime.timedelta(days=TT_DATEFROM.weekday())
+        week = (day - anchor).days // 7 % 2
+        plan = []
+        for card in t["cards"].values():
+            if card["lessonid"] not in lesson_ids or card["days"][day.weekday()] != "1" or card["weeks"][week] != "1":
+                continue
+            lesson = t["lessons"][card["lessonid"]]
+            period = t["periods"][card["period"]]
+            plan.append({
+                "type": "lesson", "uniperiod": period["period"], "date": day.isoformat(),
+                "starttime": period["starttime"], "endtime": period["endtime"],
+                "subjectid": lesson["subjectid"], "classids": lesson["classids"],
+                "groupnames": lesson["groupnames"], "teacherids": lesson["teacherids"],
+                "classroomids": card["classroomids"], "durationperiods": lesson["durationperiods"],
+            })
+        plan.sort(key=lambda item: item["starttime"])
+        return plan
+
+    def dbi(self):
+        """The userhome "dbi" the library resolves plan item ids with."""
+        t = self.tables
+        return {
+            "subjects": {i: {"name": r["name"], "short": r["short"]} for i, r in t["subjects"].items()},
+            "teachers": {
+                i: {"firstname": r["name"].rpartition(" ")[0], "lastname": r["name"].rpartition(" ")[2], "short": r["short"], "classroomid": ""}
+                for i, r in t["teachers"].items()
+            },
+            "classrooms": {i: {"name": r["name"], "short": r["short"]} for i, r in t["classrooms"].items()},
+            "classes": {
+                i: {"name": r["name"], "short": r["short"], "grade": "", "teacherid": "", "teacher2id": "", "classroomid": ""}
+                for i, r in t["classes"].items()
+            },
+        }
+
+    def class_day(self, class_id, day):
+        """(period number, subject, teacher) of the lessons a class has on day, group lessons included."""
+        t = self.tables
+        lessons = {lid: lesson for lid, lesson in t["lessons"].items() if class_id in lesson["classids"]}
+        return sorted(
+            (int(t["periods"][card["period"]]["name"]), t["subjects"][lessons[card["lessonid"]]["subjectid"]]["name"],
+             t["teachers"][lessons[card["lessonid"]]["teacherids"][0]]["name"])
+            for card in t["cards"].values()
+            if card["lessonid"] in lessons and day.weekday() < 5 and card["days"][day.weekday()] == "1"
+        )
+
+    def substitutions(self, date_str):
+        """getSubstViewerDayDataHtml page: a few seeded changes per child class and day."""
+        rng = random.Random(f"{self.seed}-{date_str}")
+        day = datetime.date.fromisoformat(date_str)
+        sections = []
+        for class_id, class_name in sorted({(c["classid"], c["className"]) for c in self.children}):
+            lessons = self.class_day(class_id, day)
+            rows = []
+            for _ in range(rng.randint(0, 2) if lessons else 0):
+                period, subject, teacher = rng.choice(lessons)
+                action, text = rng.choice([
+                    ("remove", f"({subject}) - Entfällt"),
+                    ("change", f"({teacher.split()[-1]}) ➔ Vertretung, Raum R105"),
+                    ("add", "Förderunterricht"),
+                ])
+                if action == "add":
+                    period = rng.randint(1, 8)
+                rows.append(
+                    f'<div class="row {action}"><div class="period"><span class="print-font-resizable">{period}</span></div>'
+                    f'<div class="info"><span class="print-font-resizable">{text}</span></div></div>'
+                )
+            if rows:
+                sections.append(
+                    '<div class="section print-nobreak"><div class="header"><span class="print-font-resizable">'
+                    f'{class_name}</span></div><div class="rows">{"".join(rows)}</div></div>'
+                )
+        page = f'<div class="substviewer"><span class="print-font-resizable">Abwesende Lehrer: </span>{"".join(sections)}</div>'
+        return json.dumps({"r": page}, ensure_ascii=False).encode("utf8")
+
+    def user_page(self, subdomain, username, gsh):
+        """The /user/ page: child switcher, gsechash and the userhome() data."""
+        buttons = "".join(
+            f'<a class="edubarProfileChildBtn" data-sid="{c["id"]}"><span class="userName">{c["name"]}</span></a>'
+            for c in self.children
+        )
+        userhome = json.dumps({
+            "userid": f"Rodic{abs(hash(username)) % 100000}",
+            "items": self.items,
+            "userProps": {},
+            "dp": {"year": 2026},
+            "dbi": self.dbi(),
+        }, ensure_ascii=False)
+        # login1 logins read the school subdomain from the end of the first comment
+        return (
+            f"<!DOCTYPE html><!-- {subdomain}-->\n<html><head><title>EduPage</title></head><body>\n"
+            f'<div id="edubar">{buttons}</div>\n'
+            f'<script>ASC.gsechash="{gsh}";</script>\n'
+            f"<script>$j('#userhome').userhome({userhome});\nASC.init();</script>\n"
+            "</body></html>"
+        ).encode("utf8")
+
+
+class MockState:
+    """Sessions, injected faults and request counters shared by all handler threads."""
+
+    def __init__(self, args):
+        self.args = args
+        self.school = MockSchool(args)
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.stats = {}
+
+    def chance(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+    def latency(self):
+        with self.lock:
+            jitter = self.rng.uniform(-self.args.jitter_ms, self.args.jitter_ms)
+        return max(0.0, self.args.latency_ms + jitter) / 1000.0
+
+    def new_session(self, username):
+        sid = secrets.token_hex(16)
+        with self.lock:
+            self.sessions[sid] = {"username": username, "gsh": secrets.token_hex(4), "created": time.time(), "child": None}
+        return sid
+
+    def session(self, sid):
+        with self.lock:
+            state = self.sessions.get(sid)
+            if state and self.args.session_ttl and time.time() - state["created"] > self.args.session_ttl:
+                del self.sessions[sid]
+                return None
+            return state
+
+    def count(self, endpoint, status, nbytes):
+        with self.lock:
+            entry = self.stats.setdefault(endpoint, {"count": 0, "failed": 0, "bytes": 0})
+            entry["count"] += 1
+            entry["bytes"] += nbytes
+            if status >= 400:
+                entry["failed"] += 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so connection reuse in the bridge is measured too
+    protocol_version = "HTTP/1.1"
+    server_version = "EdupageMock/1.0"
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.state.args.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def handle_request(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        endpoint = parts.path + (f"?__func={query['__func'][0]}" if "__func" in query else "")
+        if parts.path == "/__stats":
+            return self.stats(method)
+
+        host = (self.headers.get("Host") or "").split(":")[0]
+        subdomain = host.split(".")[0] if host.endswith(".edupage.org") else self.state.args.subdomain
+        cookies = dict(
+            c.strip().split("=", 1) for c in (self.headers.get("Cookie") or "").split(";") if "=" in c
+        )
+        self.sid = cookies.get("PHPSESSID")
+
+        delay = self.state.latency()
+        if delay:
+            time.sleep(delay)
+        fail_paths = self.state.args.fail_paths
+        if (not fail_paths or any(parts.path.startswith(p) for p in fail_paths)) and self.state.chance(self.state.args.fail_rate):
+            return self.reply(endpoint, self.state.args.fail_status, b"Service Unavailable")
+
+        route = ROUTES.get((method, parts.path))
+        if route is None:
+            return self.reply(endpoint, 404, b"Not Found")
+        route(self, endpoint, subdomain, query, body)
+
+    def reply(self, endpoint, status, content, content_type="text/html; charset=utf-8", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+        self.state.count(endpoint, status, len(content))
+
+    def redirect(self, endpoint, location, headers=()):
+        self.reply(endpoint, 302, b"", headers=(("Location", location),) + tuple(headers))
+
+    def stats(self, method):
+        with self.state.lock:
+            if method == "POST":
+                self.state.stats.clear()
+            content = json.dumps(self.state.stats, indent=2).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def logged_in(self, endpoint):
+        """The session of this request, after redirecting to the login page if there is none."""
+        state = self.state.session(self.sid) if self.sid else None
+        if state is None:
+            self.redirect(endpoint, "/login/?cmd=MainLogin")
+        return state
+
+    # --- Routes ---
+
+    def login_page(self, endpoint, subdomain, query, body):
+        token = secrets.token_hex(8)
+        content = f'<html><body><form id="login"><script>var cfg = {{"csrftoken":"{token}"}};</script></form></body></html>'
+        self.reply(endpoint, 200, content.encode("utf8"))
+
+    def login(self, endpoint, subdomain, query, body):
+        form = parse_qs(body.decode("utf8"))
+        username = form.get("username", [""])[0]
+        password = form.get("password", [""])[0]
+        if self.state.chance(self.state.args.captcha_rate):
+            return self.redirect(endpoint, "/login/?cmd=MainLogin&cap=1")
+        if not username or (self.state.args.password is not None and password != self.state.args.password):
+            return self.redirect(endpoint, "/login/?cmd=MainLogin&bad=1")
+        sid = self.state.new_session(username)
+        cookie = f"PHPSESSID={sid}; path=/; domain=.edupage.org; HttpOnly"
+        school = self.state.args.subdomain
+        self.redirect(endpoint, f"https://{school}.edupage.org/user/", headers=(("Set-Cookie", cookie),))
+
+    def user_page(self, endpoint, subdomain, query, body):
+        state = self.logged_in(endpoint)
+        if state:
+            content = self.state.school.user_page(self.state.args.subdomain, state["username"], state["gsh"])
+            self.reply(endpoint, 200, content)
+
+    def switch_child(self, endpoint, subdomain, query, body):
+        state = self.logged_in(endpoint)
+        if state:
+            wanted = query.get("studentid", [""])[0].lstrip("-")
+            children = {c["id"].lstrip("-") for c in self.state.school.children}
+            if wanted in children:
+                state["child"] = wanted
+                self.reply(endpoint, 200, b"OK")
+            else:
+                self.reply(endpoint, 200, b"NotYourChild")
+
+    def switch_parent(self, endpoint, subdomain, query, body):
+        state = self.logged_in(endpoint)
+        if state:
+            state["child"] = None
+            self.redirect(endpoint, "/user/")
+
+    def eb_page(self, endpoint, subdomain, query, body):
+        state = self.logged_in(endpoint)
+        if state:
+            content = f'<script>ASC.req_props = "gpid=4242&gsh={state["gsh"]}";</script>'
+            self.reply(endpoint, 200, content.encode("utf8"))
+
+    def gcall(self, endpoint, subdomain, query, body):
+        state = self.logged_in(endpoint)
+        if not state:
+            return
+        form = {k: v[0] for k, v in parse_qs(body.decode("utf8")).items()}
+        if not self.state.args.gcall_ok or form.get("gsh") != state["gsh"]:
+            return self.reply(endpoint, 200, b"Insuficient privileges")
+        try:
+            first = datetime.date.fromisoformat(form["date"])
+            last = datetime.date.fromisoformat(form.get("dateto") or form["date"])
+        except (KeyError, ValueError):
+            return self.reply(endpoint, 200, b"Invalid arguments")
+        student_id = "-" + form.get("user", "").rpartition("-")[2]
+        dates = {}
+        day = first
+        while day <= last:
+            dates[day.isoformat()] = {"plan": self.state.school.date_plan(student_id, day)}
+            day += datetime.timedelta(days=1)
+        data = json.dumps({"dates": dates}, ensure_ascii=False)
+        content = f'<script>gi{form.get("gpid", "")}.loadData_res("{form.get("user", "")}",{data},[]);</script>'
+        self.reply(endpoint, 200, content.encode("utf8"))
+
+    def ttviewer(self, endpoint, subdomain, query, body):
+        state = self.logged_in(endpoint)
+        if state and self.checked_gsh(endpoint, state, body):
+            if query.get("__func") == ["getTTViewerData"]:
+                self.reply(endpoint, 200, self.state.school.ttviewer, "application/json; charset=utf-8")
+            else:
+                self.reply(endpoint, 200, b'{"r":{"error":"Unknown function"}}', "application/json; charset=utf-8")
+
+    def regulartt(self, endpoint, subdomain, query, body):
+        state = self.logged_in(endpoint)
+        if state and self.checked_gsh(endpoint, state, body):
+            self.reply(endpoint, 200, self.state.school.regulartt, "application/json; charset=utf-8")
+
+    def substitution(self, endpoint, subdomain, query, body):
+        state = self.logged_in(endpoint)
+        if state and self.checked_gsh(endpoint, state, body):
+            try:
+                date_str = json.loads(body)["__args"][1]["date"]
+            except (ValueError, KeyError, IndexError, TypeError):
+                return self.reply(endpoint, 200, b'{"r":{"error":"Invalid arguments"}}', "application/json; charset=utf-8")
+            self.reply(endpoint, 200, self.state.school.substitutions(date_str), "application/json; charset=utf-8")
+
+    def checked_gsh(self, endpoint, state, body):
+        try:
+            gsh = json.loads(body or b"{}").get("__gsh")
+        except ValueError:
+            gsh = None
+        if gsh != state["gsh"]:
+            self.reply(endpoint, 200, b"Error: invalid gsh", "text/plain; charset=utf-8")
+            return False
+        return True
+
+    def znamky(self, endpoint, subdomain, query, body):
+        if self.logged_in(endpoint):
+            self.reply(endpoint, 200, self.state.school.znamky)
+
+
+ROUTES = {
+    ("GET", "/login/"): MockHandler.login_page,
+    ("POST", "/login/edubarLogin.php"): MockHandler.login,
+    ("GET", "/login/switchchild"): MockHandler.switch_child,
+    ("GET", "/login/edupageChange"): MockHandler.switch_parent,
+    ("GET", "/"): MockHandler.user_page,
+    ("GET", "/user/"): MockHandler.user_page,
+    ("GET", "/user"): MockHandler.user_page,
+    ("GET", "/dashboard"): MockHandler.user_page,
+    ("GET", "/dashboard/eb.php"): MockHandler.eb_page,
+    ("POST", "/gcall"): MockHandler.gcall,
+    ("POST", "/timetable/server/ttviewer.js"): MockHandler.ttviewer,
+    ("POST", "/timetable/server/regulartt.js"): MockHandler.regulartt,
+    ("POST", "/substitution/server/viewer.js"): MockHandler.substitution,
+    ("GET", "/znamky/"): MockHandler.znamky,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for edupage.org")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--subdomain", default="mockschool", help="School subdomain logins are redirected to")
+    parser.add_argument("--password", help="Only accept this password (default: any)")
+    parser.add_argument("--children", type=int, default=2, help="Children of every parent account")
+    parser.add_argument("--students", type=int, default=600)
+    parser.add_argument("--cards", type=int, default=3000)
+    parser.add_argument("--grades", type=int, default=400)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay before every response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random +/- added to the delay")
+    parser.add_argument("--fail-rate", type=float, default=0, help="Share of requests answered with --fail-status")
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--fail-paths", type=lambda s: [p for p in s.split(",") if p], default=[],
+                        help="Comma separated path prefixes failures are limited to, e.g. /znamky/,/gcall")
+    parser.add_argument("--gcall-ok", action="store_true", help="Answer gcall loadData with date plans")
+    parser.add_argument("--captcha-rate", type=float, default=0, help="Share of logins that require a captcha")
+    parser.add_argument("--session-ttl", type=float, default=0, help="Seconds until a session expires (0: never)")
+    parser.add_argument("--verbose", action="store_true", help="Log every request to stderr")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(args)
+    school = server.state.school
+    print(f"Edupage mock for '{args.subdomain}' on http://{args.host}:{args.port} "
+          f"({len(school.children)} children, {len(school.regulartt) // 1024} KiB timetable, "
+          f"{len(school.znamky) // 1024} KiB grades page)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""Synthetic Edupage payloads at school scale, plus parsing micro-benchmarks.
+
+Writes a regularttGetData response and a /znamky/ page shaped like the real
+ones (cards/lessons/periods/subjects/classes/teachers tables,
+vsetkyPredmety/vsetkyUdalosti/vsetkyZnamky blobs) for any school size:
+
+    python edupage_synth.py generate /tmp/synth --students 2000 --cards 10000 --grades 50000
+
+and times every parsing and filtering stage of edupage_bridge_v2.py on
+them, at several fractions of that size to show how the stages scale:
+
+    python edupage_synth.py bench --students 2000 --cards 10000 --grades 50000 --scales 0.1,0.5,1
+
+The output is seeded, the same arguments always give the same payloads.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+
+SUBJECTS = [
+    ("Mathematik", "Ma"), ("Deutsch", "De"), ("Englisch", "En"), ("Französisch", "Fr"),
+    ("Latein", "La"), ("Biologie", "Bio"), ("Chemie", "Ch"), ("Physik", "Ph"),
+    ("Geschichte", "Ge"), ("Geografie", "Geo"), ("Sozialkunde", "Sk"), ("Kunst", "Ku"),
+    ("Musik", "Mu"), ("Sport", "Sp"), ("Ethik", "Eth"), ("Religion", "Rel"),
+    ("Informatik", "If"), ("Wirtschaft und Recht", "WR"), ("Astronomie", "Ast"), ("Darstellendes Spiel", "DS"),
+]
+# Subjects taught in groups (studentids) instead of to the whole class
+GROUP_SUBJECTS = {"Französisch", "Latein", "Ethik", "Religion", "Sport"}
+PERIOD_TIMES = [
+    ("07:30", "08:15"), ("08:25", "09:10"), ("09:30", "10:15"), ("10:25", "11:10"),
+    ("11:30", "12:15"), ("12:25", "13:10"), ("13:40", "14:25"), ("14:35", "15:20"),
+    ("15:30", "16:15"), ("16:25", "17:10"),
+]
+DAY_BITS = ["10000", "01000", "00100", "00010", "00001"]
+FIRST_NAMES = ["Anna", "Ben", "Clara", "David", "Emma", "Finn", "Greta", "Hannes", "Ida", "Jonas", "Lena", "Max", "Mia", "Noah", "Paul", "Sophie"]
+LAST_NAMES = ["Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner", "Becker", "Hoffmann", "Koch", "Richter", "Wolf"]
+
+
+def synth_timetable(students=2000, cards=10000, seed=1):
+    """Return (regularttGetData response, students) for a school of that size.
+
+    students is a list of {"id", "name", "classid", "className"}, the names
+    in the "First Last, 5a" form the bridge reads the class from.
+    """
+    rng = random.Random(seed)
+    class_count = max(1, students // 25)
+    grades_per_level = max(1, class_count // 8)
+    classes = []
+    for i in range(class_count):
+        level = 5 + i // grades_per_level
+        letter = "abcdefghijklmnopqrstuvwxyz"[i % grades_per_level % 26]
+        classes.append({"id": f"-{100 + i}", "name": f"{level}{letter}", "short": f"{level}{letter}"})
+
+    periods = [
+        {"id": str(i + 1), "name": str(i + 1), "short": str(i + 1), "period": str(i + 1), "starttime": start, "endtime": end}
+        for i, (start, end) in enumerate(PERIOD_TIMES)
+    ]
+    subjects = [{"id": f"-{i + 1}", "name": name, "short": short} for i, (name, short) in enumerate(SUBJECTS)]
+    teachers = [
+        {"id": f"-{500 + i}", "name": f"{rng.choice(FIRST_NAMES)[0]}. {rng.choice(LAST_NAMES)}", "short": f"T{i}"}
+        for i in range(max(2, class_count * 3 // 2))
+    ]
+    classrooms = [{"id": f"-{900 + i}", "name": f"R{100 + i}", "short": f"R{100 + i}"} for i in range(max(2, class_count + 10))]
+
+    student_rows = []
+    members = {c["id"]: [] for c in classes}
+    for i in range(students):
+        cls = classes[i % class_count]
+        sid = f"-{2000 + i}"
+        student_rows.append({"id": sid, "classid": cls["id"], "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}, {cls['name']}"})
+        members[cls["id"]].append(sid)
+
+    lessons = []
+    for cls in classes:
+        for subject in rng.sample(subjects, 12):
+            lesson = {
+                "id": f"*{len(lessons) + 1}",
+                "subjectid": subject["id"],
+                "classids": [cls["id"]],
+                "teacherids": [rng.choice(teachers)["id"]],
+                "groupnames": [""],
+                "count": rng.randint(1, 4),
+                "durationperiods": 1,
+                "studentids": [],
+            }
+            if subject["name"] in GROUP_SUBJECTS and len(members[cls["id"]]) > 1:
+                # Split the class into two groups with one lesson each
+                group = members[cls["id"]][::2]
+                other = dict(lesson, id=f"*{len(lessons) + 2}", studentids=members[cls["id"]][1::2],
+                             teacherids=[rng.choice(teachers)["id"]], groupnames=["Gruppe 2"])
+                lesson.update(studentids=group, groupnames=["Gruppe 1"])
+                lessons.extend([lesson, other])
+            else:
+                lessons.append(lesson)
+
+    card_rows = []
+    for i in range(cards):
+        lesson = lessons[i % len(lessons)]
+        card_rows.append({
+            "id": f"*{i + 1}",
+            "lessonid": lesson["id"],
+            "period": rng.choice(periods)["id"],
+            "days": rng.choice(DAY_BITS),
+            # Every eighth card only runs in A or B weeks
+            "weeks": ("10", "01")[i // 8 % 2] if i % 8 == 7 else "11",
+            "terms": "11",
+            "classroomids": [rng.choice(classrooms)["id"]],
+        })
+
+    def table(tid, rows):
+        return {"id": tid, "def": {"id": tid, "name": tid}, "cdefs": [], "data_rows": rows}
+
+    tables = [
+        table("globals", [{"id": "1", "name": "Synthetic School", "tt_num": "1"}]),
+        table("periods", periods),
+        table("daysdefs", [{"id": f"*{i + 1}", "name": name, "vals": [bits]} for i, (name, bits) in enumerate(zip("MDMDF", DAY_BITS))]),
+        table("weeksdefs", [
+            {"id": "*1", "name": "Jede Woche", "vals": ["11"]},
+            {"id": "*2", "name": "A-Woche", "vals": ["10"]},
+            {"id": "*3", "name": "B-Woche", "vals": ["01"]},
+        ]),
+        table("termsdefs", [
+            {"id": "*1", "name": "Ganzes Jahr", "vals": ["11"]},
+            {"id": "*2", "name": "1. Halbjahr", "vals": ["10"], "datefrom": "2026-08-24", "dateto": "2027-02-05"},
+            {"id": "*3", "name": "2. Halbjahr", "vals": ["01"], "datefrom": "2027-02-15", "dateto": "2027-07-09"},
+        ]),
+        table("subjects", subjects),
+        table("teachers", teachers),
+        table("classrooms", classrooms),
+        table("classes", classes),
+        table("students", student_rows),
+        table("lessons", lessons),
+        table("cards", card_rows),
+    ]
+    students_out = [
+        {"id": row["id"], "name": row["name"], "classid": row["classid"], "className": row["name"].rsplit(", ", 1)[-1]}
+        for row in student_rows
+    ]
+    return {"r": {"dbiAccessorRes": {"tables": tables}}}, students_out
+
+
+def synth_grades_page(student_ids, grades=50000, seed=1, chrome_bytes=200 * 1024):
+    """Return a /znamky/ page with `grades` grades spread over student_ids.
+
+    About a third of the grades are points for an event with maxbody, the rest
+    plain 1-6 grades. chrome_bytes of markup surround the data like on the
+    real page.
+    """
+    rng = random.Random(seed)
+    predmety = {f"-{i + 1}": {"p_meno": name, "p_skratka": short} for i, (name, short) in enumerate(SUBJECTS)}
+    events = []
+    for i in range(max(1, grades // 20)):
+        events.append({
+            "udalostid": str(10000 + i),
+            "predmetid": rng.choice(list(predmety)),
+            "nazov": rng.choice(["Klassenarbeit", "Test", "Vokabeltest", "Referat", "Mitarbeit"]),
+            "typ_znamky": rng.choice(["body", "znamka"]),
+            "maxbody": str(rng.choice([10, 20, 30, 50])),
+        })
+    start = datetime.date(2026, 9, 1)
+    znamky = []
+    for i in range(grades):
+        event = rng.choice(events)
+        if event["typ_znamky"] == "body":
+            data = str(rng.randint(0, int(event["maxbody"])))
+        else:
+            data = str(rng.randint(1, 6))
+        znamky.append({
+            "znamkaid": str(i + 1),
+            "studentid": rng.choice(student_ids),
+            "predmetid": event["predmetid"],
+            "udalostid": event["udalostid"],
+            "data": data,
+            "datum": (start + datetime.timedelta(days=rng.randint(0, 120))).isoformat() + " 00:00:00",
+            "poznamka": "",
+        })
+    blob = json.dumps({
+        "vsetkyPredmety": predmety,
+        "vsetkyUdalosti": events,
+        "vsetkyZnamky": znamky,
+        "nastavenia": {"desatinne": 2},
+    }, ensure_ascii=False)
+    row = '<div class="znamkyRow"><span class="predmet">Fach</span><span class="znamka">-</span></div>\n'
+    chrome = row * max(1, chrome_bytes // (2 * len(row)))
+    return (
+        "<!DOCTYPE html><html><head><title>Noten</title></head><body>\n"
+        + chrome
+        + f"<script>$j(function(){{ $j('#znamkyTable').znamkyStudentViewer({blob}); }});</script>\n"
+        + chrome
+        + "</body></html>"
+    )
+
+
+def generate(args):
+    os.makedirs(args.outdir, exist_ok=True)
+    response, students = synth_timetable(args.students, args.cards, args.seed)
+    page = synth_grades_page([s["id"] for s in students], args.grades, args.seed)
+    with open(os.path.join(args.outdir, "regulartt.json"), "w", encoding="utf8") as f:
+        json.dump(response, f, ensure_ascii=False)
+    with open(os.path.join(args.outdir, "znamky.html"), "w", encoding="utf8") as f:
+        f.write(page)
+    with open(os.path.join(args.outdir, "students.json"), "w", encoding="utf8") as f:
+        json.dump(students, f, ensure_ascii=False)
+    print(f"Wrote {len(students)} students, {args.cards} cards, {args.grades} grades to {args.outdir}")
+
+
+class ChunkedResponse:
+    """Just enough of requests.Response for read_grades_page."""
+
+    encoding = "utf-8"
+    url = "https://synthetic.edupage.org/znamky/"
+
+    def __init__(self, body):
+        self.body = body
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+def best_of(repeat, func):
+    """Fastest of `repeat` runs in seconds, and the last result."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_scale(bridge, students, cards, grades, sample, repeat, seed):
+    response, student_rows = synth_timetable(students, cards, seed)
+    payload = json.dumps(response)
+    sample_rows = student_rows[::max(1, len(student_rows) // sample)][:sample]
+    page = synth_grades_page([s["id"] for s in sample_rows], grades, seed)
+    page_bytes = page.encode("utf8")
+    week = [datetime.date(2026, 10, 12) + datetime.timedelta(days=i) for i in range(5)]
+    timings = {}
+
+    timings["regulartt.decode"], decoded = best_of(repeat, lambda: json.loads(payload))
+    tables = decoded["r"]["dbiAccessorRes"]["tables"]
+    timings["timetable.index"], index = best_of(repeat, lambda: bridge.TimetableIndex(tables))
+
+    def expand_children():
+        # Cold per-child expansion, as for each child's first day of a week
+        index._child_weeks.clear()
+        return [index.child_week(s["id"], s["className"].lower()) for s in sample_rows]
+    timings["timetable.child_week"], _ = best_of(repeat, expand_children)
+
+    class Child:
+        subdomain = "synthetic"
+        active_child_id = sample_rows[0]["id"]
+        active_child_name = sample_rows[0]["name"]
+
+    def week_lessons():
+        bridge._timetable_indexes.clear()
+        return [bridge.lessons_from_tables(Child, tables, "1", day) for day in week]
+    timings["timetable.week"], lessons = best_of(repeat, week_lessons)
+
+    timings["grades.scan"], page_data = best_of(repeat, lambda: bridge.scan_grades_page(page))
+    timings["grades.stream"], _ = best_of(repeat, lambda: bridge.read_grades_page(ChunkedResponse(page_bytes)))
+    timings["grades.aggregate"], _ = best_of(repeat, lambda: bridge.aggregate_grades(page_data, sample_rows[0]["id"]))
+    return {
+        "students": students,
+        "cards": cards,
+        "grades": grades,
+        "payloadBytes": len(payload),
+        "pageBytes": len(page_bytes),
+        "lessonsPerWeek": sum(len(day) for day in lessons if isinstance(day, list)),
+        "seconds": timings,
+    }
+
+
+def bench(args):
+    os.environ.setdefault("EDUPAGE_LOG_LEVEL", "ERROR")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import edupage_bridge_v2 as bridge
+
+    results = []
+    for scale in [float(s) for s in args.scales.split(",")]:
+        results.append(bench_scale(
+            bridge,
+            max(25, int(args.students * scale)),
+            max(10, int(args.cards * scale)),
+            max(10, int(args.grades * scale)),
+            args.sample, args.repeat, args.seed,
+        ))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    stages = list(results[0]["seconds"])
+    print(f"best of {args.repeat}, times in ms; child_week expands {args.sample} children")
+    header = f"{'stage':<22}" + "".join(f"{r['students']:>6}st/{r['cards']:>6}c/{r['grades']:>6}g" for r in results)
+    print(header)
+    for stage in stages:
+        print(f"{stage:<22}" + "".join(f"{r['seconds'][stage] * 1000:>24.2f}" for r in results))
+    print(f"{'payload KiB':<22}" + "".join(f"{r['payloadBytes'] / 1024:>24.0f}" for r in results))
+    print(f"{'page KiB':<22}" + "".join(f"{r['pageBytes'] / 1024:>24.0f}" for r in results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic Edupage payloads and parsing benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_size_args(p):
+        p.add_argument("--students", type=int, default=2000)
+        p.add_argument("--cards", type=int, default=10000)
+        p.add_argument("--grades", type=int, default=50000)
+        p.add_argument("--seed", type=int, default=1)
+
+    gen = sub.add_parser("generate", help="Write regulartt.json, znamky.html and students.json")
+    gen.add_argument("outdir")
+    add_size_args(gen)
+
+    ben = sub.add_parser("bench", help="Time the parsing and filtering stages")
+    add_size_args(ben)
+    ben.add_argument("--scales", default="0.1,0.25,0.5,1", help="Comma separated fractions of the given size")
+    ben.add_argument("--sample", type=int, default=50, help="Children whose week is expanded")
+    ben.add_argument("--repeat", type=int, default=3)
+    ben.add_argument("--json", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate(args)
+    else:
+        bench(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -145,14 +145,20 @@ app.post('/api/system/update', (req, res) => {
 });
 
 // Edupage Cache (declared early so clearcache can reference it)
+// The bridge caches every section with its own TTL, this only absorbs
+// widgets asking at the same moment.
 const edupageCache = new Map();
-const EDUPAGE_CACHE_TTL = 15 * 60 * 1000; // 15 minutes
+const EDUPAGE_CACHE_TTL = 60 * 1000; // 1 minute
+// Bridge results older than the last manual clear are fetched with refresh
+const edupageRefreshedAt = new Map();
+let edupageClearedAt = 0;
 
 // Maintenance: Clear Cache (Force Reload Content)
 app.post('/api/system/clearcache', (req, res) => {
     console.log("System Cache cleared manually.");
     eventCache.clear();
     edupageCache.clear();
+    edupageClearedAt = Date.now();
     res.json({ success: true });
 });
 
@@ -1235,13 +1241,139 @@ app.get('/api/camera/snapshot', (req, res) => {
     ffmpeg.stdout.pipe(res);
 });
 
+// --- Edupage Bridge Daemon ---
+// The bridge runs as a long-lived Python process (edupage_bridge_v2.py --serve)
+// so imports and logged-in Edupage sessions stay warm between requests.
+// Falls back to one python process per request if the daemon is unavailable.
+const EDUPAGE_BRIDGE_DAEMON = process.env.EDUPAGE_BRIDGE_DAEMON !== '0';
+const EDUPAGE_BRIDGE_PORT = parseInt(process.env.EDUPAGE_BRIDGE_PORT || '3011', 10);
+// The daemon refreshes the accounts it served on a school-day schedule
+const EDUPAGE_BRIDGE_SCHEDULE = process.env.EDUPAGE_BRIDGE_SCHEDULE !== '0';
+// A hung daemon must not block /api/edupage, the script takes over after this
+const EDUPAGE_BRIDGE_TIMEOUT = parseInt(process.env.EDUPAGE_BRIDGE_TIMEOUT_MS || '60000', 10);
+const edupageScriptPath = path.join(__dirname, 'edupage_bridge_v2.py');
+let edupageDaemon = null;
+let edupageDaemonReady = null;
+
+function startEdupageDaemon() {
+    if (edupageDaemonReady) return edupageDaemonReady;
+
+    edupageDaemonReady = new Promise((resolve) => {
+        const args = [edupageScriptPath, '--serve', '--port', String(EDUPAGE_BRIDGE_PORT)];
+        if (EDUPAGE_BRIDGE_SCHEDULE) args.push('--schedule');
+        const child = spawn('python', args);
+        edupageDaemon = child;
+        // Forget this child, unless a newer daemon has replaced it already
+        const forget = () => {
+            if (edupageDaemon !== child) return;
+            edupageDaemon = null;
+            edupageDaemonReady = null;
+        };
+        const timer = setTimeout(() => {
+            // Not ready in time: stop it, so the next request starts a new one
+            console.warn('Edupage bridge daemon not ready after 15s, stopping it');
+            forget();
+            child.kill();
+            resolve(false);
+        }, 15000);
+
+        child.stdout.on('data', (chunk) => {
+            if (chunk.toString().includes('READY')) {
+                clearTimeout(timer);
+                console.log(`Edupage bridge daemon listening on port ${EDUPAGE_BRIDGE_PORT}`);
+                resolve(true);
+            }
+        });
+        child.stderr.on('data', (chunk) => console.error('Edupage Daemon:', chunk.toString().trimEnd()));
+        child.on('exit', (code) => {
+            clearTimeout(timer);
+            console.warn(`Edupage bridge daemon exited (code ${code})`);
+            forget();
+            resolve(false);
+        });
+        child.on('error', (err) => {
+            console.error('Failed to start Edupage bridge daemon:', err.message);
+        });
+    });
+    return edupageDaemonReady;
+}
+
+process.on('exit', () => {
+    if (edupageDaemon) edupageDaemon.kill();
+});
+
+function runEdupageScript({ username, password, subdomain, date, sections, refresh }) {
+    return new Promise((resolve, reject) => {
+        console.log(`DEBUG: Executing Python script at: ${edupageScriptPath} with subdomain: ${subdomain} and date: ${date}`);
+
+        const args = [edupageScriptPath, username, password, subdomain];
+        if (date) {
+            args.push(date);
+        }
+        if (sections) {
+            args.push('--sections', sections);
+        }
+        if (refresh) {
+            args.push('--refresh');
+        }
+
+        // Execute python script
+        execFile('python', args, (error, stdout, stderr) => {
+            // Always log stderr for debugging
+            if (stderr) {
+                console.error('Wrapper Stderr:', stderr);
+            }
+
+            // Parse output regardless of error code, as script might print JSON error then exit 1
+            let data = null;
+            try {
+                if (stdout) {
+                    data = JSON.parse(stdout);
+                }
+            } catch (e) {
+                console.error('Failed to parse script output', e);
+            }
+
+            if (error && !data) {
+                console.error('Edupage Script Error:', error);
+                return reject(new Error("Failed to execute Edupage script"));
+            }
+            resolve(data);
+        });
+    });
+}
+
+async function runEdupageBridge(params) {
+    if (EDUPAGE_BRIDGE_DAEMON && await startEdupageDaemon()) {
+        const controller = new AbortController();
+        const timer = setTimeout(() => controller.abort(), EDUPAGE_BRIDGE_TIMEOUT);
+        try {
+            const response = await fetch(`http://127.0.0.1:${EDUPAGE_BRIDGE_PORT}/fetch`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(params),
+                signal: controller.signal
+            });
+            return await response.json();
+        } catch (err) {
+            const reason = err.name === 'AbortError' ? `no answer after ${EDUPAGE_BRIDGE_TIMEOUT} ms` : err.message;
+            console.error('Edupage daemon request failed, falling back to script:', reason);
+        } finally {
+            clearTimeout(timer);
+        }
+    }
+    return runEdupageScript(params);
+}
+
 // --- Edupage Proxy (with cache) ---
-app.get('/api/edupage', (req, res) => {
+app.get('/api/edupage', async (req, res) => {
     const username = req.headers['username'];
     const password = req.headers['password'];
     // Default to "login1" if not provided header (though bridge script also defaults)
     const subdomain = req.headers['subdomain'] || 'login1';
     const date = req.query.date; // Optional date YYYY-MM-DD
+    // Optional subset like "timetable,grades", widgets only fetch what they show
+    const sections = req.query.sections;
 
     // Validate credentials presence
     if (!username || !password) {
@@ -1249,56 +1381,49 @@ app.get('/api/edupage', (req, res) => {
     }
 
     // Check cache
-    const cacheKey = `${username}:${subdomain}:${date || 'today'}`;
+    const cacheKey = `${username}:${subdomain}:${date || 'today'}:${sections || 'all'}`;
     const cached = edupageCache.get(cacheKey);
     if (cached && (Date.now() - cached.timestamp < EDUPAGE_CACHE_TTL)) {
         console.log(`Serving Edupage data from cache (key: ${cacheKey})`);
         return res.json(cached.data);
     }
 
-    const scriptPath = path.join(__dirname, 'edupage_bridge_v2.py');
-    console.log(`DEBUG: Executing Python script at: ${scriptPath} with subdomain: ${subdomain} and date: ${date}`);
+    // Upstream trouble must not blank the school panel: answer with the last
+    // result we have, flagged as stale
+    const serveStale = (reason) => {
+        if (!cached) return false;
+        console.warn(`Serving stale Edupage data (key: ${cacheKey}): ${reason}`);
+        res.json({ ...cached.data, stale: true, age: Math.round((Date.now() - cached.timestamp) / 1000) });
+        return true;
+    };
 
-    const args = [scriptPath, username, password, subdomain];
-    if (date) {
-        args.push(date);
+    let data;
+    const requestedAt = Date.now();
+    const refresh = (edupageRefreshedAt.get(cacheKey) || 0) < edupageClearedAt;
+    try {
+        // The daemon answers from its snapshot right away and refreshes in the background
+        data = await runEdupageBridge({ username, password, subdomain, date, sections, refresh, allowStale: !refresh });
+    } catch (err) {
+        if (serveStale(err.message)) return;
+        return res.status(500).send(err.message);
     }
 
-    // Execute python script
-    execFile('python', args, (error, stdout, stderr) => {
-        // Always log stderr for debugging
-        if (stderr) {
-            console.error('Wrapper Stderr:', stderr);
-        }
-
-        // Parse output regardless of error code, as script might print JSON error then exit 1
-        let data = null;
-        try {
-            if (stdout) {
-                data = JSON.parse(stdout);
-            }
-        } catch (e) {
-            console.error('Failed to parse script output', e);
-        }
-
-        if (error && !data) {
-            console.error('Edupage Script Error:', error);
-            return res.status(500).send("Failed to execute Edupage script");
-        }
-
-        if (data && data.error) {
-            console.error("Edupage Logic Error:", data.error);
-            return res.status(401).send(data.error);
-        }
+    if (data && data.error) {
+        console.error("Edupage Logic Error:", data.error);
+        if (!/username or password/i.test(data.error) && serveStale(data.error)) return;
+        return res.status(401).send(data.error);
+    }
 
-        if (data) {
-            // Store in cache
+    if (data) {
+        // Stale snapshots are not cached here, the next poll picks up the refresh
+        if (!data.stale) {
             edupageCache.set(cacheKey, { timestamp: Date.now(), data });
-            res.json(data);
-        } else {
-            res.status(500).send("No data returned from Edupage script");
+            edupageRefreshedAt.set(cacheKey, requestedAt);
         }
-    });
+        res.json(data);
+    } else {
+        res.status(500).send("No data returned from Edupage script");
+    }
 });
 
 // --- SONOS ROUTES ---
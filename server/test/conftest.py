@@ -0,0 +1,10 @@
+# Python tests of the Edupage bridge. Run with: python -m pytest server/test
+# The bridge reads its settings at import time: keep its caches out of
+# server/data.
+import os
+import sys
+import tempfile
+
+os.environ["EDUPAGE_CACHE_DIR"] = tempfile.mkdtemp(prefix="edupage-test-")
+os.environ.pop("EDUPAGE_HOLIDAY_ICS", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,126 @@
+# School calendar: holidays from iCalendar text, free intervals, terms and
+# A/B weeks of the regular timetable. No network.
+from datetime import date
+
+import edupage_bridge_v2 as bridge
+
+ICS = """BEGIN:VCALENDAR
+VERSION:2.0
+BEGIN:VEVENT
+DTSTART;VALUE=DATE:20261012
+DTEND;VALUE=DATE:20261024
+SUMMARY:Herbstferien
+  Thüringen
+END:VEVENT
+BEGIN:VEVENT
+DTSTART:20261105T080000
+DTEND:20261106T120000
+SUMMARY:Projekttage
+END:VEVENT
+BEGIN:VEVENT
+DTSTART:20261110T000000Z
+DTEND:20261111T000000Z
+SUMMARY:Pädagogischer Tag
+END:VEVENT
+BEGIN:VEVENT
+DTSTART;VALUE=DATE:20261201
+SUMMARY:Ohne Ende
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+def make_index(days=("10000", "01000", "00100", "00010", "00001"), weeks=("11", "10", "01"), terms=()):
+    cards = [
+        {"id": f"*{i}", "lessonid": "*1", "period": "1", "days": bits, "weeks": "11", "terms": "11"}
+        for i, bits in enumerate(days)
+    ]
+    return bridge.TimetableIndex([
+        {"id": "cards", "data_rows": cards},
+        {"id": "weeksdefs", "data_rows": [{"id": f"*{i}", "vals": [v]} for i, v in enumerate(weeks)]},
+        {"id": "termsdefs", "data_rows": list(terms)},
+    ])
+
+
+def test_ics_all_day_ends_are_exclusive_and_timed_ends_inclusive():
+    holidays = bridge.parse_ics_holidays(ICS)
+    assert holidays == [
+        (date(2026, 10, 12), date(2026, 10, 23), "Herbstferien Thüringen"),
+        (date(2026, 11, 5), date(2026, 11, 6), "Projekttage"),
+        (date(2026, 11, 10), date(2026, 11, 10), "Pädagogischer Tag"),
+        (date(2026, 12, 1), date(2026, 12, 1), "Ohne Ende"),
+    ]
+
+
+def test_ics_accepts_crlf_line_endings():
+    holidays = bridge.parse_ics_holidays(ICS.replace("\n", "\r\n"))
+    assert holidays[0] == (date(2026, 10, 12), date(2026, 10, 23), "Herbstferien Thüringen")
+
+
+def test_overlapping_and_adjacent_holidays_merge():
+    calendar = bridge.SchoolCalendar(holidays=[
+        (date(2026, 12, 21), date(2026, 12, 31), "Weihnachten"),
+        (date(2027, 1, 1), date(2027, 1, 2), "Neujahr"),
+        (date(2026, 12, 23), date(2026, 12, 24), "Heiligabend"),
+        (date(2027, 2, 1), date(2027, 2, 5), "Winterferien"),
+    ])
+    assert calendar._intervals == [
+        (date(2026, 12, 21), date(2027, 1, 2), "Weihnachten"),
+        (date(2027, 2, 1), date(2027, 2, 5), "Winterferien"),
+    ]
+    assert calendar.holiday(date(2027, 1, 2)) == "Weihnachten"
+    assert calendar.holiday(date(2027, 1, 4)) is None
+    assert calendar.holiday(date(2026, 12, 20)) is None
+    assert calendar.holiday(date(2027, 2, 5)) == "Winterferien"
+
+
+def test_weekends_and_weekdays_without_cards_have_no_school():
+    calendar = bridge.SchoolCalendar(make_index(days=("10000", "01000", "00100", "00010")))
+    assert calendar.is_school_day(date(2026, 10, 22))      # Thursday
+    assert not calendar.is_school_day(date(2026, 10, 23))  # Friday, no cards
+    assert not calendar.is_school_day(date(2026, 10, 24))  # Saturday
+
+
+def test_dated_terms_free_the_days_between_and_outside_them():
+    terms = [
+        {"id": "*1", "vals": ["11"]},
+        {"id": "*2", "vals": ["10"], "datefrom": "2026-08-24", "dateto": "2027-02-05"},
+        {"id": "*3", "vals": ["01"], "datefrom": "2027-02-15", "dateto": "2027-07-09"},
+    ]
+    calendar = bridge.SchoolCalendar(make_index(terms=terms))
+    assert calendar.holiday(date(2027, 2, 10)) == "term break"
+    assert calendar.holiday(date(2026, 8, 21)) == "outside terms"
+    assert calendar.holiday(date(2027, 7, 12)) == "outside terms"
+    assert calendar.holiday(date(2026, 8, 24)) is None
+    assert calendar.term_index(date(2026, 8, 24)) == 0
+    assert calendar.term_index(date(2027, 2, 5)) == 0
+    assert calendar.term_index(date(2027, 2, 10)) is None
+    assert calendar.term_index(date(2027, 2, 15)) == 1
+    assert calendar.term_index(date(2027, 7, 10)) is None
+
+
+def test_undated_terms_restrict_nothing():
+    calendar = bridge.SchoolCalendar(make_index(terms=[{"id": "*1", "vals": ["10"]}]))
+    assert calendar.terms == []
+    assert calendar.term_index(date(2026, 10, 21)) is None
+    assert calendar.card_runs({"terms": "01"}, date(2026, 10, 21))
+
+
+def test_ab_weeks_count_from_the_timetable_start():
+    # 2026-09-01 is a Tuesday, its week (from Monday 08-31) is the A week
+    calendar = bridge.SchoolCalendar(make_index(), datefrom="2026-09-01")
+    assert calendar.week_count == 2
+    assert calendar.week_index(date(2026, 8, 31)) == 0
+    assert calendar.week_index(date(2026, 9, 6)) == 0
+    assert calendar.week_index(date(2026, 9, 7)) == 1
+    assert calendar.week_index(date(2026, 10, 21)) == 1
+    assert calendar.card_runs({"weeks": "01"}, date(2026, 10, 21))
+    assert not calendar.card_runs({"weeks": "10"}, date(2026, 10, 21))
+    assert calendar.card_runs({"weeks": "11"}, date(2026, 10, 21))
+
+
+def test_weekly_timetables_and_unknown_start_run_every_card():
+    weekly = bridge.SchoolCalendar(make_index(weeks=("1",)), datefrom="2026-09-01")
+    assert weekly.week_index(date(2026, 10, 21)) is None
+    unanchored = bridge.SchoolCalendar(make_index())
+    assert unanchored.card_runs({"weeks": "10"}, date(2026, 10, 21))
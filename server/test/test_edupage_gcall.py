@@ -0,0 +1,101 @@
+# gcall date plans: reading the loadData reply and turning its id-based plan
+# items into lessons. No network.
+import datetime
+import json
+
+from edupage_api import Edupage
+from edupage_api.timetables import Timetables
+
+import edupage_bridge_v2 as bridge
+
+DBI = {
+    "subjects": {"1": {"name": "Mathematik", "short": "Ma"}, "2": {"name": "Latein", "short": "La"}},
+    "teachers": {"10": {"firstname": "Anna", "lastname": "Richter", "classroomid": ""}},
+    "classrooms": {"100": {"name": "R100", "short": "R100"}},
+    "classes": {"50": {"name": "5a", "short": "5a", "grade": "5", "teacherid": "10", "classroomid": "100"}},
+}
+
+
+def plan_item(uniperiod, start, end, subject_id, **extra):
+    """A lesson of a gcall date plan, shaped like edupage.org's."""
+    item = {
+        "type": "lesson", "uniperiod": uniperiod, "starttime": start, "endtime": end,
+        "subjectid": subject_id, "classids": ["50"], "groupnames": [""],
+        "teacherids": ["10"], "classroomids": ["100"], "durationperiods": 1,
+    }
+    item.update(extra)
+    return item
+
+
+class Reply:
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+
+class Session:
+    def __init__(self, text):
+        self.text = text
+
+    def post(self, url, data=None, headers=None):
+        return Reply(self.text)
+
+
+def make_edupage(reply="", child=None):
+    edupage = Edupage()
+    edupage.subdomain = "school"
+    edupage.is_logged_in = True
+    edupage.username = "parent"
+    edupage.data = {"userid": "Rodic123", "dbi": DBI}
+    edupage.session = Session(reply)
+    edupage.active_child_id = child
+    return edupage
+
+
+def load_data_reply(user_id, dates):
+    data = json.dumps({"dates": dates})
+    return f'<script>gi4243.loadData_res("{user_id}",{data},[{{"changes": []}}]);</script>'
+
+
+def test_gcall_load_data_reads_the_dict_after_the_user_id():
+    dates = {"2026-10-14": {"plan": [plan_item("1", "07:30", "08:15", "1")]}}
+    edupage = make_edupage(load_data_reply("Ziak-2000", dates), child="-2000")
+    day = datetime.date(2026, 10, 14)
+    assert bridge.gcall_load_data(edupage, "4242", "gsh", day, day) == {"dates": dates}
+
+
+def test_gcall_load_data_accepts_the_account_user_id():
+    dates = {"2026-10-14": {"plan": []}}
+    edupage = make_edupage(load_data_reply("Rodic123", dates), child="-2000")
+    day = datetime.date(2026, 10, 14)
+    assert bridge.gcall_load_data(edupage, "4242", "gsh", day, day) == {"dates": dates}
+
+
+def test_gcall_load_data_rejected():
+    day = datetime.date(2026, 10, 14)
+    assert bridge.gcall_load_data(make_edupage("Insuficient privileges"), "4242", "gsh", day, day) is None
+    # Other replies that mention the user without a data dict
+    assert bridge.gcall_load_data(make_edupage('loadData_res("Rodic123",[1]);'), "4242", "gsh", day, day) is None
+
+
+def test_gcall_plan_items_are_resolved_to_names():
+    day = datetime.date(2026, 10, 14)
+    plan = [
+        {"type": "lesson", "header": [], "uniperiod": "0", "starttime": "", "endtime": ""},
+        plan_item("1", "07:30", "08:15", "1"),
+        plan_item("2", "08:25", "09:10", "2", removed=True),
+    ]
+    timetable = bridge.plan_to_timetable(Timetables(make_edupage()), plan)
+    lessons = bridge.timetable_to_lessons(timetable, day)
+    assert [(l["id"], l["subject"]["name"], l["startTime"], l["endTime"]) for l in lessons] == [
+        ("2026-10-14-1-1", "Mathematik", "07:30", "08:15"),
+        ("2026-10-14-2-2", "Latein", "08:25", "09:10"),
+    ]
+    assert all(l["teacher"] == {"name": "Anna Richter"} and l["classroom"] == {"name": "R100"} for l in lessons)
+    assert [l.is_cancelled for l in timetable.lessons] == [False, True]
+
+
+def test_ttviewer_rows_are_passed_through():
+    rows = [{"id": "*1", "period": "1", "starttime": "07:30", "endtime": "08:15", "subject": "Mathematik"}]
+    assert bridge.plan_to_timetable(Timetables(make_edupage()), rows) is rows
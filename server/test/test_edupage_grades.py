@@ -0,0 +1,80 @@
+# /znamky/ page scanning: the page fed in pieces must parse exactly like the
+# whole page, wherever the pieces are cut. No network.
+import json
+
+import edupage_bridge_v2 as bridge
+from edupage_synth import synth_grades_page
+
+GRADES = [
+    {"znamkaid": "1", "predmetid": "-1", "udalostid": "10", "data": "2"},
+    {"znamkaid": "2", "predmetid": "-2", "udalostid": "11", "data": "14"},
+]
+SUBJECTS = {"-1": {"p_meno": "Mathematik"}, "-2": {"p_meno": "Deutsch"}}
+EVENTS = [
+    {"udalostid": "10", "maxbody": None, "typ_znamky": "znamka", "nazov": "Test"},
+    {"udalostid": "11", "maxbody": "20", "typ_znamky": "body", "nazov": "Diktat"},
+]
+
+
+def page(**data):
+    blobs = ", ".join(f'"{key}": {json.dumps(value)}' for key, value in data.items())
+    return f'<html><script>var x = 1;\n$j("#znamky").znamky({{{blobs}}});</script></html>'
+
+
+def split_everywhere(text):
+    """The GradesPage of text fed in two pieces, for every cut position."""
+    for cut in range(len(text) + 1):
+        scanner = bridge.GradesPageScanner()
+        scanner.feed(text[:cut])
+        scanner.feed(text[cut:], final=True)
+        yield cut, scanner.page()
+
+
+def test_split_at_every_position_parses_like_the_whole_page():
+    text = page(vsetkyZnamky=GRADES, vsetkyPredmety=SUBJECTS, vsetkyUdalosti=EVENTS)
+    whole = bridge.scan_grades_page(text)
+    assert whole.grades == GRADES
+    assert whole.subjects == {"-1": "Mathematik", "-2": "Deutsch"}
+    assert whole.events["11"] == {"maxbody": "20", "typ": "body", "nazov": "Diktat"}
+    for cut, result in split_everywhere(text):
+        assert result == whole, cut
+
+
+def test_fallback_subjects_split_at_every_position():
+    # No subject key: names come from the p_meno/nazov regex
+    text = page(vsetkyZnamky=GRADES, other={"-1": {"nazov": "Mathematik"}, "-2": {"p_meno": "Deutsch"}})
+    whole = bridge.scan_grades_page(text)
+    assert whole.subjects == {"-1": "Mathematik", "-2": "Deutsch"}
+    for cut, result in split_everywhere(text):
+        assert result == whole, cut
+
+
+def test_small_chunks():
+    text = page(vsetkyZnamky=GRADES, vsetkyPredmety=SUBJECTS, vsetkyUdalosti=EVENTS)
+    whole = bridge.scan_grades_page(text)
+    for size in (1, 2, 7, 64):
+        scanner = bridge.GradesPageScanner()
+        for start in range(0, len(text), size):
+            scanner.feed(text[start:start + size], final=start + size >= len(text))
+        assert scanner.page() == whole, size
+
+
+def test_synthetic_page_in_chunks():
+    text = synth_grades_page(["-2000", "-2001"], grades=500, chrome_bytes=20 * 1024)
+    whole = bridge.scan_grades_page(text)
+    assert len(whole.grades) == 500
+    for size in (997, bridge.GRADES_CHUNK_SIZE):
+        scanner = bridge.GradesPageScanner()
+        for start in range(0, len(text), size):
+            scanner.feed(text[start:start + size], final=start + size >= len(text))
+        assert scanner.page() == whole, size
+
+
+def test_scanning_stops_once_complete():
+    text = page(vsetkyZnamky=GRADES, vsetkyPredmety=SUBJECTS, vsetkyUdalosti=EVENTS)
+    scanner = bridge.GradesPageScanner()
+    scanner.feed(text)
+    assert scanner.complete
+    # Whatever follows is ignored
+    scanner.feed('"vsetkyZnamky": [not json', final=True)
+    assert scanner.page().grades == GRADES
@@ -0,0 +1,115 @@
+# Substitution overlay: parsing the substitution viewer page and laying its
+# changes over a day's regular lessons. No network.
+import edupage_bridge_v2 as bridge
+
+
+def section(classes, *rows):
+    cells = "".join(
+        f'<div class="row {action}"><div class="period"><span class="print-font-resizable">{period}</span></div>'
+        f'<div class="info"><span class="print-font-resizable">{text}</span></div></div>'
+        for action, period, text in rows
+    )
+    return (
+        '<div class="section print-nobreak"><div class="header"><span class="print-font-resizable">'
+        f'{classes}</span></div><div class="rows">{cells}</div></div>'
+    )
+
+
+def make_index():
+    def table(tid, rows):
+        return {"id": tid, "data_rows": rows}
+    return bridge.TimetableIndex([
+        table("periods", [
+            {"id": str(n), "name": str(n), "period": str(n), "starttime": start, "endtime": end}
+            for n, start, end in [(1, "07:30", "08:15"), (2, "08:25", "09:10"), (3, "09:30", "10:15")]
+        ]),
+        table("subjects", [
+            {"id": "-1", "name": "Mathematik", "short": "Ma"},
+            {"id": "-2", "name": "Französisch", "short": "Fr"},
+            {"id": "-3", "name": "Latein", "short": "La"},
+            {"id": "-4", "name": "Biologie", "short": "Bio"},
+        ]),
+        table("teachers", [{"id": "-10", "name": "A. Richter"}, {"id": "-11", "name": "B. Weber"}]),
+    ])
+
+
+def row(card_id, period, subject, short, teacher):
+    index = make_index()
+    p = index.periods[str(period)]
+    return {
+        "id": card_id, "period": str(period), "starttime": p["starttime"], "endtime": p["endtime"],
+        "subject": subject, "subject_short": short, "class": "5a", "teacher": teacher, "classroom": "",
+    }
+
+
+def change(action, periods, text, classes=("5a",)):
+    return {"classes": set(classes), "periods": set(periods), "action": action, "text": text}
+
+
+def test_parse_substitutions_reads_classes_periods_and_actions():
+    page = (
+        '<div class="substviewer">'
+        + section("5a, 6B", ("remove", "3", "(Mathematik) - Entfällt"), ("change", "1 - 2", "Latein &amp; Ethik"))
+        + section("7c", ("add", "4", "<b>Förderunterricht</b>"))
+        + "</div>"
+    )
+    changes = bridge.parse_substitutions(page)
+    assert changes == [
+        {"classes": {"5a", "6b"}, "periods": {3}, "action": "remove", "text": "(Mathematik) - Entfällt"},
+        {"classes": {"5a", "6b"}, "periods": {1, 2}, "action": "change", "text": "Latein & Ethik"},
+        {"classes": {"7c"}, "periods": {4}, "action": "add", "text": "Förderunterricht"},
+    ]
+
+
+def test_parse_substitutions_skips_rows_without_period():
+    page = section("5a", ("change", "-", "Hinweis"))
+    assert bridge.parse_substitutions(page) == []
+    assert bridge.parse_substitutions("<div>keine Vertretungen</div>") == []
+
+
+def test_remove_only_cancels_the_named_group_lesson():
+    rows = [row("*1", 3, "Französisch", "Fr", "A. Richter"), row("*2", 3, "Latein", "La", "B. Weber")]
+    result = bridge.apply_substitutions(rows, [change("remove", {3}, "(Latein) - Entfällt")], "5a", make_index())
+    by_id = {r["id"]: r for r in result}
+    assert by_id["*2"]["cancelled"] and by_id["*2"]["note"] == "(Latein) - Entfällt"
+    assert not by_id["*1"]["changed"] and not by_id["*1"]["cancelled"]
+
+
+def test_change_matches_teacher_surname():
+    rows = [row("*1", 2, "Französisch", "Fr", "A. Richter"), row("*2", 2, "Latein", "La", "B. Weber")]
+    result = bridge.apply_substitutions(rows, [change("change", {2}, "(Weber) ➔ Vertretung")], "5a", make_index())
+    by_id = {r["id"]: r for r in result}
+    assert by_id["*2"]["changed"] and not by_id["*2"]["cancelled"]
+    assert not by_id["*1"]["changed"]
+
+
+def test_unnamed_change_falls_back_to_a_single_lesson_only():
+    single = [row("*1", 1, "Mathematik", "Ma", "A. Richter")]
+    result = bridge.apply_substitutions(single, [change("remove", {1}, "Entfällt")], "5a", make_index())
+    assert result[0]["cancelled"]
+
+    groups = [row("*1", 1, "Französisch", "Fr", "A. Richter"), row("*2", 1, "Latein", "La", "B. Weber")]
+    result = bridge.apply_substitutions(groups, [change("remove", {1}, "Entfällt")], "5a", make_index())
+    assert [r["id"] for r in result] == ["*1", "*2"]
+    assert not any(r["changed"] for r in result)
+
+
+def test_change_naming_another_subject_leaves_the_lesson_alone():
+    rows = [row("*1", 3, "Mathematik", "Ma", "A. Richter")]
+    result = bridge.apply_substitutions(rows, [change("remove", {3}, "(Biologie) - Entfällt")], "5a", make_index())
+    assert result == [dict(rows[0], changed=False, cancelled=False)]
+
+
+def test_add_and_changes_in_empty_periods_become_extra_rows():
+    rows = [row("*1", 1, "Mathematik", "Ma", "A. Richter")]
+    changes = [change("add", {2}, "Förderunterricht"), change("remove", {3}, "(Biologie) - Entfällt")]
+    result = bridge.apply_substitutions(rows, changes, "5a", make_index())
+    assert [(r["id"], r["starttime"], r["cancelled"]) for r in result] == [
+        ("*1", "07:30", False), ("subst-2", "08:25", False), ("subst-3", "09:30", True),
+    ]
+
+
+def test_other_classes_are_ignored():
+    rows = [row("*1", 1, "Mathematik", "Ma", "A. Richter")]
+    result = bridge.apply_substitutions(rows, [change("remove", {1}, "(Mathematik)", classes=("6b",))], "5a", make_index())
+    assert not result[0]["changed"]
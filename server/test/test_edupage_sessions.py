@@ -0,0 +1,23 @@
+# Password binding of stored sessions and snapshots. No network.
+import hashlib
+import os
+import stat
+
+import edupage_bridge_v2 as bridge
+
+
+def test_password_hash_is_keyed_by_the_install_secret():
+    password_hash = bridge._password_hash("secret")
+    assert password_hash == bridge._password_hash("secret")
+    assert password_hash != bridge._password_hash("Secret")
+    assert password_hash != hashlib.sha256(b"secret").hexdigest()
+    mode = os.stat(os.path.join(bridge.CACHE_DIR, "secret")).st_mode
+    assert stat.S_IMODE(mode) == 0o600
+
+
+def test_same_password():
+    password_hash = bridge._password_hash("secret")
+    assert bridge._same_password(password_hash, bridge._password_hash("secret"))
+    assert not bridge._same_password(password_hash, bridge._password_hash("other"))
+    # Entries without a password, e.g. a warm session not logged in yet
+    assert not bridge._same_password(None, password_hash)
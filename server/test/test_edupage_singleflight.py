@@ -0,0 +1,94 @@
+# SingleFlight: identical calls running at the same time go upstream once.
+import datetime
+import threading
+
+import pytest
+
+import edupage_bridge_v2 as bridge
+
+CALLERS = 8
+
+
+def run_concurrently(flights, key, func):
+    """Start CALLERS threads on flights.do(key, func) and return once all called it."""
+    outcomes = []
+    lock = threading.Lock()
+    arrived = threading.Semaphore(0)
+
+    def caller():
+        arrived.release()
+        try:
+            outcome = flights.do(key, func)
+        except Exception as e:
+            outcome = e
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=caller) for _ in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for _ in threads:
+        arrived.acquire(timeout=5)
+    # Give the last ones a moment to get from do() to waiting on the call
+    threading.Event().wait(0.1)
+    return threads, outcomes
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    flights = bridge.SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"students": []}
+
+    threads, outcomes = run_concurrently(flights, "week", fetch)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert [result for result, _ in outcomes] == [{"students": []}] * CALLERS
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * (CALLERS - 1)
+    assert not flights.running("week")
+
+
+def test_error_is_shared_and_the_next_call_runs_again():
+    flights = bridge.SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        raise bridge.BridgeError("upstream down")
+
+    threads, outcomes = run_concurrently(flights, "week", fetch)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert all(isinstance(outcome, bridge.BridgeError) for outcome in outcomes)
+    # Failed calls are not remembered
+    assert flights.do("week", lambda: "ok") == ("ok", False)
+
+
+def test_different_keys_do_not_share():
+    flights = bridge.SingleFlight()
+    assert flights.do("a", lambda: 1) == (1, False)
+    assert flights.do("b", lambda: 2) == (2, False)
+
+
+@pytest.mark.parametrize("other", [
+    dict(password="other"),
+    dict(refresh=True),
+    dict(sections=("grades",)),
+])
+def test_flight_key(other):
+    day = datetime.date(2026, 10, 14)
+    args = dict(username="parent", password="secret", subdomain="school", target_date=day, sections=bridge.SECTIONS)
+    key = bridge.flight_key(**args)
+    # Any day of the week is the same flight
+    assert bridge.flight_key(**dict(args, target_date=day + datetime.timedelta(days=2))) == key
+    assert bridge.flight_key(**dict(args, **other)) != key
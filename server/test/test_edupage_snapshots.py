@@ -0,0 +1,77 @@
+# Failed sections: fetch_child_data marks them in failedSections, snapshots
+# keep the previous data for exactly those. No network.
+import datetime
+from types import SimpleNamespace
+
+import edupage_bridge_v2 as bridge
+
+DAYS = [datetime.date(2026, 10, 12) + datetime.timedelta(days=i) for i in range(5)]
+CHILD = {"id": "-2000", "name": "Max Schmidt, 5a"}
+
+
+def student(sid="-2000", failed=None, **sections):
+    entry = {"studentId": sid, "name": "Max Schmidt, 5a", **sections}
+    if failed:
+        entry["failedSections"] = failed
+    return entry
+
+
+def test_failed_sections_are_filled_from_the_previous_snapshot():
+    previous = {"students": [student(grades=[{"id": 1}], homework=[{"id": 2}], messages=[{"id": 3}])]}
+    result = {"students": [student(failed=["grades", "messages"], grades=[], homework=[], messages=[])]}
+    kept = bridge.keep_snapshot_sections(result, previous, bridge.SECTIONS)
+    [entry] = kept["students"]
+    assert entry["grades"] == [{"id": 1}] and entry["messages"] == [{"id": 3}]
+    # Fetched and empty: the homework is really done
+    assert entry["homework"] == []
+    assert "failedSections" not in entry
+    # The fresh result is not changed
+    assert result["students"][0]["grades"] == []
+
+
+def test_sections_without_previous_data_stay_failed():
+    previous = {"students": [student(grades=[], homework=[{"id": 2}]), student("-2001", grades=[{"id": 1}])]}
+    result = {"students": [
+        student(failed=["grades", "homework"], grades=[], homework=[]),
+        student("-2002", failed=["grades"], grades=[]),
+    ]}
+    first, second = bridge.keep_snapshot_sections(result, previous, bridge.SECTIONS)["students"]
+    assert first["homework"] == [{"id": 2}] and first["failedSections"] == ["grades"]
+    # A child the previous snapshot did not have
+    assert second["grades"] == [] and second["failedSections"] == ["grades"]
+
+
+def test_only_requested_sections_are_kept():
+    previous = {"students": [student(grades=[{"id": 1}])]}
+    result = {"students": [student(failed=["grades"], grades=[])]}
+    [entry] = bridge.keep_snapshot_sections(result, previous, ("timetable",))["students"]
+    assert entry["grades"] == [] and entry["failedSections"] == ["grades"]
+
+
+def test_snapshot_keeps_grades_while_their_fetch_fails(monkeypatch):
+    results = [
+        {"students": [student(grades=[{"id": 1}], homework=[{"id": 2}])]},
+        {"students": [student(failed=["grades"], grades=[], homework=[])]},
+    ]
+    monkeypatch.setattr(bridge, "fetch_for_account", lambda *args: results.pop(0))
+    day = datetime.date(2026, 10, 14)
+    sections = ("homework", "grades")
+    bridge.fetch_and_snapshot("parent", "secret", "school", day, sections=sections)
+    second = bridge.fetch_and_snapshot("parent", "secret", "school", day, sections=sections)
+    assert second["students"][0]["grades"] == [{"id": 1}]
+    assert second["students"][0]["homework"] == []
+    assert bridge.serve_snapshot("parent", "secret", "school", day, sections)["students"] == second["students"]
+
+
+def test_fetch_child_data_marks_failed_sections(monkeypatch):
+    monkeypatch.setattr(bridge, "fetch_timetable", lambda edupage, child, days: [])
+    monkeypatch.setattr(bridge, "fetch_homework", lambda edupage: [])
+    monkeypatch.setattr(bridge, "fetch_grades", lambda edupage: None)
+    monkeypatch.setattr(bridge, "fetch_messages", lambda edupage: [{"id": 3}])
+    edupage = SimpleNamespace(subdomain="school", username="failing-parent")
+    result = bridge.fetch_child_data(edupage, CHILD, DAYS, refresh=True)
+    assert result["failedSections"] == ["grades"]
+    assert result["grades"] == [] and result["homework"] == [] and result["messages"] == [{"id": 3}]
+    # Empty sections are cached, failed ones are fetched again next time
+    assert bridge.cached_section(edupage, CHILD, "homework", DAYS) == []
+    assert bridge.cached_section(edupage, CHILD, "grades", DAYS) is None
@@ -12,6 +12,9 @@ export interface Lesson {
     classroom: { name: string };
     teacher: { name: string };
     class: { name: string };
+    changed?: boolean;
+    cancelled?: boolean;
+    note?: string;
 }
 
 export interface Homework {
@@ -58,6 +61,8 @@ export interface StudentData {
     homework: Homework[];
     grades: SubjectGrades[];
     messages: Message[];
+    // Sections that could not be fetched and are shown empty
+    failedSections?: string[];
 }
 
 export const useEdupage = (date?: Date) => {
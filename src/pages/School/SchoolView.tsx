@@ -27,6 +27,9 @@ interface TimetableLesson {
     endTime: string;
     subject: { name: string; short: string };
     teacher?: { name?: string };
+    changed?: boolean;
+    cancelled?: boolean;
+    note?: string;
 }
 
 const TimetableGrid: React.FC<{ timetable: TimetableLesson[] }> = ({ timetable }) => {
@@ -90,7 +93,10 @@ const TimetableGrid: React.FC<{ timetable: TimetableLesson[] }> = ({ timetable }
                                         const subjectColor = getSubjectColor(lesson.subject.name, lesson.subject.short);
                                         return (
                                             <td key={dateKey} className="p-0.5 align-top">
-                                                <div className={`p-1.5 rounded border h-full min-h-[50px] ${subjectColor}`}>
+                                                <div
+                                                    className={`p-1.5 rounded border h-full min-h-[50px] ${subjectColor} ${lesson.changed ? 'ring-2 ring-amber-400' : ''} ${lesson.cancelled ? 'opacity-40 line-through' : ''}`}
+                                                    title={lesson.note}
+                                                >
                                                     <div className="font-bold text-sm text-center">{lesson.subject.short || lesson.subject.name.substring(0, 3)}</div>
                                                     <div className="text-[9px] opacity-80 text-center mt-0.5 truncate">{lesson.teacher?.name?.split(' ').pop()}</div>
                                                 </div>